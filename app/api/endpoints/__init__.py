@@ -1,3 +1,4 @@
 from app.api.endpoints.ai_agent import router as ai_agent_router # noqa
+from app.api.endpoints.metrics import router as metrics_router # noqa
 from app.api.endpoints.two_factor_auth import router as two_factor_auth # noqa
 from app.api.endpoints.user import router as user_router # noqa
@@ -1,14 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
 
-from app.core.config import settings
+from app.api.validators import current_admin_or_superuser
 from app.core.constants import Constants, Messages, Descriptions
 from app.core.user import current_user
 from app.logging import logging_config
 from app.models.user import User
 from app.schemas.ai_response import AskWithAIResponse
-from app.services.agent.ai_agent import build_agent
-from app.services.agent.mcp_client import McpClient
+from app.services.agent.ai_agent import RagAgent, get_rag_agent
+from app.services.agent.answer_cache import answer_cache, answer_key
+from app.services.agent.mcp_pool import mcp_pool
 
 
 router = APIRouter()
@@ -23,6 +26,7 @@ router = APIRouter()
 async def ask_with_ai(
     request: AskWithAIResponse,
     current_user: User = Depends(current_user),
+    agent: RagAgent = Depends(get_rag_agent),
 ):
     '''
     Эндпоинт для взаимодействия с AI ассистентом.
@@ -31,6 +35,7 @@ async def ask_with_ai(
     Args:
         request: Объект с полем query, содержащим вопрос пользователя
         current_user: Авторизованный пользователь (через JWT токен)
+        agent: Общий для процесса агент, создается при старте приложения
 
     Returns:
         StreamingResponse: Потоковый ответ от AI ассистента
@@ -61,29 +66,24 @@ async def ask_with_ai(
     )
 
     async def stream_response():
-        """Stream response with MCP client context managed properly."""
-        async with McpClient(
-            settings.mcp_server_url,
-            transport=settings.mcp_transport
-        ) as mcp:
-            agent, astream_answer = build_agent(
-                mcp=mcp,
-                rag_tool_name=settings.mcp_rag_tool_name,
-                model_name=settings.gigachat_model,
-                temperature=settings.gigachat_temperature,
-                scope=settings.gigachat_scope,
-                credentials=settings.gigachat_credentials,
-                verify_ssl=settings.gigachat_verify_ssl,
+        """
+        Stream response; tool calls borrow sessions from the MCP pool.
+
+        Answers to repeated questions are replayed from the answer cache.
+        """
+        try:
+            async for chunk in answer_cache.astream(
+                answer_key(request.query, agent.system_prompt),
+                lambda outcome: agent.astream_answer(
+                    request.query, mcp_pool, outcome
+                ),
+            ):
+                yield chunk
+        except Exception as stream_error:
+            logger.error(
+                f'Ошибка при стриминге ответа: {stream_error}'
             )
-
-            try:
-                async for chunk in astream_answer(request.query):
-                    yield chunk
-            except Exception as stream_error:
-                logger.error(
-                    f'Ошибка при стриминге ответа: {stream_error}'
-                )
-                yield f'{Messages.AI_STREAM_ERROR_MSG}: {stream_error}'
+            yield f'{Messages.AI_STREAM_ERROR_MSG}: {stream_error}'
 
     try:
         return StreamingResponse(
@@ -114,3 +114,46 @@ async def ask_with_ai(
                 'Cache-Control': 'no-cache',
             },
         )
+
+
+@router.get(
+    Constants.AI_ANSWER_CACHE_PREFIX,
+    summary=Descriptions.AI_ANSWER_CACHE_STATS_SUMMARY,
+    description=Descriptions.AI_ANSWER_CACHE_STATS_DESCRIPTION,
+    tags=Constants.AI_AGENT_TAGS
+)
+async def get_answer_cache_stats(
+    current_user: User = Depends(current_admin_or_superuser)
+):
+    '''
+    Состояние кэша ответов AI ассистента.
+    Доступно только администраторам и суперпользователям.
+    '''
+    return answer_cache.stats
+
+
+@router.delete(
+    Constants.AI_ANSWER_CACHE_PREFIX,
+    summary=Descriptions.AI_ANSWER_CACHE_CLEAR_SUMMARY,
+    description=Descriptions.AI_ANSWER_CACHE_CLEAR_DESCRIPTION,
+    tags=Constants.AI_AGENT_TAGS
+)
+async def clear_answer_cache(
+    query: Optional[str] = Query(
+        None,
+        description=Descriptions.AI_ANSWER_CACHE_QUERY_DESCRIPTION
+    ),
+    current_user: User = Depends(current_admin_or_superuser)
+):
+    '''
+    Удалить ответы на вопрос или весь кэш ответов AI ассистента.
+    Доступно только администраторам и суперпользователям.
+    '''
+    logger = logging_config.get_endpoint_logger('ai_agent')
+    removed = answer_cache.invalidate(query)
+    logger.info(
+        f'Кэш ответов очищен пользователем {current_user.id} '
+        f'({current_user.email}): удалено {removed}, '
+        f'вопрос: {query!r}'
+    )
+    return {'removed': removed}
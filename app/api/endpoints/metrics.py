@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.api.validators import current_admin_or_superuser
+from app.core.constants import Constants, Descriptions
+from app.models.user import User
+from app.services.mcp_rag.metrics import registry
+
+
+router = APIRouter()
+
+
+@router.get(
+    Constants.METRICS_PREFIX,
+    response_class=PlainTextResponse,
+    summary=Descriptions.METRICS_SUMMARY,
+    description=Descriptions.METRICS_DESCRIPTION,
+    tags=Constants.METRICS_TAGS
+)
+async def get_metrics(
+    current_user: User = Depends(current_admin_or_superuser)
+):
+    '''
+    Метрики FastAPI процесса в текстовом формате Prometheus:
+    пул MCP сессий, упреждающий поиск и кэш ответов агента.
+    Доступно только администраторам и суперпользователям.
+    '''
+    return PlainTextResponse(
+        registry.render(),
+        media_type=Constants.METRICS_MEDIA_TYPE,
+    )
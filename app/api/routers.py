@@ -2,6 +2,7 @@ from fastapi import APIRouter
 
 from app.api.endpoints import (
     ai_agent_router,
+    metrics_router,
     two_factor_auth,
     user_router
 )
@@ -10,5 +11,6 @@ from app.api.endpoints import (
 main_router = APIRouter()
 
 main_router.include_router(ai_agent_router)
+main_router.include_router(metrics_router)
 main_router.include_router(two_factor_auth)
 main_router.include_router(user_router)
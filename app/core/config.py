@@ -47,10 +47,176 @@ class Settings(BaseSettings):
     knowledge_base_version_id: str
     retrieve_limit: int = 6
     evolution_project_id: str
+    # Версии баз знаний, которые request_to_rag опрашивает параллельно;
+    # выдачи объединяются reciprocal rank fusion. Пустой список - только
+    # knowledge_base_version_id. В .env задается JSON списком
+    knowledge_base_version_ids: list[str] = []
+    # Таймаут ответа одной базы знаний при параллельном опросе
+    # (0 - без отдельного таймаута) и параметр k для RRF
+    rag_kb_timeout: float = 5.0
+    rag_rrf_k: int = 60
+
+    # Пул HTTP-соединений MCP RAG сервера к Evolution Managed RAG
+    rag_http_max_connections: int = 100
+    rag_http_max_keepalive_connections: int = 20
+    rag_http_keepalive_expiry: float = 30.0
+    # HTTP/2 включается только при установленном пакете h2
+    rag_http2: bool = False
+    rag_connect_timeout: float = 5.0
+    rag_auth_timeout: float = 10.0
+    rag_retrieve_timeout: float = 20.0
+    # Токен Managed RAG обновляется в фоне за rag_token_refresh_margin
+    # секунд до истечения; rag_token_default_ttl используется, если
+    # ответ аутентификации не содержит expires_in
+    rag_token_refresh_margin: float = 60.0
+    rag_token_default_ttl: float = 300.0
+    rag_token_retry_delay: float = 5.0
+    # Кэш результатов request_to_rag в памяти процесса
+    rag_cache_enabled: bool = True
+    rag_cache_max_size: int = 1024
+    rag_cache_ttl: float = 300.0
+    # Сколько секунд после истечения ttl запись отдается устаревшей,
+    # пока результат обновляется в фоне
+    rag_cache_stale_ttl: float = 600.0
+    # TTL для пустых ответов (документы не найдены) и ответов, в которые
+    # не вошла часть баз знаний (knowledge_base_version_ids)
+    rag_negative_cache_ttl: float = 30.0
+    # Ключ кэша строится из канонизированного запроса (Unicode NFKC,
+    # casefold, "ё" -> "е", без пунктуации и лишних пробелов).
+    # Удаление служебных слов и лемматизация включаются отдельно
+    rag_query_remove_stopwords: bool = False
+    rag_query_lemmatize: bool = False
+    # Кэш похожих запросов: MinHash по символьным n-граммам и LSH.
+    # Результат похожего запроса переиспользуется, если сходство
+    # Жаккара n-грамм не ниже rag_similarity_threshold и запросы
+    # различаются только частыми словами: слова с латиницей и цифрами
+    # и слова, которые есть меньше чем в rag_similarity_rare_share
+    # документов локального индекса (марки, модели), должны совпадать
+    rag_similarity_cache_enabled: bool = False
+    rag_similarity_threshold: float = 0.6
+    rag_similarity_max_entries: int = 4096
+    rag_similarity_rare_share: float = 0.01
+    # Постоянный кэш результатов на диске (SQLite), переживающий
+    # перезапуск сервера. Отключен, если путь не задан
+    rag_persistent_cache_path: Optional[str] = None
+    rag_persistent_cache_max_bytes: int = 256 * 1024 * 1024
+    rag_persistent_cache_ttl: float = 24 * 3600.0
+    rag_persistent_cache_warm_entries: int = 256
+    # Общее для worker процессов хранилище токена (SQLite).
+    # В режиме нескольких процессов кэш результатов разделяется
+    # через rag_persistent_cache_path
+    rag_shared_state_path: Optional[str] = None
+    # Локальный BM25 индекс по документам, уже полученным из Managed
+    # RAG. Отвечает, когда upstream недоступен или отвечает дольше
+    # rag_lexical_fallback_timeout секунд (0 - не ждать локальный ответ)
+    rag_lexical_index_enabled: bool = True
+    rag_lexical_index_max_bytes: int = 64 * 1024 * 1024
+    rag_lexical_index_path: Optional[str] = None
+    rag_lexical_fallback_min_score: float = 0.3
+    rag_lexical_fallback_timeout: float = 0.0
+    # Ответ из локального индекса без обращения к upstream, если его
+    # нормированная BM25 оценка (0..1) не ниже порога
+    rag_lexical_local_enabled: bool = False
+    rag_lexical_local_min_score: float = 0.85
+    # Circuit breaker для запросов retrieve: после
+    # rag_circuit_failure_threshold отказов подряд запросы сразу
+    # отклоняются в течение rag_circuit_recovery_timeout секунд
+    rag_circuit_failure_threshold: int = 5
+    rag_circuit_recovery_timeout: float = 30.0
+    # Хеджирование: повторный запрос, если первый не ответил за время,
+    # равное rag_hedge_percentile последних задержек
+    rag_hedging_enabled: bool = False
+    rag_hedge_percentile: float = 0.95
+    rag_hedge_min_samples: int = 20
+    rag_hedge_min_delay: float = 0.2
+    # Ограничение нагрузки на Managed RAG: одновременные запросы,
+    # частота (запросов в секунду, 0 - без ограничения) и очередь
+    # ожидания, при переполнении которой запрос сразу отклоняется
+    rag_upstream_max_concurrency: int = 16
+    rag_upstream_rate_limit: float = 0.0
+    rag_upstream_rate_burst: int = 10
+    rag_upstream_max_queue: int = 100
+    rag_upstream_queue_timeout: float = 10.0
+    # Пакетный инструмент request_to_rag_batch
+    rag_batch_max_queries: int = 10
+    rag_batch_concurrency: int = 4
+    # Упаковка найденных документов в контекст для LLM.
+    # Бюджет в токенах (0 - без ограничения), токены оцениваются
+    # локально по числу символов
+    rag_context_max_tokens: int = 3000
+    rag_context_chars_per_token: float = 3.5
+    # Порог схожести, выше которого фрагменты считаются дубликатами
+    rag_context_dedup_threshold: float = 0.9
+    rag_context_drop_metadata_keys: list[str] = [
+        'id',
+        'chunk_id',
+        'document_id',
+        'embedding',
+        'vector',
+        'hash',
+        'created_at',
+        'updated_at',
+    ]
+    # Структурированный ответ инструмента: у каждого документа
+    # id (хеш содержимого), оценка, фрагмент не длиннее
+    # rag_document_preview_tokens и отобранные метаданные. Полный текст
+    # отдается ресурсом rag://documents/{id} из хранилища в памяти
+    rag_document_preview_tokens: int = 256
+    rag_document_store_max_bytes: int = 32 * 1024 * 1024
+    # Фрагмент документа из лучших по пересечению с запросом окон
+    # соседних предложений вместо начала текста
+    rag_snippets_enabled: bool = True
+    rag_snippet_window_sentences: int = 2
 
     mcp_server_url: str
+    # Транспорт MCP для сервера и клиента: 'sse' или 'streamable-http'.
+    # URL сервера должен указывать на соответствующий путь: /sse или /mcp
     mcp_transport: str = 'sse'
+    # Streamable HTTP без хранения сессий на сервере: каждый запрос
+    # обрабатывается независимо, что упрощает балансировку
+    mcp_stateless_http: bool = False
+    mcp_server_port: int = 8003
+    # Число worker процессов MCP сервера на одном сокете. Несколько
+    # процессов поддерживаются только для streamable HTTP без сессий
+    mcp_server_workers: int = 1
+    # Сколько секунд при SIGTERM ждать завершения текущих запросов
+    mcp_graceful_shutdown_timeout: float = 10.0
     mcp_rag_tool_name: str = 'request_to_rag'
+    # Пул MCP сессий FastAPI приложения: сессии открываются при старте,
+    # каждый вызов инструмента занимает одну из них, простаивающие
+    # сессии проверяются ping раз в mcp_pool_health_check_interval
+    # секунд (0 - без проверок)
+    mcp_pool_size: int = 4
+    mcp_pool_acquire_timeout: float = 10.0
+    mcp_pool_health_check_interval: float = 30.0
+    # Режим агента: 'fast' - поиск по вопросу пользователя и один
+    # потоковый вызов LLM с найденным контекстом (без документов -
+    # переход к ReAct), 'react' - LLM сама решает, когда вызывать
+    # инструмент
+    agent_mode: str = 'fast'
+    # В режиме 'react' поиск по исходному вопросу запускается сразу,
+    # параллельно с планированием LLM; вызов инструмента с похожим
+    # запросом (доля общих n-грамм не ниже agent_prefetch_similarity)
+    # получает его результат, неиспользованный поиск отменяется
+    agent_speculative_prefetch: bool = True
+    agent_prefetch_similarity: float = 0.7
+    # Кэш готовых ответов агента. Ключ - канонический вопрос, версии
+    # базы знаний, модель, temperature и хеш системного промпта.
+    # Попадание отдается тем же потоковым ответом частями по
+    # agent_answer_cache_chunk_chars символов
+    agent_answer_cache_enabled: bool = True
+    agent_answer_cache_max_entries: int = 1024
+    agent_answer_cache_max_bytes: int = 16 * 1024 * 1024
+    agent_answer_cache_ttl: float = 3600.0
+    agent_answer_cache_chunk_chars: int = 64
+    # Считать ответы при gigachat_temperature > 0 недетерминированными
+    # и не кэшировать их
+    agent_answer_cache_bypass_sampling: bool = False
+    # Сколько первых документов агент подставляет в контекст целиком,
+    # остальные - фрагментами из ответа инструмента. Полные тексты
+    # читаются отдельными запросами и обрезаются по rag_context_max_tokens,
+    # по умолчанию агент обходится фрагментами
+    mcp_rag_inline_documents: int = 0
 
     gigachat_credentials: str
     gigachat_scope: str
@@ -65,6 +231,26 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
+# Допустимые названия транспорта MCP и их каноническая форма,
+# общие для сервера и клиента
+MCP_TRANSPORTS = {
+    'sse': 'sse',
+    'streamable-http': 'streamable-http',
+    'streamable_http': 'streamable-http',
+    'http': 'streamable-http',
+}
+
+
+def normalize_mcp_transport(transport: str) -> str:
+    """Возвращает 'sse' или 'streamable-http' для названия транспорта"""
+    name = (transport or '').strip().lower()
+    if name not in MCP_TRANSPORTS:
+        raise ValueError(
+            f'Неизвестный транспорт MCP "{transport}", допустимые '
+            f'значения: {", ".join(MCP_TRANSPORTS)}'
+        )
+    return MCP_TRANSPORTS[name]
+
 
 def get_async_db_url() -> str:
     """Возвращает асинхронный URL для подключения к БД"""
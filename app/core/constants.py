@@ -43,6 +43,12 @@ class Constants:
     AI_AGENT_TAGS = ('ai_agent',)
     AI_QUERY_MAX_LENGTH = 1000
     AI_QUERY_PREVIEW_LENGTH = 100
+    AI_ANSWER_CACHE_PREFIX = '/ask_with_ai/cache'
+
+    # Metrics endpoint
+    METRICS_PREFIX = '/metrics'
+    METRICS_TAGS = ('metrics',)
+    METRICS_MEDIA_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
 
 
 class Messages:
@@ -88,6 +94,10 @@ class Descriptions:
     # Query descriptions
     SKIP_DESCRIPTION = 'Количество записей для пропуска'
     LIMIT_DESCRIPTION = 'Максимальное количество записей'
+    AI_ANSWER_CACHE_QUERY_DESCRIPTION = (
+        'Вопрос, ответы на который нужно удалить. Без него кэш '
+        'очищается полностью'
+    )
 
     # Endpoint summaries and descriptions
     GET_ALL_USERS_SUMMARY = 'Получить всех пользователей'
@@ -125,3 +135,22 @@ class Descriptions:
     AI_ASK_DESCRIPTION = (
         'Отправляет запрос к AI ассистенту для поиска информации в базе знаний'
     )
+    AI_ANSWER_CACHE_STATS_SUMMARY = 'Состояние кэша ответов AI ассистента'
+    AI_ANSWER_CACHE_STATS_DESCRIPTION = (
+        'Размер и попадания кэша готовых ответов. Доступно только '
+        'администраторам и суперпользователям.'
+    )
+    AI_ANSWER_CACHE_CLEAR_SUMMARY = 'Очистить кэш ответов AI ассистента'
+    AI_ANSWER_CACHE_CLEAR_DESCRIPTION = (
+        'Удаляет сохраненные ответы на вопрос или все ответы, например '
+        'после обновления базы знаний. Доступно только администраторам '
+        'и суперпользователям.'
+    )
+
+    # Metrics descriptions
+    METRICS_SUMMARY = 'Метрики приложения'
+    METRICS_DESCRIPTION = (
+        'Метрики процесса в текстовом формате Prometheus: пул MCP сессий, '
+        'упреждающий поиск и кэш ответов агента. Доступно только '
+        'администраторам и суперпользователям.'
+    )
@@ -7,6 +7,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.api.routers import main_router
 from app.core.config import settings
 from app.core.init_db import create_first_superuser
+from app.services.agent.ai_agent import get_rag_agent
+from app.services.agent.mcp_pool import mcp_pool
 
 
 logging.basicConfig(
@@ -19,7 +21,13 @@ logging.basicConfig(
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await create_first_superuser()
-    yield
+    # Граф агента и клиент GigaChat создаются один раз на процесс
+    get_rag_agent()
+    await mcp_pool.start()
+    try:
+        yield
+    finally:
+        await mcp_pool.close()
 
 app = FastAPI(
     title=settings.app_title,
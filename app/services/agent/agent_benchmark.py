@@ -0,0 +1,256 @@
+"""
+Time to first answer token of the agent modes on fake backends.
+
+Runs the same questions through ``RagAgent`` in ``fast`` mode, in
+``react`` mode and in ``react`` mode with speculative prefetch. The LLM
+and the MCP tool are fakes with fixed latencies, so the report shows
+what the extra planning pass of the ReAct agent costs independently of
+GigaChat and Managed RAG:
+
+    python -m app.services.agent.agent_benchmark --questions 20 \
+        --llm-latency 0.4 --rag-latency 0.3
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import json
+import time
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    ToolMessage,
+)
+from langchain_core.outputs import (
+    ChatGeneration,
+    ChatGenerationChunk,
+    ChatResult,
+)
+
+from app.services.mcp_rag.benchmark import BASE_QUERIES, percentile
+from .ai_agent import FAST_MODE, REACT_MODE, RagAgent
+
+
+# Название варианта в отчете, режим агента, упреждающий поиск
+VARIANTS = (
+    ('fast', FAST_MODE, False),
+    ('react', REACT_MODE, False),
+    ('prefetch', REACT_MODE, True),
+)
+BASELINE = 'react'
+DEFAULT_ANSWER = (
+    'Согласно документам базы знаний, гарантия на оборудование '
+    'составляет три года с даты поставки.'
+)
+
+
+class FakeGigaChat(BaseChatModel):
+    """Streaming chat model with a fixed latency per LLM pass.
+
+    With tools bound it first asks for the RAG tool with the last user
+    message as the query, like the ReAct agent's planning step; once a
+    tool result is in the history, or without tools, it streams
+    ``answer`` word by word.
+    """
+
+    answer: str = DEFAULT_ANSWER
+    first_token_latency: float = 0.4
+    token_latency: float = 0.01
+    tool_name: str = 'request_to_rag'
+    tools_bound: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-gigachat'
+
+    def bind_tools(self, tools, **kwargs) -> 'FakeGigaChat':
+        return self.model_copy(update={'tools_bound': True})
+
+    def _wants_tool(self, messages: list[BaseMessage]) -> bool:
+        return self.tools_bound and not any(
+            isinstance(message, ToolMessage) for message in messages
+        )
+
+    def _tool_call_chunk(
+        self, messages: list[BaseMessage]
+    ) -> ChatGenerationChunk:
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content='',
+            tool_call_chunks=[{
+                'name': self.tool_name,
+                'args': json.dumps(
+                    {'query': messages[-1].content}, ensure_ascii=False
+                ),
+                'id': 'call-1',
+                'index': 0,
+            }],
+        ))
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop=None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self._wants_tool(messages):
+            message = self._tool_call_chunk(messages).message
+        else:
+            message = AIMessage(content=self.answer)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop=None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        if self._wants_tool(messages):
+            yield self._tool_call_chunk(messages)
+            return
+        for word in self.answer.split(' '):
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(content=f'{word} ')
+            )
+            time.sleep(self.token_latency)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop=None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        if self._wants_tool(messages):
+            yield self._tool_call_chunk(messages)
+            return
+        for word in self.answer.split(' '):
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(content=f'{word} ')
+            )
+            await asyncio.sleep(self.token_latency)
+
+
+class FakeMcpTools:
+    """MCP tools stand-in that returns fixed documents after a delay."""
+
+    def __init__(self, latency: float = 0.3, documents: int = 4) -> None:
+        self.latency = latency
+        self.documents = documents
+        self.calls = 0
+
+    async def call_tool_documents(
+        self, name: str, arguments: dict
+    ) -> list[dict[str, Any]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [{
+            'id': f'doc-{idx}',
+            'content': f'{arguments["query"]}: фрагмент документа {idx}.',
+            'metadata': {'source': f'document_{idx}.pdf'},
+        } for idx in range(self.documents)]
+
+    async def read_document(self, doc_id: str) -> str:
+        await asyncio.sleep(self.latency / 10)
+        return f'Полный текст документа {doc_id}.'
+
+
+@dataclass
+class AgentModeResult:
+    mode: str
+    ttft: list[float] = field(default_factory=list)
+    total: list[float] = field(default_factory=list)
+    tool_calls: int = 0
+
+
+async def measure_answer(
+    agent: RagAgent, question: str, mcp
+) -> tuple[float, float]:
+    """Time to the first non-empty chunk and to the end of the answer."""
+    started = time.perf_counter()
+    ttft = None
+    async for chunk in agent.astream_answer(question, mcp):
+        if ttft is None and chunk.strip():
+            ttft = time.perf_counter() - started
+    total = time.perf_counter() - started
+    return (total if ttft is None else ttft), total
+
+
+async def run_agent_benchmark(
+    questions: list[str],
+    llm: BaseChatModel | None = None,
+    rag_latency: float = 0.3,
+    inline_documents: int = 0,
+) -> list[AgentModeResult]:
+    llm = llm or FakeGigaChat()
+    results = []
+    for name, mode, speculative in VARIANTS:
+        agent = RagAgent(
+            llm, 'request_to_rag',
+            inline_documents=inline_documents,
+            system_prompt='Отвечай по документам базы знаний.',
+            mode=mode,
+            speculative_prefetch=speculative,
+        )
+        mcp = FakeMcpTools(latency=rag_latency)
+        result = AgentModeResult(name)
+        for question in questions:
+            ttft, total = await measure_answer(agent, question, mcp)
+            result.ttft.append(ttft)
+            result.total.append(total)
+        result.tool_calls = mcp.calls
+        results.append(result)
+    return results
+
+
+def format_agent_report(results: list[AgentModeResult]) -> str:
+    baseline = next(
+        (percentile(result.ttft, 0.5) for result in results
+         if result.mode == BASELINE),
+        0,
+    ) or 1
+    lines = [
+        f'{"режим":<10}{"TTFT p50, мс":>15}{"TTFT p95, мс":>15}'
+        f'{"ответ p50, мс":>16}{"к react":>9}{"вызовов":>9}',
+    ]
+    for result in results:
+        ttft = percentile(result.ttft, 0.5)
+        lines.append(
+            f'{result.mode:<10}{ttft * 1000:>15.0f}'
+            f'{percentile(result.ttft, 0.95) * 1000:>15.0f}'
+            f'{percentile(result.total, 0.5) * 1000:>16.0f}'
+            f'{ttft / baseline - 1:>+9.1%}{result.tool_calls:>9}'
+        )
+    return '\n'.join(lines)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='TTFT of the fast path and the ReAct agent'
+    )
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--llm-latency', type=float, default=0.4)
+    parser.add_argument('--token-latency', type=float, default=0.01)
+    parser.add_argument('--rag-latency', type=float, default=0.3)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(format_agent_report(asyncio.run(run_agent_benchmark(
+        [
+            BASE_QUERIES[idx % len(BASE_QUERIES)]
+            for idx in range(args.questions)
+        ],
+        llm=FakeGigaChat(
+            first_token_latency=args.llm_latency,
+            token_latency=args.token_latency,
+        ),
+        rag_latency=args.rag_latency,
+    ))))
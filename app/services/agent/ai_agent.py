@@ -1,13 +1,49 @@
 from __future__ import annotations
+import asyncio
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from typing import AsyncIterator
 
-from langchain_core.messages import HumanMessage
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 from langgraph.prebuilt import create_react_agent
 from langchain_gigachat import GigaChat
 
+from app.core.config import settings
 from app.logging import logging_config
-from .mcp_client import McpClient
+from app.services.mcp_rag.context_packer import (
+    estimate_tokens,
+    trim_to_tokens,
+)
+from .mcp_client import McpClient, format_documents
+from .mcp_pool import McpClientPool
+from .prefetch import SpeculativeRetrieval
+
+McpTools = McpClient | McpClientPool
+
+FAST_MODE = 'fast'
+REACT_MODE = 'react'
+AGENT_MODES = (FAST_MODE, REACT_MODE)
+FAST_PATH_INSTRUCTION = (
+    'Документы из базы знаний по вопросу пользователя уже найдены и '
+    'приведены в его сообщении после слова Context. Инструменты вызывать '
+    'не нужно: отвечай по этим документам.'
+)
+
+
+@dataclass
+class AnswerOutcome:
+    """Facts about one answer, filled in while it streams.
+
+    ``grounded`` is set once a retrieval for the answer returned
+    documents; an answer written after failed or empty retrievals is
+    not grounded and must not be reused for other users.
+    """
+
+    grounded: bool = False
 
 
 def load_system_prompt() -> str:
@@ -25,110 +61,343 @@ def load_system_prompt() -> str:
         return default
 
 
-def build_agent(
-    mcp: McpClient,
-    rag_tool_name: str,
+def make_gigachat(
     model_name: str,
     temperature: float,
     scope: str,
     credentials: str | None,
     verify_ssl: bool = True,
-):
-    """Create a LangGraph ReAct agent that can call the MCP RAG tool via URL.
+) -> GigaChat:
+    return GigaChat(
+        streaming=True,
+        temperature=temperature,
+        model=model_name,
+        scope=scope,
+        credentials=credentials,
+        verify_ssl_certs=verify_ssl,
+    )
+
+
+def _chunk_text(chunk) -> str:
+    # chunk may be an AIMessageChunk or similar; try to extract text
+    content = getattr(chunk, 'content', None)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # When content is a list of parts
+        return ''.join(
+            getattr(part, 'text', None) or '' for part in content
+        )
+    return ''
 
-    The agent uses GigaChat as the LLM and exposes a single tool which proxies
-    to the remote MCP server tool that implements RAG.
+
+class RagAgent:
+    """Agent that answers from the MCP RAG tool's documents.
+
+    In ``fast`` mode the tool is called directly with the user text and
+    the answer is a single streamed LLM call over the retrieved context,
+    so the first answer token needs one LLM pass instead of two. When
+    retrieval fails or finds nothing, the question falls back to the
+    LangGraph ReAct agent, which may reformulate the query; ``react``
+    mode always uses it.
+
+    The LLM client, the system prompt and the compiled graph are built
+    once and shared by all requests. With ``speculative_prefetch`` the
+    ReAct agent starts retrieval for the raw user text while the LLM
+    plans its tool call; a similar tool query reuses that result.
+
+    Per-request state (the MCP session)
+    is passed to the tool through the run config, so the same instance
+    can serve concurrent questions. The session may be a single
+    ``McpClient`` or a ``McpClientPool`` that lends one per tool call.
     """
-    agent_logger = logging_config.get_endpoint_logger('agent_logger')
 
-    tool_invoked = False
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        rag_tool_name: str,
+        inline_documents: int = 0,
+        system_prompt: str | None = None,
+        mode: str = REACT_MODE,
+        speculative_prefetch: bool = False,
+        prefetch_similarity: float = 0.7,
+    ) -> None:
+        if mode not in AGENT_MODES:
+            raise ValueError(
+                f'Agent mode "{mode}" is not supported. '
+                f'Use one of: {", ".join(AGENT_MODES)}.'
+            )
+        self.llm = llm
+        self.rag_tool_name = rag_tool_name
+        self.inline_documents = inline_documents
+        self.mode = mode
+        self.speculative_prefetch = speculative_prefetch
+        self.prefetch_similarity = prefetch_similarity
+        self.system_prompt = system_prompt or load_system_prompt()
+        self.fast_system_prompt = (
+            f'{self.system_prompt}\n\n{FAST_PATH_INSTRUCTION}'
+        )
+        self._logger = logging_config.get_endpoint_logger('agent_logger')
+        self.graph = create_react_agent(
+            model=llm,
+            tools=[self._make_tool()],
+            prompt=self.system_prompt,
+        )
 
-    # Define a LangChain tool that delegates to MCP
-    @tool('request_to_rag', return_direct=False)
-    async def request_to_rag(query: str) -> str:
-        """
-        Инструмент обращается к API Базы Знаний и получает релевантные
-        документы по запросу пользователя. На выходе выдает релевантные
-        документы, которые нужно использовать для ответа на
-        вопрос пользователя.
+    def _make_tool(self):
+        agent = self
+
+        # Define a LangChain tool that delegates to MCP
+        @tool('request_to_rag', return_direct=False)
+        async def request_to_rag(query: str, config: RunnableConfig) -> str:
+            """
+            Инструмент обращается к API Базы Знаний и получает релевантные
+            документы по запросу пользователя. На выходе выдает релевантные
+            документы, которые нужно использовать для ответа на
+            вопрос пользователя.
+            """
+            configurable = config['configurable']
+            mcp: McpTools = configurable['mcp']
+            prefetch: SpeculativeRetrieval | None = (
+                configurable.get('prefetch')
+            )
+            outcome: AnswerOutcome | None = configurable.get('outcome')
+            retrieved = None
+            if prefetch is not None:
+                retrieved = await prefetch.claim(query)
+            if retrieved is None:
+                retrieved = await agent.retrieve(mcp, query)
+            documents, bodies = retrieved
+            if documents and outcome is not None:
+                outcome.grounded = True
+            return format_documents(documents, bodies)
+
+        return request_to_rag
+
+    async def _read_body(self, mcp: McpTools, doc_id: str) -> str | None:
+        try:
+            return await mcp.read_document(doc_id)
+        except Exception as e:
+            # Fall back to the trimmed content returned by the tool
+            self._logger.warning(f'MCP document {doc_id!r} not read: {e}')
+            return None
+
+    async def retrieve(
+        self,
+        mcp: McpTools,
+        query: str,
+    ) -> tuple[list[dict], dict[str, str]]:
+        """Call the MCP RAG tool and read full bodies of the top documents.
         """
-        nonlocal tool_invoked
-        tool_invoked = True
-        agent_logger.info(
-            f'MCP tool "{rag_tool_name}" invoked with query: {query!r}'
+        self._logger.info(
+            f'MCP tool "{self.rag_tool_name}" invoked with query: {query!r}'
             )
         try:
-            result = await mcp.call_tool_text(
-                name=rag_tool_name,
+            documents = await mcp.call_tool_documents(
+                name=self.rag_tool_name,
                 arguments={'query': query}
                 )
-            agent_logger.info(
-                f'MCP tool "{rag_tool_name}" response: {result[:25]!r}'
-                )
-            return result
+            inlined = [
+                doc['id'] for doc in documents[:max(self.inline_documents, 0)]
+            ]
+            remaining = self._inline_budget(documents)
+            if remaining is not None and remaining <= 0:
+                inlined = []
+            bodies = await asyncio.gather(
+                *(self._read_body(mcp, doc_id) for doc_id in inlined)
+            )
         except Exception as e:
-            agent_logger.exception(
-                f'MCP tool "{rag_tool_name}" failed for query {query!r}: {e}'
+            self._logger.exception(
+                f'MCP tool "{self.rag_tool_name}" failed '
+                f'for query {query!r}: {e}'
                 )
             raise
+        self._logger.info(
+            f'MCP tool "{self.rag_tool_name}" returned '
+            f'{len(documents)} documents'
+            )
+        return documents, self._fit_bodies(
+            documents,
+            dict(zip(inlined, bodies)),
+            remaining,
+        )
 
-    # Initialize GigaChat LLM
-    llm = GigaChat(
-        streaming=True,
-        temperature=temperature,
-        model=model_name,
-        scope=scope,
-        credentials=credentials,
-        verify_ssl_certs=False,
-    )
+    @staticmethod
+    def _inline_budget(documents: list[dict]) -> int | None:
+        """Tokens left for full bodies once the snippets are in context.
 
-    # Load system prompt from external file for easy editing
-    system_prompt = load_system_prompt()
+        None means the context is not limited.
+        """
+        if settings.rag_context_max_tokens <= 0:
+            return None
+        return settings.rag_context_max_tokens - sum(
+            estimate_tokens(doc.get('content', '')) for doc in documents
+        )
 
-    agent = create_react_agent(
-        model=llm,
-        tools=[request_to_rag],
-        prompt=system_prompt,
-    )
+    @staticmethod
+    def _fit_bodies(
+        documents: list[dict],
+        bodies: dict[str, str | None],
+        remaining: int | None,
+    ) -> dict[str, str]:
+        """Replace snippets with bodies while the context budget allows.
 
-    async def astream_answer(user_text: str):
+        A body that does not fit is cut so the whole context stays within
+        ``rag_context_max_tokens``.
         """
-        Stream answer tokens produced by the agent while
-        it reasons and answers.
+        fitted = {}
+        for doc in documents:
+            body = bodies.get(doc['id'])
+            if body is None:
+                continue
+            if remaining is None:
+                fitted[doc['id']] = body
+                continue
+            if remaining <= 0:
+                break
+            snippet_tokens = estimate_tokens(doc.get('content', ''))
+            extra = estimate_tokens(body) - snippet_tokens
+            if extra > remaining:
+                body = trim_to_tokens(body, snippet_tokens + remaining)
+                extra = remaining
+            fitted[doc['id']] = body
+            remaining -= max(extra, 0)
+        return fitted
+
+    async def fetch_context(self, mcp: McpTools, query: str) -> str:
+        """Call the MCP RAG tool and render its documents as context."""
+        documents, bodies = await self.retrieve(mcp, query)
+        return format_documents(documents, bodies)
+
+    async def astream_answer(
+        self,
+        user_text: str,
+        mcp: McpTools,
+        outcome: AnswerOutcome | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream answer tokens in the configured mode.
+
+        Yields incremental text chunks for UI streaming. ``outcome``, if
+        given, tells the caller whether the answer used retrieved
+        documents.
+        """
+        stream = (
+            self.astream_fast_answer if self.mode == FAST_MODE
+            else self.astream_react_answer
+        )
+        async for chunk in stream(user_text, mcp, outcome=outcome):
+            yield chunk
 
-        Yields incremental text chunks for UI streaming.
+    async def astream_fast_answer(
+        self,
+        user_text: str,
+        mcp: McpTools,
+        outcome: AnswerOutcome | None = None,
+    ) -> AsyncIterator[str]:
         """
-        agent_logger.info(f'Agent started for user text: {user_text!r}')
-        # We stream events and capture model token stream after tool execution
-        async for event in agent.astream_events(
-            {
-                'messages': [HumanMessage(content=user_text)]
-                },
-            version='v1',
-        ):
-            etype = event.get('event')
-            if etype == 'on_chat_model_stream':
-                data = event.get('data', {})
-                chunk = data.get('chunk')
-                # chunk may be an AIMessageChunk or similar;
-                # try to extract text
-                if chunk is not None:
-                    content = getattr(chunk, 'content', None)
-                    if isinstance(content, str) and content:
-                        yield content
-                    elif isinstance(content, list):
-                        # When content is a list of parts
-                        parts = []
-                        for part in content:
-                            text = getattr(part, 'text', None)
-                            if text:
-                                parts.append(text)
-                        if parts:
-                            yield ''.join(parts)
+        Retrieve context for the user text, then stream a single LLM call.
+
+        Falls back to the ReAct agent when retrieval fails or returns
+        no documents.
+        """
+        self._logger.info(f'Fast path started for user text: {user_text!r}')
+        try:
+            documents, bodies = await self.retrieve(mcp, user_text)
+        except Exception:
+            documents = []
+        if not documents:
+            self._logger.warning(
+                f'Fast path found no context, falling back to ReAct '
+                f'for user text: {user_text!r}'
+                )
+            # Retrieval for the raw text already ran, do not prefetch again
+            async for chunk in self.astream_react_answer(
+                user_text, mcp, speculative=False, outcome=outcome
+            ):
+                yield chunk
+            return
+        if outcome is not None:
+            outcome.grounded = True
+        messages = [
+            SystemMessage(content=self.fast_system_prompt),
+            HumanMessage(content=(
+                f'{format_documents(documents, bodies)}'
+                f'Вопрос: {user_text}'
+            )),
+        ]
+        async for chunk in self.llm.astream(messages):
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+
+    async def astream_react_answer(
+        self,
+        user_text: str,
+        mcp: McpTools,
+        speculative: bool | None = None,
+        outcome: AnswerOutcome | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream answer tokens produced by the ReAct agent while
+        it reasons and answers.
+        """
+        self._logger.info(f'Agent started for user text: {user_text!r}')
+        if speculative is None:
+            speculative = self.speculative_prefetch
+        prefetch = SpeculativeRetrieval(
+            user_text,
+            lambda query: self.retrieve(mcp, query),
+            threshold=self.prefetch_similarity,
+        ) if speculative else None
+        tool_invoked = False
+        try:
+            # Stream events and capture model tokens after tool execution
+            async for event in self.graph.astream_events(
+                {
+                    'messages': [HumanMessage(content=user_text)]
+                    },
+                config={'configurable': {
+                    'mcp': mcp, 'prefetch': prefetch, 'outcome': outcome,
+                }},
+                version='v1',
+            ):
+                etype = event.get('event')
+                if etype == 'on_tool_start':
+                    tool_invoked = True
+                elif etype == 'on_chat_model_stream':
+                    chunk = event.get('data', {}).get('chunk')
+                    text = _chunk_text(chunk) if chunk is not None else ''
+                    if text:
+                        yield text
+        finally:
+            if prefetch is not None:
+                await prefetch.finish()
         if not tool_invoked:
-            agent_logger.warning(
-                f'MCP tool "{rag_tool_name}" was NOT invoked '
+            self._logger.warning(
+                f'MCP tool "{self.rag_tool_name}" was NOT invoked '
                 f'for user text: {user_text!r}'
                 )
 
-    return agent, astream_answer
+
+@lru_cache(maxsize=1)
+def get_rag_agent() -> RagAgent:
+    """Process-wide agent built from settings on first use.
+
+    The FastAPI lifespan calls it at startup, so construction does not
+    happen on the request path.
+    """
+    return RagAgent(
+        llm=make_gigachat(
+            model_name=settings.gigachat_model,
+            temperature=settings.gigachat_temperature,
+            scope=settings.gigachat_scope,
+            credentials=settings.gigachat_credentials,
+            verify_ssl=settings.gigachat_verify_ssl,
+        ),
+        rag_tool_name=settings.mcp_rag_tool_name,
+        inline_documents=settings.mcp_rag_inline_documents,
+        mode=settings.agent_mode,
+        speculative_prefetch=settings.agent_speculative_prefetch,
+        prefetch_similarity=settings.agent_prefetch_similarity,
+    )
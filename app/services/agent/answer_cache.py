@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import time
+from typing import Any, AsyncIterator, Callable
+
+from app.core.config import settings
+from app.services.mcp_rag.metrics import registry
+from app.services.mcp_rag.query_canonicalizer import canonicalize_query
+from .ai_agent import AnswerOutcome
+
+
+AnswerKey = tuple[str, str, str, float, str]
+
+answer_cache_requests = registry.counter(
+    'agent_answer_cache_requests',
+    'Запросы к кэшу ответов агента по исходу: hit, miss, bypass, '
+    'ungrounded (ответ без документов не сохранен)',
+    labelnames=('outcome',),
+)
+
+
+@dataclass
+class CachedAnswer:
+    text: str
+    size: int
+    expires_at: float
+
+
+def prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def knowledge_base_key() -> str:
+    versions = (
+        settings.knowledge_base_version_ids
+        or [settings.knowledge_base_version_id]
+    )
+    return ','.join(sorted(versions))
+
+
+def answer_key(question: str, system_prompt: str) -> AnswerKey | None:
+    """Cache key of an answer, or None when the answer is not cached.
+
+    Answers are not cached at all when the cache is disabled, and not
+    cached for a sampling temperature when
+    ``agent_answer_cache_bypass_sampling`` marks such answers as
+    non-deterministic.
+    """
+    if not settings.agent_answer_cache_enabled:
+        return None
+    if (
+        settings.agent_answer_cache_bypass_sampling
+        and settings.gigachat_temperature > 0
+    ):
+        return None
+    return AnswerCache.make_key(
+        question,
+        knowledge_base_key(),
+        settings.gigachat_model,
+        settings.gigachat_temperature,
+        system_prompt,
+    )
+
+
+async def replay(text: str, chunk_chars: int) -> AsyncIterator[str]:
+    """Yield a cached answer in chunks, like a streamed generation."""
+    chunk_chars = max(chunk_chars, 1)
+    for start in range(0, len(text), chunk_chars):
+        yield text[start:start + chunk_chars]
+        # Let the response flush each chunk separately
+        await asyncio.sleep(0)
+
+
+class AnswerCache:
+    """TTL+LRU cache of complete agent answers.
+
+    Generation dominates the answer latency, so repeated questions are
+    answered from memory. Only answers that streamed to the end and used
+    retrieved documents are stored: an answer written during an MCP or
+    Managed RAG outage is not replayed after it. An answer whose
+    generation started before ``invalidate`` is dropped, so an admin
+    invalidation is not undone by requests in flight. The cache is
+    bounded by both the number of answers and their total size.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        ttl: float,
+        chunk_chars: int = 64,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.chunk_chars = chunk_chars
+        self._entries: OrderedDict[AnswerKey, CachedAnswer] = OrderedDict()
+        self._size = 0
+        self._generation = 0
+
+    @staticmethod
+    def make_key(
+        question: str,
+        knowledge_base: str,
+        model_name: str,
+        temperature: float,
+        system_prompt: str,
+    ) -> AnswerKey:
+        return (
+            canonicalize_query(question),
+            knowledge_base,
+            model_name,
+            float(temperature),
+            prompt_hash(system_prompt),
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'hits': int(answer_cache_requests.value(outcome='hit')),
+            'misses': int(answer_cache_requests.value(outcome='miss')),
+            'bypassed': int(answer_cache_requests.value(outcome='bypass')),
+        }
+
+    def get(self, key: AnswerKey) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry.expires_at:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry.text
+
+    def put(self, key: AnswerKey, text: str) -> None:
+        size = len(text.encode('utf-8'))
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CachedAnswer(
+            text, size, time.monotonic() + self.ttl
+        )
+        self._size += size
+        while (
+            len(self._entries) > self.max_entries
+            or self._size > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: AnswerKey) -> None:
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+    def invalidate(self, question: str | None = None) -> int:
+        """Drop cached answers to one question or all answers.
+
+        Returns the number of removed answers.
+        """
+        self._generation += 1
+        if question is None:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._size = 0
+            return removed
+        canonical = canonicalize_query(question)
+        keys = [key for key in self._entries if key[0] == canonical]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    async def astream(
+        self,
+        key: AnswerKey | None,
+        produce: Callable[[AnswerOutcome], AsyncIterator[str]],
+    ) -> AsyncIterator[str]:
+        """Replay a cached answer or stream a new one and store it.
+
+        ``produce`` streams a new answer and reports through the given
+        ``AnswerOutcome`` whether it used retrieved documents.
+        """
+        outcome = AnswerOutcome()
+        if key is None:
+            answer_cache_requests.inc(outcome='bypass')
+            async for chunk in produce(outcome):
+                yield chunk
+            return
+        cached = self.get(key)
+        if cached is not None:
+            answer_cache_requests.inc(outcome='hit')
+            async for chunk in replay(cached, self.chunk_chars):
+                yield chunk
+            return
+        answer_cache_requests.inc(outcome='miss')
+        generation = self._generation
+        chunks = []
+        async for chunk in produce(outcome):
+            chunks.append(chunk)
+            yield chunk
+        text = ''.join(chunks)
+        if not outcome.grounded:
+            answer_cache_requests.inc(outcome='ungrounded')
+            return
+        if text.strip() and generation == self._generation:
+            self.put(key, text)
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.agent_answer_cache_max_entries,
+    max_bytes=settings.agent_answer_cache_max_bytes,
+    ttl=settings.agent_answer_cache_ttl,
+    chunk_chars=settings.agent_answer_cache_chunk_chars,
+)
+registry.gauge_callback(
+    'agent_answer_cache_entries',
+    'Ответы агента в кэше',
+    lambda: len(answer_cache),
+)
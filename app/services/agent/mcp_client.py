@@ -5,32 +5,93 @@ from contextlib import AsyncExitStack
 from typing import Any, Iterable
 
 from mcp import ClientSession
+from mcp.types import CallToolResult, TextResourceContents
+from pydantic import AnyUrl
 from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+
+from app.core.config import normalize_mcp_transport
+
+
+DOCUMENT_URI = 'rag://documents/{doc_id}'
+
+
+class McpToolError(RuntimeError):
+    """The tool call completed but reported an error."""
+
+
+def format_documents(
+    documents: list[dict[str, Any]],
+    bodies: dict[str, str] | None = None,
+) -> str:
+    """Render structured RAG documents as a context block for the LLM.
+
+    Documents whose full body is present in ``bodies`` are inlined
+    completely, the rest are rendered with the trimmed content returned
+    by the tool.
+    """
+    bodies = bodies or {}
+    parts = ['Context:\n\n']
+    for idx, document in enumerate(documents, start=1):
+        content = bodies.get(document.get('id'), document.get('content', ''))
+        metadata = '; '.join(
+            f'{key}: {value}'
+            for key, value in (document.get('metadata') or {}).items()
+        )
+        parts.append(f'Document {idx}:\nContent: {content}')
+        parts.append(f'\nMetadata: {metadata}\n\n' if metadata else '\n\n')
+    return ''.join(parts)
+
+
+def _structured_documents(
+    result: CallToolResult,
+) -> list[dict[str, Any]] | None:
+    structured = getattr(result, 'structuredContent', None)
+    if not isinstance(structured, dict):
+        return None
+    documents = structured.get('result')
+    if not isinstance(documents, list):
+        return None
+    # Другие инструменты, например пакетный поиск, тоже возвращают списки
+    if not all(
+        isinstance(document, dict) and {'id', 'content'} <= document.keys()
+        for document in documents
+    ):
+        return None
+    return documents
+
+
+def _joined_text(result: CallToolResult) -> str:
+    # result.content could be a list of content blocks
+    blocks: Iterable[Any] = getattr(result, 'content', [])
+    texts: list[str] = []
+    for block in blocks:
+        text = getattr(block, 'text', None)
+        if text:
+            texts.append(text)
+    return '\n'.join(texts).strip()
 
 
 class McpClient:
-    """Async MCP client for SSE transport.
+    """Async MCP client for SSE and streamable HTTP transports.
 
     Connects to a remote MCP server by URL and provides tool calling helpers.
+    SSE keeps a long-lived event stream plus a separate POST channel per
+    session; streamable HTTP sends every message as a plain POST, which is
+    cheaper to set up and to balance.
     """
 
     def __init__(self, url: str, transport: str = 'sse') -> None:
+        """Raises ValueError for an unknown transport name."""
         self._url = url
-        self._transport = (transport or 'sse').lower()
+        self._transport = normalize_mcp_transport(transport)
         self._stack: AsyncExitStack | None = None
         self._session: ClientSession | None = None
 
     async def __aenter__(self) -> 'McpClient':
-        if self._transport != 'sse':
-            raise NotImplementedError(
-                f'Transport "{self._transport}" '
-                f'is not implemented in this client yet. Use "sse".'
-            )
         stack = AsyncExitStack()
-        # Open SSE streams within the same exit stack
-        read_stream, write_stream = (
-            await stack.enter_async_context(sse_client(url=self._url))
-            )
+        # Open transport streams within the same exit stack
+        read_stream, write_stream = await self._open_streams(stack)
         # Open MCP session tied to the same stack
         session = (
             await stack.enter_async_context(
@@ -42,6 +103,14 @@ class McpClient:
         self._session = session
         return self
 
+    async def _open_streams(self, stack: AsyncExitStack) -> tuple[Any, Any]:
+        if self._transport == 'sse':
+            return await stack.enter_async_context(sse_client(url=self._url))
+        read_stream, write_stream, _ = await stack.enter_async_context(
+            streamablehttp_client(url=self._url)
+        )
+        return read_stream, write_stream
+
     async def __aexit__(self, exc_type, exc, tb) -> None:
         if self._stack is None:
             return
@@ -71,18 +140,43 @@ class McpClient:
             name: str,
             arguments: dict[str, Any]
     ) -> str:
-        """Call a tool and return concatenated text content.
+        """Call a tool and return its result as text.
 
-        This assumes the server returns a list of content blocks
-        where text blocks are of type 'text' with field 'text'.
+        Structured document lists are rendered with ``format_documents``;
+        other structured results fall back to their text blocks. Otherwise
+        this assumes the server returns a list of content blocks where
+        text blocks are of type 'text' with field 'text'.
         Non-text results are ignored.
         """
         result = await self.session.call_tool(name=name, arguments=arguments)
-        # result.content could be a list of content blocks
-        blocks: Iterable[Any] = getattr(result, 'content', [])
-        texts: list[str] = []
-        for block in blocks:
-            text = getattr(block, 'text', None)
-            if text:
-                texts.append(text)
-        return '\n'.join(texts).strip()
+        documents = None if result.isError else _structured_documents(result)
+        if documents is not None:
+            return format_documents(documents)
+        return _joined_text(result)
+
+    async def call_tool_documents(
+            self,
+            name: str,
+            arguments: dict[str, Any]
+    ) -> list[dict[str, Any]]:
+        """Call a tool that returns structured documents.
+
+        Raises McpToolError with the tool's text output when the call
+        fails or the result is not a document list.
+        """
+        result = await self.session.call_tool(name=name, arguments=arguments)
+        documents = None if result.isError else _structured_documents(result)
+        if documents is None:
+            raise McpToolError(_joined_text(result))
+        return documents
+
+    async def read_document(self, doc_id: str) -> str:
+        """Fetch the full body of a document returned by the RAG tool."""
+        result = await self.session.read_resource(
+            AnyUrl(DOCUMENT_URI.format(doc_id=doc_id))
+        )
+        return ''.join(
+            contents.text
+            for contents in result.contents
+            if isinstance(contents, TextResourceContents)
+        )
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+import time
+from typing import Any, AsyncIterator, Callable
+
+from mcp.shared.exceptions import McpError
+
+from app.core.config import normalize_mcp_transport, settings
+from app.logging import logging_config
+from app.services.mcp_rag.metrics import registry
+from .mcp_client import McpClient, McpToolError
+
+
+pool_acquire_wait = registry.histogram(
+    'mcp_pool_acquire_wait_seconds',
+    'Ожидание свободной MCP сессии в пуле',
+)
+pool_reconnects = registry.counter(
+    'mcp_pool_reconnects',
+    'Переподключения MCP сессий пула',
+    labelnames=('reason',),
+)
+
+
+class PooledConnection:
+    """One MCP session owned by a dedicated task.
+
+    The transport streams live in anyio task groups that must be exited
+    by the task that entered them, so the session is opened and closed
+    inside its own task instead of whichever request happens to notice
+    that it is broken.
+    """
+
+    def __init__(self, factory: Callable[[], McpClient]) -> None:
+        self._factory = factory
+        self._task: asyncio.Task | None = None
+        self._closing = asyncio.Event()
+        self.client: McpClient | None = None
+        self.connects = 0
+
+    @property
+    def alive(self) -> bool:
+        return (
+            self.client is not None
+            and self._task is not None
+            and not self._task.done()
+        )
+
+    async def open(self) -> None:
+        ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run(ready))
+        await ready
+        self.connects += 1
+
+    async def _run(self, ready: asyncio.Future) -> None:
+        try:
+            async with self._factory() as client:
+                self.client = client
+                ready.set_result(None)
+                await self._closing.wait()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+            elif not isinstance(e, asyncio.CancelledError):
+                logging_config.get_endpoint_logger('agent_logger').warning(
+                    f'MCP pooled session closed: {e}'
+                )
+        finally:
+            self.client = None
+
+    async def close(self, timeout: float = 5.0) -> None:
+        if self._task is None:
+            return
+        self._closing.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except Exception:
+            self._task.cancel()
+        self._task = None
+        self.client = None
+
+
+class McpClientPool:
+    """Pool of warm MCP sessions for the FastAPI app.
+
+    Sessions are opened once (see ``start``) and each tool call checks
+    one out exclusively, so an answer no longer pays for the transport
+    connect and the ``initialize`` handshake. Idle sessions are pinged
+    every ``health_check_interval`` seconds; broken sessions are
+    reconnected on the next checkout. The pool exposes the same tool
+    helpers as ``McpClient`` and can be passed to the agent directly.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        transport: str = 'sse',
+        size: int = 4,
+        acquire_timeout: float = 10.0,
+        health_check_interval: float = 30.0,
+        client_factory: Callable[[], McpClient] | None = None,
+    ) -> None:
+        self.url = url
+        self.transport = normalize_mcp_transport(transport)
+        self.size = max(size, 1)
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self._factory = client_factory or (
+            lambda: McpClient(self.url, transport=self.transport)
+        )
+        self._idle: asyncio.Queue[PooledConnection] | None = None
+        self._connections: list[PooledConnection] = []
+        self._health_task: asyncio.Task | None = None
+        self._logger = logging_config.get_endpoint_logger('agent_logger')
+
+    def _ensure_slots(self) -> asyncio.Queue[PooledConnection]:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            self._connections = [
+                PooledConnection(self._factory) for _ in range(self.size)
+            ]
+            for connection in self._connections:
+                self._idle.put_nowait(connection)
+        return self._idle
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        idle = self._idle.qsize() if self._idle is not None else self.size
+        return {
+            'size': self.size,
+            'idle': idle,
+            'in_use': self.size - idle,
+            'alive': sum(conn.alive for conn in self._connections),
+            'acquires': pool_acquire_wait.count(),
+        }
+
+    async def start(self) -> None:
+        """Open all sessions and start health checks.
+
+        Sessions that fail to connect are retried on checkout, so the
+        app starts even when the MCP server is not up yet.
+        """
+        self._ensure_slots()
+        results = await asyncio.gather(
+            *(conn.open() for conn in self._connections),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, BaseException)]
+        if failed:
+            self._logger.warning(
+                f'MCP pool: {len(failed)} of {self.size} sessions '
+                f'not connected: {failed[0]}'
+            )
+        if self.health_check_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        await asyncio.gather(
+            *(conn.close() for conn in self._connections),
+            return_exceptions=True,
+        )
+        self._idle = None
+        self._connections = []
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[McpClient]:
+        """Check out a connected session for one tool call."""
+        idle = self._ensure_slots()
+        started = time.perf_counter()
+        connection = await asyncio.wait_for(
+            idle.get(), self.acquire_timeout
+        )
+        pool_acquire_wait.observe(time.perf_counter() - started)
+        try:
+            if not connection.alive:
+                await connection.close()
+                await connection.open()
+                if connection.connects > 1:
+                    pool_reconnects.inc(reason='checkout')
+            yield connection.client
+        except (McpError, McpToolError, asyncio.CancelledError):
+            # The server reported an error or the caller gave up on the
+            # answer (a cancelled prefetch); the session itself is fine
+            raise
+        except BaseException:
+            # The session may be left in an unknown state
+            await connection.close()
+            raise
+        finally:
+            idle.put_nowait(connection)
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check_health()
+
+    async def check_health(self) -> None:
+        """Ping idle sessions and reconnect the ones that fail."""
+        idle = self._ensure_slots()
+        for _ in range(idle.qsize()):
+            try:
+                connection = idle.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                if connection.alive:
+                    await asyncio.wait_for(
+                        connection.client.session.send_ping(),
+                        self.acquire_timeout,
+                    )
+                    continue
+                await connection.close()
+                await connection.open()
+                pool_reconnects.inc(reason='health_check')
+            except Exception as e:
+                self._logger.warning(f'MCP pool health check failed: {e}')
+                await connection.close()
+            finally:
+                idle.put_nowait(connection)
+
+    async def call_tool_text(self, name: str, arguments: dict) -> str:
+        async with self.acquire() as client:
+            return await client.call_tool_text(name, arguments)
+
+    async def call_tool_documents(
+        self,
+        name: str,
+        arguments: dict,
+    ) -> list[dict[str, Any]]:
+        async with self.acquire() as client:
+            return await client.call_tool_documents(name, arguments)
+
+    async def read_document(self, doc_id: str) -> str:
+        async with self.acquire() as client:
+            return await client.read_document(doc_id)
+
+
+mcp_pool = McpClientPool(
+    settings.mcp_server_url,
+    transport=settings.mcp_transport,
+    size=settings.mcp_pool_size,
+    acquire_timeout=settings.mcp_pool_acquire_timeout,
+    health_check_interval=settings.mcp_pool_health_check_interval,
+)
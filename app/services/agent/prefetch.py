@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from app.services.mcp_rag.metrics import registry
+from app.services.mcp_rag.similarity_cache import query_shingles
+
+
+T = TypeVar('T')
+
+prefetch_outcomes = registry.counter(
+    'agent_prefetch',
+    'Упреждающие поиски агента по исходу: hit, unused, failed',
+    labelnames=('outcome',),
+)
+prefetch_misses = registry.counter(
+    'agent_prefetch_misses',
+    'Вызовы инструмента с запросом, не похожим на упреждающий поиск',
+)
+prefetch_head_start = registry.histogram(
+    'agent_prefetch_head_start_seconds',
+    'Насколько упреждающий поиск опередил вызов инструмента',
+)
+
+
+def query_similarity(first: str, second: str) -> float:
+    """Share of the smaller query's n-grams found in the other one.
+
+    The agent usually shortens the user text into a keyword query, so
+    the overlap coefficient is used instead of Jaccard: a tool query made
+    of words from the question scores close to 1.
+    """
+    first_shingles = query_shingles(first)
+    second_shingles = query_shingles(second)
+    if not first_shingles or not second_shingles:
+        return 0.0
+    return len(first_shingles & second_shingles) / min(
+        len(first_shingles), len(second_shingles)
+    )
+
+
+def prefetch_hit_rate() -> float:
+    hits = prefetch_outcomes.value(outcome='hit')
+    total = hits + sum(
+        prefetch_outcomes.value(outcome=outcome)
+        for outcome in ('unused', 'failed')
+    )
+    return hits / total if total else 0.0
+
+
+registry.gauge_callback(
+    'agent_prefetch_hit_ratio',
+    'Доля упреждающих поисков, результат которых использовал агент',
+    prefetch_hit_rate,
+)
+
+
+class SpeculativeRetrieval(Generic[T]):
+    """Retrieval for the raw user text started before the agent plans.
+
+    The first tool call whose query is similar enough to the user text
+    takes over the running task instead of starting a new retrieval.
+    ``finish`` cancels the task if no tool call claimed it.
+    """
+
+    def __init__(
+        self,
+        query: str,
+        fetch: Callable[[str], Awaitable[T]],
+        threshold: float = 0.7,
+    ) -> None:
+        self.query = query
+        self.threshold = threshold
+        self.claimed = False
+        self._started = time.perf_counter()
+        self._task = asyncio.create_task(fetch(query))
+
+    def matches(self, query: str) -> bool:
+        return (
+            query.strip().lower() == self.query.strip().lower()
+            or query_similarity(query, self.query) >= self.threshold
+        )
+
+    async def claim(self, query: str) -> T | None:
+        """Result of the prefetch, or None if the tool should retrieve.
+        """
+        if self.claimed:
+            return None
+        if not self.matches(query):
+            prefetch_misses.inc()
+            return None
+        self.claimed = True
+        prefetch_head_start.observe(time.perf_counter() - self._started)
+        try:
+            result = await self._task
+        except Exception:
+            prefetch_outcomes.inc(outcome='failed')
+            return None
+        prefetch_outcomes.inc(outcome='hit')
+        return result
+
+    async def finish(self) -> None:
+        """Cancel the prefetch if no tool call used it."""
+        if self.claimed:
+            return
+        self.claimed = True
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        failed = (
+            not self._task.cancelled()
+            and self._task.exception() is not None
+        )
+        prefetch_outcomes.inc(outcome='failed' if failed else 'unused')
@@ -0,0 +1,190 @@
+'''
+Нагрузочный тест инструмента request_to_rag через MCP клиент.
+
+Вызывает инструмент с заданной конкурентностью и выводит пропускную
+способность и перцентили задержки. Для работы без реального API
+MCP сервер запускается против fake_rag_server:
+
+    python -m app.services.mcp_rag.fake_rag_server --port 8010
+    AUTH_URL=http://localhost:8010/token \
+    RETRIEVE_URL_TEMPLATE=http://localhost:8010/retrieve \
+        python -m app.services.mcp_rag.server
+    python -m app.services.mcp_rag.benchmark --concurrency 32 \
+        --requests 2000 --distinct-queries 100
+'''
+import argparse
+import asyncio
+import math
+import time
+
+from fastmcp import Client
+
+
+MCP_URL = 'http://localhost:8003/sse'
+
+BASE_QUERIES = (
+    'Контакты службы технической поддержки Киа',
+    'Какие условия гарантии Мотрекс',
+    'Срок гарантии на лакокрасочное покрытие',
+    'Порядок оформления гарантийной заявки',
+    'Гарантия на аккумуляторную батарею',
+    'Регламент технического обслуживания',
+)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    '''Перцентиль по методу ближайшего ранга.'''
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[min(idx, len(ordered) - 1)]
+
+
+def summarize_latencies(latencies: list[float]) -> dict[str, float]:
+    return {
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': max(latencies, default=0.0),
+    }
+
+
+def format_report(
+    title: str,
+    latencies: list[float],
+    errors: int,
+    elapsed: float,
+) -> str:
+    summary = summarize_latencies(latencies)
+    completed = len(latencies)
+    throughput = completed / elapsed if elapsed > 0 else 0.0
+    return (
+        f'{title}\n'
+        f'  успешных: {completed}, ошибок: {errors}, '
+        f'время: {elapsed:.2f} с\n'
+        f'  пропускная способность: {throughput:.1f} запросов/с\n'
+        f'  задержка, мс: '
+        f'p50={summary["p50"] * 1000:.1f} '
+        f'p95={summary["p95"] * 1000:.1f} '
+        f'p99={summary["p99"] * 1000:.1f} '
+        f'max={summary["max"] * 1000:.1f}'
+    )
+
+
+def build_queries(distinct: int) -> list[str]:
+    '''Набор различных запросов для управления долей попаданий в кэш.'''
+    return [
+        f'{BASE_QUERIES[idx % len(BASE_QUERIES)]} {idx}'
+        for idx in range(max(distinct, 1))
+    ]
+
+
+async def run_benchmark(
+    url: str,
+    tool: str,
+    concurrency: int,
+    requests: int,
+    queries: list[str],
+    warmup: int = 0,
+) -> tuple[list[float], int, float]:
+    '''
+    Выполняет requests вызовов инструмента в concurrency сессиях.
+
+    Returns:
+        Задержки успешных вызовов, число ошибок и общее время.
+    '''
+    latencies: list[float] = []
+    errors = 0
+    sessions = max(concurrency, 1)
+    counter = iter(range(requests))
+    ready = 0
+    all_ready = asyncio.Event()
+    start = asyncio.Event()
+
+    async def worker() -> None:
+        nonlocal errors, ready
+        async with Client(url) as client:
+            for idx in range(warmup):
+                try:
+                    await client.call_tool(
+                        tool,
+                        {'query': queries[idx % len(queries)]},
+                        raise_on_error=False,
+                    )
+                except Exception:
+                    pass
+            ready += 1
+            if ready == sessions:
+                all_ready.set()
+            await start.wait()
+            for idx in counter:
+                query = queries[idx % len(queries)]
+                started = time.perf_counter()
+                # Сбой транспорта или HTTP считается ошибкой запроса
+                # и не прерывает замер
+                try:
+                    result = await client.call_tool(
+                        tool, {'query': query}, raise_on_error=False
+                    )
+                except Exception:
+                    errors += 1
+                    continue
+                if result.is_error:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+
+    workers = [asyncio.create_task(worker()) for _ in range(sessions)]
+    # Замер начинается после подключения всех сессий,
+    # чтобы handshake не попадал в задержки
+    ready_waiter = asyncio.create_task(all_ready.wait())
+    await asyncio.wait(
+        [ready_waiter, *workers], return_when=asyncio.FIRST_COMPLETED
+    )
+    ready_waiter.cancel()
+    start.set()
+    started = time.perf_counter()
+    await asyncio.gather(*workers)
+    return latencies, errors, time.perf_counter() - started
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный тест MCP инструмента request_to_rag'
+    )
+    parser.add_argument('--url', default=MCP_URL)
+    parser.add_argument('--tool', default='request_to_rag')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument(
+        '--distinct-queries', type=int, default=50,
+        help='Число различных запросов; меньше - больше попаданий в кэш',
+    )
+    parser.add_argument(
+        '--warmup', type=int, default=0,
+        help='Прогревочных вызовов на сессию до начала замера',
+    )
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    latencies, errors, elapsed = await run_benchmark(
+        url=args.url,
+        tool=args.tool,
+        concurrency=args.concurrency,
+        requests=args.requests,
+        queries=build_queries(args.distinct_queries),
+        warmup=args.warmup,
+    )
+    print(format_report(
+        f'{args.tool} @ {args.url}, конкурентность {args.concurrency}',
+        latencies,
+        errors,
+        elapsed,
+    ))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
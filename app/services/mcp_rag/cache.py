@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import time
+from typing import Any, Hashable
+
+from app.core.config import settings
+from app.services.mcp_rag.query_canonicalizer import canonicalize_query
+
+
+def normalize_query(query: str) -> str:
+    '''Приводит запрос к виду, используемому в ключе кэша.'''
+    return canonicalize_query(query)
+
+
+class RetrievalCache:
+    '''
+    Ограниченный по размеру TTL+LRU кэш результатов request_to_rag.
+
+    После истечения ttl запись еще stale_ttl секунд может отдаваться
+    как устаревшая, пока результат обновляется в фоне. При смене
+    knowledge_base_version_id в настройках кэш полностью очищается.
+    '''
+
+    def __init__(self, max_size: int, ttl: float, stale_ttl: float = 0.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # key -> (fresh_until, stale_until, value)
+        self._entries: OrderedDict[
+            Hashable, tuple[float, float, Any]
+        ] = OrderedDict()
+        self._kb_version = settings.knowledge_base_version_id
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        query: str,
+        knowledge_base_version_id: str,
+        retrieve_limit: int,
+    ) -> tuple[str, str, int]:
+        return (
+            normalize_query(query),
+            knowledge_base_version_id,
+            retrieve_limit,
+        )
+
+    def get(self, key: Hashable) -> Any | None:
+        '''Возвращает только свежее значение.'''
+        return self.lookup(key, allow_stale=False)[0]
+
+    def lookup(
+        self,
+        key: Hashable,
+        allow_stale: bool = True,
+    ) -> tuple[Any | None, bool]:
+        '''
+        Возвращает значение и признак того, что оно устарело.
+
+        Returns:
+            (None, False), если подходящей записи нет.
+        '''
+        self._check_kb_version()
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+        fresh_until, stale_until, value = entry
+        now = time.monotonic()
+        if now >= stale_until:
+            del self._entries[key]
+            self.misses += 1
+            return None, False
+        is_stale = now >= fresh_until
+        if is_stale and not allow_stale:
+            self.misses += 1
+            return None, False
+        self._entries.move_to_end(key)
+        if is_stale:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return value, is_stale
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float | None = None,
+        stale_ttl: float | None = None,
+        age: float = 0.0,
+    ) -> None:
+        '''
+        Сохраняет значение. age - сколько секунд назад оно получено
+        (например, для записи с диска): сроки свежести отсчитываются
+        от этого момента, а уже истекшая запись не сохраняется.
+        '''
+        self._check_kb_version()
+        if self.max_size <= 0:
+            return
+        now = time.monotonic()
+        fresh_until = now - max(age, 0.0) + (
+            self.ttl if ttl is None else ttl
+        )
+        stale_until = fresh_until + (
+            self.stale_ttl if stale_ttl is None else stale_ttl
+        )
+        if stale_until <= now:
+            self._entries.pop(key, None)
+            return
+        self._entries[key] = (fresh_until, stale_until, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        served = self.hits + self.stale_hits
+        lookups = served + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_ratio': served / lookups if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _check_kb_version(self) -> None:
+        kb_version = settings.knowledge_base_version_id
+        if kb_version != self._kb_version:
+            self._entries.clear()
+            self._kb_version = kb_version
+
+
+retrieval_cache = RetrievalCache(
+    max_size=settings.rag_cache_max_size,
+    ttl=settings.rag_cache_ttl,
+    stale_ttl=settings.rag_cache_stale_ttl,
+)
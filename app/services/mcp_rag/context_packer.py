@@ -0,0 +1,252 @@
+import hashlib
+import math
+import re
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.services.mcp_rag.russian_text import tokenize
+
+
+WORD_PATTERN = re.compile(r'\w+')
+SHINGLE_SIZE = 3
+# Меньше этого остатка бюджета документ не обрезается, а отбрасывается
+MIN_TRIMMED_TOKENS = 32
+TRIM_MARKER = '…'
+DOCUMENT_ID_LENGTH = 16
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…;])\s+|\n+')
+GAP_MARKER = f' {TRIM_MARKER} '
+
+
+def estimate_tokens(text: str) -> int:
+    '''Локальная оценка числа токенов по длине текста.'''
+    if not text:
+        return 0
+    return math.ceil(len(text) / settings.rag_context_chars_per_token)
+
+
+def _shingles(text: str) -> frozenset:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return frozenset((tuple(words),))
+    return frozenset(
+        tuple(words[idx:idx + SHINGLE_SIZE])
+        for idx in range(len(words) - SHINGLE_SIZE + 1)
+    )
+
+
+def _similarity(first: frozenset, second: frozenset) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def document_id(content: str) -> str:
+    '''Идентификатор документа - хеш его содержимого.'''
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    return digest[:DOCUMENT_ID_LENGTH]
+
+
+def select_metadata(metadata: Any) -> Dict[str, Any]:
+    '''Метаданные без шумных ключей и пустых значений.'''
+    if not isinstance(metadata, dict):
+        return {'value': str(metadata)} if metadata else {}
+    dropped = set(settings.rag_context_drop_metadata_keys)
+    return {
+        key: value
+        for key, value in metadata.items()
+        if key not in dropped and value not in (None, '', [], {})
+    }
+
+
+def _format_metadata(metadata: Any) -> str:
+    if not isinstance(metadata, dict):
+        return str(metadata) if metadata else ''
+    return '; '.join(
+        f'{key}: {value}'
+        for key, value in select_metadata(metadata).items()
+    )
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    '''Обрезка текста по границе слова до бюджета в токенах.'''
+    max_chars = int(max_tokens * settings.rag_context_chars_per_token)
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max(max_chars - len(TRIM_MARKER), 0)]
+    # Не обрываем текст посреди слова
+    space = cut.rfind(' ')
+    if space > 0:
+        cut = cut[:space]
+    return cut.rstrip() + TRIM_MARKER
+
+
+def split_sentences(text: str) -> list[str]:
+    return [
+        sentence.strip()
+        for sentence in SENTENCE_BOUNDARY.split(text)
+        if sentence.strip()
+    ]
+
+
+def query_terms(query: str) -> dict[str, int]:
+    '''Битовые маски основ значимых слов запроса.'''
+    terms: dict[str, int] = {}
+    for term in tokenize(query):
+        terms.setdefault(term, 1 << len(terms))
+    return terms
+
+
+def sentence_mask(sentence: str, terms: dict[str, int]) -> int:
+    '''Битовый вектор слов запроса, встречающихся в предложении.'''
+    mask = 0
+    for token in tokenize(sentence):
+        mask |= terms.get(token, 0)
+    return mask
+
+
+def _render_spans(sentences: list[str], spans: list[tuple[int, int]]) -> str:
+    parts = []
+    previous_end = 0
+    for start, end in sorted(spans):
+        if start > previous_end:
+            parts.append(GAP_MARKER if parts else f'{TRIM_MARKER} ')
+        elif parts:
+            parts.append(' ')
+        parts.append(' '.join(sentences[start:end]))
+        previous_end = end
+    if previous_end < len(sentences):
+        parts.append(f' {TRIM_MARKER}')
+    return ''.join(parts)
+
+
+def _overlaps(span: tuple[int, int], spans: list[tuple[int, int]]) -> bool:
+    return any(span[0] < end and start < span[1] for start, end in spans)
+
+
+def extract_snippets(
+    text: str,
+    query: str,
+    max_tokens: int,
+    window: int | None = None,
+) -> str:
+    '''
+    Окна предложений текста, покрывающие слова запроса.
+
+    Каждое предложение кодируется битовым вектором совпавших слов
+    запроса, окно из window соседних предложений - объединением векторов
+    своих предложений. Окна выбираются жадно по числу еще не покрытых
+    слов запроса (popcount), при равенстве - по числу совпадений, пока
+    новые окна добавляют слова и результат укладывается в max_tokens.
+    Окна выводятся в порядке документа с маркером пропуска между ними.
+    Если текст укладывается в бюджет или не содержит слов запроса,
+    работает обычная обрезка.
+    '''
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    window = max(window or settings.rag_snippet_window_sentences, 1)
+    terms = query_terms(query)
+    sentences = split_sentences(text)
+    masks = [sentence_mask(sentence, terms) for sentence in sentences]
+    if not any(masks):
+        return trim_to_tokens(text, max_tokens)
+
+    windows = []
+    for start in range(len(sentences)):
+        end = min(start + window, len(sentences))
+        union = hits = 0
+        for mask in masks[start:end]:
+            union |= mask
+            hits += mask.bit_count()
+        if hits:
+            windows.append((start, end, union, hits))
+
+    spans: list[tuple[int, int]] = []
+    covered = 0
+    while windows:
+        best = max(windows, key=lambda item: (
+            (item[2] & ~covered).bit_count(), item[3], -item[0]
+        ))
+        start, end, union, _ = best
+        if spans and not union & ~covered:
+            break
+        windows.remove(best)
+        if _overlaps((start, end), spans):
+            continue
+        snippet = _render_spans(sentences, spans + [(start, end)])
+        if estimate_tokens(snippet) <= max_tokens:
+            spans.append((start, end))
+            covered |= union
+        elif not spans:
+            # Даже лучшее окно не помещается в бюджет
+            return trim_to_tokens(' '.join(sentences[start:end]), max_tokens)
+    return _render_spans(sentences, spans)
+
+
+def deduplicate(results: list[Dict[str, Any]]) -> list[Dict[str, Any]]:
+    '''Удаляет почти одинаковые фрагменты, сохраняя порядок выдачи.'''
+    threshold = settings.rag_context_dedup_threshold
+    kept: list[Dict[str, Any]] = []
+    kept_shingles: list[frozenset] = []
+    for el in results:
+        shingles = _shingles(el.get('content', '') or '')
+        if any(
+            _similarity(shingles, other) >= threshold
+            for other in kept_shingles
+        ):
+            continue
+        kept.append(el)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def pack_documents(
+    retrieve_result: Dict[str, Any],
+    query: str | None = None,
+) -> list[Dict[str, Any]]:
+    '''
+    Собирает структурированный контекст из ответа Managed RAG.
+
+    Каждый документ содержит id (хеш содержимого), score, фрагмент
+    content не длиннее rag_document_preview_tokens, отобранные
+    метаданные и полный текст body. Если передан query и включен
+    rag_snippets_enabled, фрагмент составляется из относящихся к
+    запросу предложений (extract_snippets), иначе это начало текста.
+    Фрагменты вместе укладываются в бюджет rag_context_max_tokens. Поле
+    body не отдается клиенту: сервер кладет его в хранилище документов
+    (см. public_documents).
+    '''
+    max_tokens = settings.rag_context_max_tokens
+    preview_tokens = settings.rag_document_preview_tokens
+    used_tokens = 0
+    documents: list[Dict[str, Any]] = []
+
+    for el in deduplicate(retrieve_result.get('results', [])):
+        body = el.get('content', '') or ''
+        metadata = select_metadata(el.get('metadata', {}))
+        budget = preview_tokens
+        if max_tokens > 0:
+            remaining = (
+                max_tokens - used_tokens
+                - estimate_tokens(_format_metadata(metadata))
+            )
+            if remaining < min(MIN_TRIMMED_TOKENS, estimate_tokens(body)):
+                break
+            budget = min(budget, remaining) if budget > 0 else remaining
+        if budget <= 0:
+            content = body
+        elif query and settings.rag_snippets_enabled:
+            content = extract_snippets(body, query, budget)
+        else:
+            content = trim_to_tokens(body, budget)
+        documents.append({
+            'id': document_id(body),
+            'score': el.get('score'),
+            'content': content,
+            'metadata': metadata,
+            'body': body,
+        })
+        used_tokens += estimate_tokens(content) + estimate_tokens(
+            _format_metadata(metadata)
+        )
+
+    return documents
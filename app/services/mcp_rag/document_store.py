@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from typing import Any, Dict
+
+from app.core.config import settings
+
+
+class DocumentStore:
+    '''
+    Полные тексты документов по хешу содержимого.
+
+    Инструмент отдает клиенту только фрагменты документов, полный текст
+    клиент читает ресурсом rag://documents/{id}. Одинаковые документы
+    из выдачи разных запросов хранятся один раз, давно не
+    использованные вытесняются при превышении max_bytes.
+    '''
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._documents: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def put(self, doc_id: str, body: str) -> None:
+        if doc_id in self._documents:
+            self._documents.move_to_end(doc_id)
+            return
+        self._documents[doc_id] = body
+        self._size += len(body.encode('utf-8'))
+        while self._size > self.max_bytes and len(self._documents) > 1:
+            _, evicted = self._documents.popitem(last=False)
+            self._size -= len(evicted.encode('utf-8'))
+
+    def get(self, doc_id: str) -> str | None:
+        body = self._documents.get(doc_id)
+        if body is not None:
+            self._documents.move_to_end(doc_id)
+        return body
+
+    def clear(self) -> None:
+        self._documents.clear()
+        self._size = 0
+
+
+def public_documents(
+    documents: list[Dict[str, Any]],
+    store: DocumentStore,
+) -> list[Dict[str, Any]]:
+    '''
+    Сохраняет полные тексты в store и возвращает документы без них.
+    '''
+    public = []
+    for document in documents:
+        document = dict(document)
+        body = document.pop('body', None)
+        if body is not None:
+            store.put(document['id'], body)
+        public.append(document)
+    return public
+
+
+document_store = DocumentStore(
+    max_bytes=settings.rag_document_store_max_bytes,
+)
@@ -0,0 +1,225 @@
+'''
+Локальная замена auth и retrieve API Evolution Managed RAG.
+
+Позволяет нагружать MCP RAG сервер без обращения к реальному API.
+Запуск:
+
+    python -m app.services.mcp_rag.fake_rag_server --port 8010 \
+        --latency-median 0.15 --latency-p99 0.8 --error-rate 0.01
+
+MCP сервер направляется на заглушку переменными окружения:
+
+    AUTH_URL=http://localhost:8010/token
+    RETRIEVE_URL_TEMPLATE=http://localhost:8010/retrieve
+'''
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import secrets
+import time
+
+from fastapi import FastAPI, Form, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+import uvicorn
+
+
+# z-оценка 99-го перцентиля нормального распределения
+Z_99 = 2.326
+
+FILLER_WORDS = (
+    'гарантия', 'автомобиль', 'дилер', 'ремонт', 'запчасть', 'сервис',
+    'обслуживание', 'клиент', 'регламент', 'срок', 'условие', 'документ',
+    'заявка', 'поддержка', 'пробег', 'деталь', 'проверка', 'отчет',
+)
+
+
+class FakeRagConfig(BaseModel):
+    '''Параметры поведения заглушки Managed RAG.'''
+
+    latency_median: float = 0.1
+    latency_p99: float = 0.1
+    auth_latency: float = 0.05
+    error_rate: float = 0.0
+    error_status: int = 503
+    unauthorized_rate: float = 0.0
+    token_ttl: int = 3600
+    documents: int = 6
+    document_chars: int = 1200
+    seed: int | None = None
+
+
+class FakeRagStats(BaseModel):
+    '''Счетчики обращений к заглушке.'''
+
+    auth_requests: int = 0
+    retrieve_requests: int = 0
+    unauthorized: int = 0
+    errors: int = 0
+
+
+def sample_latency(config: FakeRagConfig, rng: random.Random) -> float:
+    '''Задержка из логнормального распределения с заданными p50 и p99.'''
+    if config.latency_median <= 0:
+        return 0.0
+    if config.latency_p99 <= config.latency_median:
+        return config.latency_median
+    sigma = math.log(config.latency_p99 / config.latency_median) / Z_99
+    return rng.lognormvariate(math.log(config.latency_median), sigma)
+
+
+def make_documents(query: str, config: FakeRagConfig, limit: int) -> list:
+    '''Детерминированные документы: одинаковый запрос - одинаковый ответ.'''
+    documents = []
+    for idx in range(min(limit, config.documents)):
+        digest = hashlib.sha256(f'{query}:{idx}'.encode('utf-8')).digest()
+        doc_rng = random.Random(digest)
+        words = [query]
+        length = len(query)
+        while length < config.document_chars:
+            word = doc_rng.choice(FILLER_WORDS)
+            words.append(word)
+            length += len(word) + 1
+        documents.append({
+            'content': ' '.join(words)[:config.document_chars],
+            'metadata': {
+                'source': f'document_{digest.hex()[:8]}.pdf',
+                'page': idx + 1,
+                'chunk_id': digest.hex()[:16],
+            },
+            'score': round(1 - idx * 0.05, 3),
+        })
+    return documents
+
+
+def create_fake_rag_app(config: FakeRagConfig | None = None) -> FastAPI:
+    config = config or FakeRagConfig()
+    rng = random.Random(config.seed)
+    tokens: dict[str, float] = {}
+    app = FastAPI(title='Fake Evolution Managed RAG')
+    app.state.config = config
+    app.state.stats = FakeRagStats()
+
+    @app.post('/token')
+    async def issue_token(
+        grant_type: str = Form(...),
+        client_id: str = Form(...),
+        client_secret: str = Form(...),
+    ):
+        app.state.stats.auth_requests += 1
+        await asyncio.sleep(config.auth_latency)
+        token = secrets.token_hex(16)
+        tokens[token] = time.monotonic() + config.token_ttl
+        return {
+            'access_token': token,
+            'token_type': 'Bearer',
+            'expires_in': config.token_ttl,
+        }
+
+    @app.post('/retrieve')
+    async def retrieve(
+        request: Request,
+        authorization: str = Header(default=''),
+    ):
+        stats = app.state.stats
+        stats.retrieve_requests += 1
+        payload = await request.json()
+        await asyncio.sleep(sample_latency(config, rng))
+
+        token = authorization.removeprefix('Bearer ')
+        expires_at = tokens.get(token)
+        if (
+            expires_at is None
+            or time.monotonic() >= expires_at
+            or rng.random() < config.unauthorized_rate
+        ):
+            stats.unauthorized += 1
+            return PlainTextResponse('Unauthorized', status_code=401)
+        if rng.random() < config.error_rate:
+            stats.errors += 1
+            return PlainTextResponse(
+                'Injected upstream error', status_code=config.error_status
+            )
+
+        return JSONResponse({
+            'results': make_documents(
+                payload.get('query', ''),
+                config,
+                int(payload.get('retrieve_limit', config.documents)),
+            )
+        })
+
+    @app.get('/stats')
+    async def get_stats():
+        return app.state.stats
+
+    @app.post('/stats/reset')
+    async def reset_stats():
+        app.state.stats = FakeRagStats()
+        return app.state.stats
+
+    return app
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = FakeRagConfig()
+    parser = argparse.ArgumentParser(
+        description='Заглушка auth и retrieve API Managed RAG'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8010)
+    parser.add_argument(
+        '--latency-median', type=float, default=defaults.latency_median,
+        help='Медианная задержка retrieve, с',
+    )
+    parser.add_argument(
+        '--latency-p99', type=float, default=defaults.latency_p99,
+        help='99-й перцентиль задержки retrieve, с',
+    )
+    parser.add_argument(
+        '--auth-latency', type=float, default=defaults.auth_latency,
+        help='Задержка выдачи токена, с',
+    )
+    parser.add_argument(
+        '--error-rate', type=float, default=defaults.error_rate,
+        help='Доля ответов retrieve с ошибкой',
+    )
+    parser.add_argument(
+        '--error-status', type=int, default=defaults.error_status,
+        help='HTTP статус внедряемой ошибки',
+    )
+    parser.add_argument(
+        '--unauthorized-rate', type=float,
+        default=defaults.unauthorized_rate,
+        help='Доля ответов retrieve с 401 при валидном токене',
+    )
+    parser.add_argument(
+        '--token-ttl', type=int, default=defaults.token_ttl,
+        help='Срок жизни токена (expires_in), с',
+    )
+    parser.add_argument(
+        '--documents', type=int, default=defaults.documents,
+        help='Максимум документов в ответе',
+    )
+    parser.add_argument(
+        '--document-chars', type=int, default=defaults.document_chars,
+        help='Размер документа в символах',
+    )
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    fake_config = FakeRagConfig(**{
+        name: value for name, value in vars(args).items()
+        if name in FakeRagConfig.model_fields
+    })
+    uvicorn.run(
+        create_fake_rag_app(fake_config),
+        host=args.host,
+        port=args.port,
+        log_level='warning',
+    )
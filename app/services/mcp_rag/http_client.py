@@ -0,0 +1,88 @@
+from importlib.util import find_spec
+
+import httpx
+
+from app.core.config import settings
+from app.logging import logging_config
+
+
+class RagHttpClient:
+    '''
+    Долгоживущий пул HTTP-соединений к Evolution Managed RAG.
+
+    Один httpx.AsyncClient переиспользуется всеми вызовами инструментов,
+    поэтому TCP+TLS рукопожатие выполняется один раз на соединение,
+    а не на каждый запрос.
+    '''
+
+    def __init__(self):
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def auth_timeout(self) -> httpx.Timeout:
+        return self._build_timeout(settings.rag_auth_timeout)
+
+    @property
+    def retrieve_timeout(self) -> httpx.Timeout:
+        return self._build_timeout(settings.rag_retrieve_timeout)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        '''
+        Возвращает общий клиент.
+
+        Обычно клиент создается в lifespan сервера, но при вызове
+        инструмента вне lifespan (например, из тестов) он будет
+        создан лениво.
+        '''
+        if self._client is None or self._client.is_closed:
+            self.start()
+        return self._client
+
+    def start(self) -> httpx.AsyncClient:
+        '''Создает клиент с настроенными лимитами пула.'''
+        if self._client is not None and not self._client.is_closed:
+            return self._client
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.rag_http_max_connections,
+                max_keepalive_connections=(
+                    settings.rag_http_max_keepalive_connections
+                ),
+                keepalive_expiry=settings.rag_http_keepalive_expiry,
+            ),
+            timeout=self._build_timeout(settings.rag_retrieve_timeout),
+            http2=self._http2_enabled(),
+        )
+        return self._client
+
+    async def aclose(self) -> None:
+        '''Закрывает клиент и все соединения пула.'''
+        if self._client is None:
+            return
+        try:
+            await self._client.aclose()
+        finally:
+            self._client = None
+
+    @staticmethod
+    def _build_timeout(total: float) -> httpx.Timeout:
+        return httpx.Timeout(
+            total,
+            connect=min(settings.rag_connect_timeout, total)
+        )
+
+    @staticmethod
+    def _http2_enabled() -> bool:
+        if not settings.rag_http2:
+            return False
+        if find_spec('h2') is None:
+            logging_config.get_endpoint_logger('mcp_rag_server').warning(
+                'rag_http2 включен, но пакет h2 не установлен; '
+                'используется HTTP/1.1'
+            )
+            return False
+        return True
+
+
+rag_http_client = RagHttpClient()
@@ -0,0 +1,284 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+import tempfile
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка файла недоступна
+    fcntl = None
+
+from app.core.config import settings
+from app.services.mcp_rag.russian_text import tokenize
+
+
+@dataclass
+class IndexedDocument:
+    content: str
+    metadata: dict
+    terms: dict[str, int]
+    length: int
+    size: int
+
+
+class LexicalIndex:
+    '''
+    Локальный BM25 индекс по документам, полученным из Managed RAG.
+
+    Документы добавляются инкрементально по мере ответов upstream и
+    вытесняются по суммарному размеру содержимого (давно не
+    встречавшиеся первыми). Индекс отвечает, когда Managed RAG
+    недоступен или отвечает слишком долго, и может сам отвечать на
+    запросы, которые покрывает с высокой уверенностью.
+    '''
+
+    def __init__(self, max_bytes: int, k1: float = 1.5, b: float = 0.75):
+        self.max_bytes = max_bytes
+        self.k1 = k1
+        self.b = b
+        self._documents: OrderedDict[str, IndexedDocument] = OrderedDict()
+        self._postings: dict[str, dict[str, int]] = {}
+        self._total_length = 0
+        self.size = 0
+        self._kb_version = settings.knowledge_base_version_id
+        self._save_lock = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @staticmethod
+    def document_id(content: str) -> str:
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def clear(self) -> None:
+        self._documents.clear()
+        self._postings.clear()
+        self._total_length = 0
+        self.size = 0
+
+    def add(self, results: list[dict]) -> int:
+        '''
+        Добавляет документы из ответа retrieve.
+
+        Returns:
+            Количество новых документов.
+        '''
+        self._check_kb_version()
+        added = 0
+        for result in results:
+            content = (result.get('content') or '').strip()
+            if not content:
+                continue
+            doc_id = self.document_id(content)
+            if doc_id in self._documents:
+                self._documents.move_to_end(doc_id)
+                continue
+            self._index(doc_id, content, result.get('metadata') or {})
+            added += 1
+        self._evict()
+        return added
+
+    def term_share(self, term: str) -> float:
+        '''Доля документов индекса, содержащих основу слова term.'''
+        self._check_kb_version()
+        if not self._documents:
+            return 0.0
+        return len(self._postings.get(term, ())) / len(self._documents)
+
+    def search(self, query: str, limit: int) -> list[tuple[float, dict]]:
+        '''
+        Ищет документы по BM25.
+
+        Returns:
+            Пары (оценка, документ) по убыванию оценки. Оценка нормирована
+            на оценку документа средней длины, содержащего каждый термин
+            запроса один раз, и ограничена сверху единицей.
+        '''
+        self._check_kb_version()
+        query_terms = set(tokenize(query))
+        if not query_terms or not self._documents:
+            return []
+        avg_length = self._total_length / len(self._documents)
+        ideal = 0.0
+        scores: dict[str, float] = {}
+        for term in query_terms:
+            postings = self._postings.get(term, {})
+            idf = self._idf(len(postings))
+            ideal += idf
+            for doc_id, tf in postings.items():
+                norm = 1 - self.b + self.b * (
+                    self._documents[doc_id].length / avg_length
+                )
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * (
+                    tf * (self.k1 + 1) / (tf + self.k1 * norm)
+                )
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        normalized = [
+            (doc_id, min(score / ideal, 1.0)) for doc_id, score in ranked
+        ]
+        return [
+            (score, self._as_result(doc_id, score))
+            for doc_id, score in normalized
+        ]
+
+    def answer(
+        self,
+        query: str,
+        limit: int,
+        min_score: float,
+    ) -> dict[str, Any] | None:
+        '''
+        Результат в формате ответа retrieve или None, если ни один
+        документ не набрал min_score.
+        '''
+        results = [
+            document for score, document in self.search(query, limit)
+            if score >= min_score
+        ]
+        if not results:
+            return None
+        return {'results': results}
+
+    async def load(self, path: str | None) -> None:
+        '''
+        Загружает документы, сохраненные для текущей версии базы.
+
+        Процесс, первым загрузивший индекс, становится владельцем
+        файла: при нескольких worker процессах сохраняет индекс только он.
+        '''
+        if path is None:
+            return
+        await asyncio.to_thread(self._claim_save, path)
+        if not Path(path).exists():
+            return
+        data = await asyncio.to_thread(self._read, path)
+        if data.get('kb_version') != settings.knowledge_base_version_id:
+            return
+        self.add(data.get('documents', []))
+
+    async def save(self, path: str | None) -> None:
+        '''
+        Сохраняет индекс, если файлом не владеет другой процесс.
+        '''
+        if path is None:
+            return
+        if not await asyncio.to_thread(self._claim_save, path):
+            return
+        data = {
+            'kb_version': self._kb_version,
+            'documents': [
+                {'content': doc.content, 'metadata': doc.metadata}
+                for doc in self._documents.values()
+            ],
+        }
+        try:
+            await asyncio.to_thread(self._write, path, data)
+        finally:
+            self._release_save()
+
+    def _claim_save(self, path: str) -> bool:
+        '''Захватывает блокировку сохранения, если она свободна.'''
+        if fcntl is None or self._save_lock is not None:
+            return True
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        lock = open(f'{path}.lock', 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._save_lock = lock
+        return True
+
+    def _release_save(self) -> None:
+        if self._save_lock is not None:
+            # Закрытие файла снимает блокировку
+            self._save_lock.close()
+            self._save_lock = None
+
+    @staticmethod
+    def _read(path: str) -> dict:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+
+    @staticmethod
+    def _write(path: str, data: dict) -> None:
+        directory = Path(path).parent
+        directory.mkdir(parents=True, exist_ok=True)
+        # Уникальный временный файл в том же каталоге: одновременные
+        # сохранения не пишут в один файл, а os.replace остается
+        # атомарным в пределах файловой системы
+        file = tempfile.NamedTemporaryFile(
+            'w', encoding='utf-8', dir=directory,
+            prefix=f'{Path(path).name}.', suffix='.tmp', delete=False,
+        )
+        try:
+            with file:
+                json.dump(data, file, ensure_ascii=False)
+            # Атомарная замена: другие процессы не увидят файл частично
+            os.replace(file.name, path)
+        except BaseException:
+            Path(file.name).unlink(missing_ok=True)
+            raise
+
+    def _idf(self, document_frequency: int) -> float:
+        count = len(self._documents)
+        return math.log(
+            1 + (count - document_frequency + 0.5)
+            / (document_frequency + 0.5)
+        )
+
+    def _index(self, doc_id: str, content: str, metadata: dict) -> None:
+        terms: dict[str, int] = {}
+        for term in tokenize(content):
+            terms[term] = terms.get(term, 0) + 1
+        length = sum(terms.values())
+        size = len(content.encode('utf-8'))
+        self._documents[doc_id] = IndexedDocument(
+            content=content,
+            metadata=metadata,
+            terms=terms,
+            length=length,
+            size=size,
+        )
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._total_length += length
+        self.size += size
+
+    def _remove(self, doc_id: str) -> None:
+        document = self._documents.pop(doc_id)
+        for term in document.terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= document.length
+        self.size -= document.size
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes and self._documents:
+            self._remove(next(iter(self._documents)))
+
+    def _as_result(self, doc_id: str, score: float) -> dict:
+        document = self._documents[doc_id]
+        return {
+            'content': document.content,
+            'metadata': document.metadata,
+            'score': round(score, 3),
+        }
+
+    def _check_kb_version(self) -> None:
+        '''Очищает индекс при смене версии базы знаний.'''
+        if self._kb_version != settings.knowledge_base_version_id:
+            self.clear()
+            self._kb_version = settings.knowledge_base_version_id
+
+
+lexical_index = LexicalIndex(max_bytes=settings.rag_lexical_index_max_bytes)
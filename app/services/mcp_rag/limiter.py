@@ -0,0 +1,133 @@
+import asyncio
+from contextlib import asynccontextmanager
+import time
+from typing import Any, AsyncIterator
+
+from app.core.config import settings
+from app.services.mcp_rag.metrics import stage_duration
+
+
+class OverloadedError(RuntimeError):
+    '''Очередь к Managed RAG переполнена или ожидание слишком долгое.'''
+
+
+class TokenBucket:
+    '''Ограничение частоты запросов по алгоритму token bucket.'''
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def take(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated_at) * self.rate,
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class UpstreamLimiter:
+    '''
+    Ограничивает одновременные запросы к Managed RAG и их частоту.
+
+    Запросы сверх лимита ждут в очереди ограниченного размера. Если
+    очередь заполнена или ожидание дольше queue_timeout, запрос
+    отклоняется с OverloadedError.
+    '''
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        rate: float,
+        burst: int,
+        max_queue: int,
+        queue_timeout: float,
+    ):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(rate, burst)
+        self.active = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.rejected = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[None]:
+        if self.waiting >= self.max_queue and self._semaphore.locked():
+            self.rejected += 1
+            raise OverloadedError(
+                'Не удалось получить релевантные документы. '
+                'Сервер перегружен, повторите запрос позже'
+            )
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(
+                self._wait_for_slot(), timeout=self.queue_timeout
+            )
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise OverloadedError(
+                'Не удалось получить релевантные документы. '
+                'Превышено время ожидания в очереди к Managed RAG'
+            )
+        finally:
+            self.waiting -= 1
+        queue_time = time.monotonic() - started
+        stage_duration.observe(queue_time, stage='queue')
+        self.queue_time_total += queue_time
+        self.queue_time_max = max(self.queue_time_max, queue_time)
+        self.acquired += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'acquired': self.acquired,
+            'rejected': self.rejected,
+            'queue_time_avg': (
+                self.queue_time_total / self.acquired
+                if self.acquired else 0.0
+            ),
+            'queue_time_max': self.queue_time_max,
+        }
+
+    async def _wait_for_slot(self) -> None:
+        await self._semaphore.acquire()
+        try:
+            await self._bucket.take()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+
+upstream_limiter = UpstreamLimiter(
+    max_concurrency=settings.rag_upstream_max_concurrency,
+    rate=settings.rag_upstream_rate_limit,
+    burst=settings.rag_upstream_rate_burst,
+    max_queue=settings.rag_upstream_max_queue,
+    queue_timeout=settings.rag_upstream_queue_timeout,
+)
@@ -0,0 +1,301 @@
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+import math
+import time
+from typing import Callable, Iterator
+
+
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+    20.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            key,
+            str(value)
+            .replace('\\', '\\\\')
+            .replace('"', '\\"')
+            .replace('\n', '\\n'),
+        )
+        for key, value in labels.items()
+    )
+    return f'{{{pairs}}}'
+
+
+class Metric:
+    '''Базовый класс метрики с именем, описанием и метками.'''
+
+    kind = 'untyped'
+    # Окончание имени семейства в экспорте, например _total у счетчиков
+    family_suffix = ''
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f'Метрика {self.name} ожидает метки {self.labelnames}, '
+                f'получены {tuple(labels)}'
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...]) -> dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        raise NotImplementedError
+
+    @property
+    def family(self) -> str:
+        return f'{self.name}{self.family_suffix}'
+
+    def render(self) -> str:
+        # HELP, TYPE и значения счетчика идут под одним именем
+        # name_total, как в текстовом формате prometheus_client
+        lines = [
+            f'# HELP {self.family} {self.documentation}',
+            f'# TYPE {self.family} {self.kind}',
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(
+                f'{self.family}{suffix}{_format_labels(labels)} '
+                f'{_format_value(value)}'
+            )
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+    family_suffix = '_total'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        self._values[self._key(labels)] += amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield '', self._labels(key), value
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        self._values[self._key(labels)] += amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self._values[self._key(labels)] -= amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield '', self._labels(key), value
+
+
+class CallbackGauge(Metric):
+    '''Gauge, значение которого вычисляется при каждом экспорте.'''
+
+    kind = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], float],
+    ):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def samples(self):
+        yield '', {}, float(self.callback())
+
+
+class CallbackCounter(CallbackGauge):
+    '''
+    Counter, значение которого вычисляется при каждом экспорте.
+
+    Для монотонных счетчиков, которые ведет сам компонент (отклоненные
+    запросы, объединенные вызовы и т.п.).
+    '''
+
+    kind = 'counter'
+    family_suffix = '_total'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (счетчики по корзинам, сумма, количество)
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = [[0] * len(self.buckets), 0.0, 0]
+            self._values[key] = state
+        idx = bisect_left(self.buckets, value)
+        if idx < len(self.buckets):
+            state[0][idx] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        for key, (counts, total, count) in sorted(self._values.items()):
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (
+                    '_bucket',
+                    {**labels, 'le': _format_value(bound)},
+                    cumulative,
+                )
+            yield '_bucket', {**labels, 'le': '+Inf'}, count
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+
+class MetricsRegistry:
+    '''Реестр метрик процесса с экспортом в текстовом формате Prometheus.'''
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        '''Регистрирует метрику; метрика с тем же именем заменяется.'''
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def gauge_callback(self, name, documentation, callback) -> CallbackGauge:
+        return self.register(CallbackGauge(name, documentation, callback))
+
+    def counter_callback(
+        self, name, documentation, callback
+    ) -> CallbackCounter:
+        return self.register(CallbackCounter(name, documentation, callback))
+
+    def histogram(
+        self,
+        name,
+        documentation,
+        labelnames=(),
+        buckets=DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(
+            Histogram(name, documentation, labelnames, buckets)
+        )
+
+    def render(self) -> str:
+        return '\n'.join(
+            metric.render() for metric in self._metrics.values()
+        ) + '\n'
+
+
+registry = MetricsRegistry()
+
+stage_duration = registry.histogram(
+    'rag_stage_duration_seconds',
+    'Длительность этапов обработки request_to_rag',
+    labelnames=('stage',),
+)
+tool_duration = registry.histogram(
+    'rag_tool_duration_seconds',
+    'Полное время получения контекста для запроса',
+    labelnames=('cache',),
+)
+upstream_responses = registry.counter(
+    'rag_upstream_responses',
+    'Ответы Managed RAG retrieve по статусу',
+    labelnames=('status',),
+)
+token_refreshes = registry.counter(
+    'rag_token_refreshes',
+    'Запросы access token к auth API',
+    labelnames=('result',),
+)
+tool_calls_in_flight = registry.gauge(
+    'rag_tool_calls_in_flight',
+    'Выполняющиеся вызовы инструментов получения контекста',
+)
+lexical_answers = registry.counter(
+    'rag_lexical_answers',
+    'Ответы из локального BM25 индекса по причине',
+    labelnames=('reason',),
+)
+partial_results = registry.counter(
+    'rag_partial_results',
+    'Объединенные выдачи, в которые не вошла часть баз знаний',
+)
@@ -0,0 +1,197 @@
+import asyncio
+import json
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from app.core.config import settings
+
+
+# Версия формата значений: записи других версий удаляются при открытии
+SCHEMA_VERSION = 2
+
+
+class PersistentRetrievalCache:
+    '''
+    Кэш результатов request_to_rag в SQLite файле.
+
+    Записи привязаны к knowledge_base_version_id, вытесняются по
+    суммарному размеру (давно не использованные первыми) и при старте
+    самые популярные из них загружаются в кэш в памяти.
+    '''
+
+    def __init__(
+        self,
+        path: str | None,
+        max_bytes: int,
+        ttl: float,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._connection is not None
+
+    @staticmethod
+    def serialize_key(key: tuple) -> str:
+        return json.dumps(list(key), ensure_ascii=False)
+
+    async def open(self) -> None:
+        if self.path is None or self._connection is not None:
+            return
+        await asyncio.to_thread(self._open)
+
+    async def close(self) -> None:
+        if self._connection is None:
+            return
+        with self._lock:
+            self._connection.close()
+            self._connection = None
+
+    async def get(self, key: tuple) -> tuple[Any, float] | None:
+        '''Возвращает значение и время его записи (time.time()).'''
+        if self._connection is None:
+            return None
+        return await asyncio.to_thread(self._get, self.serialize_key(key))
+
+    async def set(self, key: tuple, value: Any) -> None:
+        if self._connection is None:
+            return
+        await asyncio.to_thread(self._set, self.serialize_key(key), value)
+
+    async def hottest(
+        self, limit: int
+    ) -> list[tuple[tuple, Any, float]]:
+        '''
+        Возвращает самые часто запрашиваемые актуальные записи:
+        ключ, значение и время записи.
+        '''
+        if self._connection is None or limit <= 0:
+            return []
+        rows = await asyncio.to_thread(self._hottest, limit)
+        return [
+            (tuple(json.loads(key)), json.loads(value), created_at)
+            for key, value, created_at in rows
+        ]
+
+    def _open(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS retrieval_cache ('
+            'key TEXT PRIMARY KEY, '
+            'kb_version TEXT NOT NULL, '
+            'value TEXT NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'hits INTEGER NOT NULL DEFAULT 0, '
+            'created_at REAL NOT NULL, '
+            'accessed_at REAL NOT NULL)'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS retrieval_cache_accessed '
+            'ON retrieval_cache (accessed_at)'
+        )
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            connection.execute('DELETE FROM retrieval_cache')
+            connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            connection.commit()
+        with self._lock:
+            self._connection = connection
+            self._purge_locked()
+
+    def _get(self, key: str) -> tuple[Any, float] | None:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value, created_at FROM retrieval_cache '
+                'WHERE key = ? AND kb_version = ? AND created_at > ?',
+                (key, settings.knowledge_base_version_id, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                'UPDATE retrieval_cache '
+                'SET hits = hits + 1, accessed_at = ? WHERE key = ?',
+                (now, key),
+            )
+            self._connection.commit()
+        return json.loads(row[0]), row[1]
+
+    def _set(self, key: str, value: Any) -> None:
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._connection.execute(
+                'INSERT INTO retrieval_cache '
+                '(key, kb_version, value, size, hits, '
+                'created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, 0, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET '
+                'kb_version = excluded.kb_version, '
+                'value = excluded.value, '
+                'size = excluded.size, '
+                'created_at = excluded.created_at, '
+                'accessed_at = excluded.accessed_at',
+                (
+                    key,
+                    settings.knowledge_base_version_id,
+                    payload,
+                    len(payload.encode('utf-8')),
+                    now,
+                    now,
+                ),
+            )
+            self._evict_locked()
+            self._connection.commit()
+
+    def _hottest(self, limit: int) -> list[tuple[str, str, float]]:
+        with self._lock:
+            self._purge_locked()
+            return self._connection.execute(
+                'SELECT key, value, created_at FROM retrieval_cache '
+                'ORDER BY hits DESC, accessed_at DESC LIMIT ?',
+                (limit,),
+            ).fetchall()
+
+    def _purge_locked(self) -> None:
+        '''Удаляет записи другой версии базы знаний и просроченные.'''
+        self._connection.execute(
+            'DELETE FROM retrieval_cache '
+            'WHERE kb_version != ? OR created_at <= ?',
+            (settings.knowledge_base_version_id, time.time() - self.ttl),
+        )
+        self._connection.commit()
+
+    def _evict_locked(self) -> None:
+        total_size = self._connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM retrieval_cache'
+        ).fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        rows = self._connection.execute(
+            'SELECT key, size FROM retrieval_cache ORDER BY accessed_at'
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if total_size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total_size -= size
+        self._connection.executemany(
+            'DELETE FROM retrieval_cache WHERE key = ?', evicted
+        )
+
+
+persistent_cache = PersistentRetrievalCache(
+    path=settings.rag_persistent_cache_path,
+    max_bytes=settings.rag_persistent_cache_max_bytes,
+    ttl=settings.rag_persistent_cache_ttl,
+)
@@ -0,0 +1,88 @@
+'''
+Канонизация запросов для ключей кэша.
+
+Один и тот же вопрос пользователи пишут с разным регистром,
+пунктуацией, пробелами и "ё"/"е". Канонизация сводит такие варианты к
+одному ключу, поэтому они попадают в одну запись кэша. Сам запрос к
+Managed RAG по-прежнему отправляется в исходном виде.
+'''
+from functools import lru_cache
+from importlib.util import find_spec
+import unicodedata
+
+from app.core.config import settings
+from app.logging import logging_config
+from app.services.mcp_rag.russian_text import STOPWORDS, stem
+
+
+def unicode_normalize(text: str) -> str:
+    '''NFKC: совместимые символы и составные буквы к единой форме.'''
+    return unicodedata.normalize('NFKC', text)
+
+
+def casefold(text: str) -> str:
+    return text.casefold().replace('ё', 'е')
+
+
+def strip_punctuation(text: str) -> str:
+    '''Заменяет знаки препинания и символы пробелами.'''
+    return ''.join(
+        ' ' if unicodedata.category(char)[0] in 'PS' else char
+        for char in text
+    )
+
+
+def collapse_whitespace(text: str) -> str:
+    return ' '.join(text.split())
+
+
+@lru_cache(maxsize=1)
+def _morph_analyzer():
+    '''Анализатор pymorphy3, если пакет установлен, иначе None.'''
+    if find_spec('pymorphy3') is None:
+        logging_config.get_endpoint_logger('mcp_rag_server').warning(
+            'Пакет pymorphy3 не установлен, вместо лемматизации '
+            'используется стемминг'
+        )
+        return None
+    import pymorphy3
+    return pymorphy3.MorphAnalyzer()
+
+
+@lru_cache(maxsize=65536)
+def lemmatize_word(word: str) -> str:
+    analyzer = _morph_analyzer()
+    if analyzer is None:
+        return stem(word)
+    return analyzer.parse(word)[0].normal_form.replace('ё', 'е')
+
+
+def canonicalize_query(
+    query: str,
+    remove_stopwords: bool | None = None,
+    lemmatize: bool | None = None,
+) -> str:
+    '''
+    Приводит запрос к каноническому виду для ключа кэша.
+
+    Шаги выполняются в фиксированном порядке: Unicode нормализация,
+    casefold и "ё" -> "е", удаление пунктуации, схлопывание пробелов,
+    затем (по настройкам) удаление служебных слов и лемматизация.
+    '''
+    if remove_stopwords is None:
+        remove_stopwords = settings.rag_query_remove_stopwords
+    if lemmatize is None:
+        lemmatize = settings.rag_query_lemmatize
+
+    text = collapse_whitespace(
+        strip_punctuation(casefold(unicode_normalize(query)))
+    )
+    if not (remove_stopwords or lemmatize):
+        return text
+    words = text.split(' ')
+    if remove_stopwords:
+        # Запрос целиком из служебных слов оставляем как есть
+        words = [word for word in words if word not in STOPWORDS] or words
+    if lemmatize:
+        words = [lemmatize_word(word) for word in words]
+    return ' '.join(words)
@@ -0,0 +1,102 @@
+'''
+Оценка доли попаданий в кэш при разной канонизации запросов.
+
+Прогоняет журнал запросов (по одному на строку) через модель LRU кэша
+заданного размера и сравнивает ключи: прежнюю нормализацию (регистр и
+пробелы) и канонизацию с разными опциями:
+
+    python -m app.services.mcp_rag.query_replay queries.txt \
+        --cache-size 1024
+'''
+import argparse
+from collections import OrderedDict
+from functools import partial
+from typing import Callable, Iterable
+
+from app.services.mcp_rag.query_canonicalizer import canonicalize_query
+
+
+def baseline_key(query: str) -> str:
+    '''Ключ до канонизации: нижний регистр и схлопнутые пробелы.'''
+    return ' '.join(query.lower().split())
+
+
+KEY_STRATEGIES: dict[str, Callable[[str], str]] = {
+    'baseline': baseline_key,
+    'canonical': partial(
+        canonicalize_query, remove_stopwords=False, lemmatize=False
+    ),
+    'canonical+stopwords': partial(
+        canonicalize_query, remove_stopwords=True, lemmatize=False
+    ),
+    'canonical+lemmatize': partial(
+        canonicalize_query, remove_stopwords=False, lemmatize=True
+    ),
+    'canonical+stopwords+lemmatize': partial(
+        canonicalize_query, remove_stopwords=True, lemmatize=True
+    ),
+}
+
+
+def replay_hit_rate(
+    queries: Iterable[str],
+    key_func: Callable[[str], str],
+    cache_size: int,
+) -> tuple[float, int]:
+    '''
+    Доля попаданий в LRU кэш размера cache_size.
+
+    Returns:
+        Доля попаданий и число различных ключей.
+    '''
+    cache: OrderedDict[str, None] = OrderedDict()
+    distinct: set[str] = set()
+    hits = total = 0
+    for query in queries:
+        key = key_func(query)
+        distinct.add(key)
+        total += 1
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+            continue
+        cache[key] = None
+        if len(cache) > cache_size:
+            cache.popitem(last=False)
+    return (hits / total if total else 0.0), len(distinct)
+
+
+def read_queries(path: str) -> list[str]:
+    with open(path, encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def format_replay_report(queries: list[str], cache_size: int) -> str:
+    lines = [
+        f'Запросов: {len(queries)}, размер кэша: {cache_size}',
+        f'{"ключ":<32}{"ключей":>8}{"попадания":>12}{"прирост":>10}',
+    ]
+    baseline, _ = replay_hit_rate(queries, baseline_key, cache_size)
+    for name, key_func in KEY_STRATEGIES.items():
+        hit_rate, distinct = replay_hit_rate(queries, key_func, cache_size)
+        lines.append(
+            f'{name:<32}{distinct:>8}{hit_rate:>12.1%}'
+            f'{hit_rate - baseline:>+10.1%}'
+        )
+    return '\n'.join(lines)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Доля попаданий в кэш при канонизации запросов'
+    )
+    parser.add_argument(
+        'queries', help='Файл с запросами, по одному на строку'
+    )
+    parser.add_argument('--cache-size', type=int, default=1024)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(format_replay_report(read_queries(args.queries), args.cache_size))
@@ -0,0 +1,37 @@
+import hashlib
+
+
+def _document_key(document: dict) -> str:
+    '''Ключ для поиска одного документа в выдаче разных баз знаний.'''
+    content = ' '.join((document.get('content') or '').lower().split())
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: list[list[dict]],
+    k: int = 60,
+    limit: int | None = None,
+) -> list[dict]:
+    '''
+    Объединяет ранжированные выдачи методом reciprocal rank fusion.
+
+    Оценка документа - сумма 1 / (k + rank) по всем выдачам, где он
+    встретился, поэтому оценки разных баз знаний не нужно приводить к
+    одной шкале. Документы с одинаковым содержимым объединяются,
+    остается экземпляр с лучшей позицией.
+    '''
+    scores: dict[str, float] = {}
+    best: dict[str, tuple[int, dict]] = {}
+    for ranked in ranked_lists:
+        for rank, document in enumerate(ranked, start=1):
+            key = _document_key(document)
+            scores[key] = scores.get(key, 0.0) + 1 / (k + rank)
+            if key not in best or rank < best[key][0]:
+                best[key] = (rank, document)
+    fused = sorted(scores, key=lambda key: (-scores[key], best[key][0]))
+    if limit is not None:
+        fused = fused[:limit]
+    return [
+        {**best[key][1], 'score': round(scores[key], 6)}
+        for key in fused
+    ]
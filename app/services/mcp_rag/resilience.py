@@ -0,0 +1,188 @@
+import asyncio
+from collections import deque
+import math
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+
+T = TypeVar('T')
+
+
+class UpstreamUnavailableError(RuntimeError):
+    '''Managed RAG недоступен: таймаут, сетевая ошибка, 5xx или 429.'''
+
+
+class CircuitOpenError(RuntimeError):
+    '''Запрос отклонен без обращения к upstream: цепь разомкнута.'''
+
+
+class CircuitBreaker:
+    '''
+    Circuit breaker вокруг запросов к Managed RAG.
+
+    closed - запросы проходят; после failure_threshold отказов подряд
+    цепь переходит в open и запросы сразу отклоняются. Через
+    recovery_timeout пропускается один пробный запрос (half_open):
+    успех замыкает цепь, отказ снова ее размыкает.
+    '''
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.opened = 0
+        self.probes = 0
+
+    def before_call(self) -> None:
+        '''
+        Проверяет, можно ли выполнить запрос.
+
+        Raises:
+            CircuitOpenError: Цепь разомкнута или пробный запрос
+                уже выполняется.
+        '''
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.recovery_timeout:
+                self._reject()
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self._reject()
+            self._probe_in_flight = True
+            self.probes += 1
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if (
+            self.state == self.HALF_OPEN
+            or self._failures >= self.failure_threshold
+        ):
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def release(self) -> None:
+        '''Завершает запрос, не повлиявший на состояние upstream.'''
+        self._probe_in_flight = False
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            'state': self.state,
+            'opened': self.opened,
+            'rejected': self.rejected,
+            'probes': self.probes,
+        }
+
+    def _reject(self) -> None:
+        self.rejected += 1
+        raise CircuitOpenError(
+            'Не удалось получить релевантные документы. '
+            'Managed RAG временно недоступен, повторите запрос позже'
+        )
+
+
+class HedgedCaller:
+    '''
+    Выполняет запрос с хеджированием.
+
+    Если первый запрос не завершился за время, равное заданному
+    перцентилю последних задержек, отправляется второй такой же
+    запрос. Используется ответ, пришедший первым, второй отменяется.
+    '''
+
+    def __init__(
+        self,
+        percentile: float,
+        min_samples: int,
+        min_delay: float,
+        window: int = 200,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies: deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def delay(self) -> float | None:
+        '''Задержка перед вторым запросом или None, если данных мало.'''
+        if len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        idx = min(
+            math.ceil(self.percentile * len(ordered)) - 1,
+            len(ordered) - 1,
+        )
+        return max(ordered[max(idx, 0)], self.min_delay)
+
+    async def call(
+        self,
+        func: Callable[[], Awaitable[T]],
+        hedge: bool = True,
+    ) -> T:
+        self.calls += 1
+        hedge_delay = self.delay() if hedge else None
+        primary = asyncio.create_task(self._timed(func))
+        tasks = {primary}
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    self.hedges += 1
+                    tasks.add(asyncio.create_task(self._timed(func)))
+            error: BaseException | None = None
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'delay': self.delay(),
+        }
+
+    async def _timed(self, func: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # Отмененный запрос дает нижнюю оценку задержки
+            self.observe(time.monotonic() - started)
+            raise
+        self.observe(time.monotonic() - started)
+        return result
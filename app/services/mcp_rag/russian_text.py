@@ -0,0 +1,167 @@
+'''
+Токенизация и стемминг русского текста для локального поиска.
+
+Стеммер реализует алгоритм Snowball для русского языка без внешних
+зависимостей.
+'''
+from functools import lru_cache
+import re
+
+
+VOWELS = frozenset('аеиоуыэюя')
+
+# Служебные слова без отрицаний: "не", "нет", "без" меняют смысл запроса
+STOPWORDS = frozenset({
+    'а', 'бы', 'был', 'была', 'были', 'было', 'быть', 'в', 'вам', 'вас',
+    'во', 'вот', 'все', 'всех', 'вы', 'где', 'да', 'для', 'до', 'его',
+    'ее', 'если', 'есть', 'еще', 'же', 'за', 'и', 'из', 'или', 'им',
+    'их', 'к', 'как', 'какая', 'какие', 'какой', 'ко', 'когда', 'кто',
+    'ли', 'мне', 'мы', 'на', 'над', 'нам', 'нас', 'о', 'об', 'он',
+    'она', 'они', 'оно', 'от', 'по', 'под', 'при', 'про', 'с', 'со',
+    'так', 'также', 'то', 'тоже', 'у', 'уже', 'чем', 'что', 'чтобы',
+    'эта', 'эти', 'это', 'этот', 'я',
+})
+
+_WORD_RE = re.compile(r'[0-9a-zа-я]+')
+
+_PERFECTIVE_GERUND_1 = ('в', 'вши', 'вшись')
+_PERFECTIVE_GERUND_2 = ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')
+_ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую',
+    'юю', 'ая', 'яя', 'ою', 'ею',
+)
+_PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+_PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+_REFLEXIVE = ('ся', 'сь')
+_VERB_1 = (
+    'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+    'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+)
+_VERB_2 = (
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+    'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+    'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+)
+_NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+)
+_SUPERLATIVE = ('ейше', 'ейш')
+_DERIVATIONAL = ('ость', 'ост')
+
+
+def normalize_text(text: str) -> str:
+    '''Нижний регистр и замена "ё" на "е".'''
+    return text.lower().replace('ё', 'е')
+
+
+def _regions(word: str) -> tuple[int, int]:
+    '''Начало областей RV и R2 алгоритма Snowball.'''
+    rv = len(word)
+    for idx, char in enumerate(word):
+        if char in VOWELS:
+            rv = idx + 1
+            break
+    r1 = _next_region(word, 0)
+    return rv, _next_region(word, r1)
+
+
+def _next_region(word: str, start: int) -> int:
+    for idx in range(start + 1, len(word)):
+        if word[idx] not in VOWELS and word[idx - 1] in VOWELS:
+            return idx + 1
+    return len(word)
+
+
+def _remove(
+    word: str,
+    start: int,
+    endings: tuple[str, ...],
+    preceded_endings: tuple[str, ...] = (),
+) -> str | None:
+    '''
+    Удаляет самое длинное окончание в области word[start:].
+
+    Окончания из preceded_endings удаляются, только если перед ними
+    стоит "а" или "я" из той же области.
+    '''
+    best = None
+    for ending in endings + preceded_endings:
+        if (
+            word.endswith(ending)
+            and len(word) - len(ending) >= start
+            and (best is None or len(ending) > len(best))
+        ):
+            best = ending
+    if best is None:
+        return None
+    stem_end = len(word) - len(best)
+    if best in preceded_endings and best not in endings:
+        if stem_end - 1 < start or word[stem_end - 1] not in 'ая':
+            return None
+    return word[:stem_end]
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    '''Основа русского слова; слова не на кириллице не меняются.'''
+    word = normalize_text(word)
+    if not word or not all('а' <= char <= 'я' for char in word):
+        return word
+    rv, r2 = _regions(word)
+
+    # Шаг 1
+    result = _remove(
+        word, rv, _PERFECTIVE_GERUND_2, _PERFECTIVE_GERUND_1
+    )
+    if result is None:
+        word = _remove(word, rv, _REFLEXIVE) or word
+        result = _remove(word, rv, _ADJECTIVE)
+        if result is not None:
+            result = (
+                _remove(result, rv, _PARTICIPLE_2, _PARTICIPLE_1)
+                or result
+            )
+        else:
+            result = _remove(word, rv, _VERB_2, _VERB_1)
+            if result is None:
+                result = _remove(word, rv, _NOUN)
+    if result is not None:
+        word = result
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3
+    word = _remove(word, r2, _DERIVATIONAL) or word
+
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        return word[:-1]
+    result = _remove(word, rv, _SUPERLATIVE)
+    if result is not None:
+        word = result
+        if word.endswith('нн') and len(word) - 1 >= rv:
+            word = word[:-1]
+        return word
+    if word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+def tokenize(
+    text: str,
+    stem_words: bool = True,
+    drop_stopwords: bool = True,
+) -> list[str]:
+    '''Разбивает текст на слова, при необходимости приводя их к основе.'''
+    words = _WORD_RE.findall(normalize_text(text))
+    if drop_stopwords:
+        words = [word for word in words if word not in STOPWORDS]
+    if stem_words:
+        words = [stem(word) for word in words]
+    return words
@@ -1,23 +1,244 @@
 import asyncio
-import signal
+from contextlib import asynccontextmanager
 import sys
+import time
 
 import httpx
-from typing import Dict, Any
+from typing import Any, Awaitable, Callable, Dict
 
+import fastmcp
 from fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+import uvicorn
 
-from app.core.config import settings
+from app.core.config import normalize_mcp_transport, settings
 from app.logging import logging_config
+from app.services.mcp_rag.cache import retrieval_cache
+from app.services.mcp_rag.context_packer import pack_documents
+from app.services.mcp_rag.document_store import (
+    document_store,
+    public_documents,
+)
+from app.services.mcp_rag.http_client import rag_http_client
+from app.services.mcp_rag.lexical_index import lexical_index
+from app.services.mcp_rag.limiter import OverloadedError, upstream_limiter
+from app.services.mcp_rag.metrics import (
+    lexical_answers,
+    partial_results,
+    registry,
+    stage_duration,
+    tool_calls_in_flight,
+    tool_duration,
+    upstream_responses,
+)
+from app.services.mcp_rag.persistent_cache import persistent_cache
+from app.services.mcp_rag.rank_fusion import reciprocal_rank_fusion
+from app.services.mcp_rag.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    HedgedCaller,
+    UpstreamUnavailableError,
+)
+from app.services.mcp_rag.shared_state import shared_state
+from app.services.mcp_rag.similarity_cache import similarity_cache
+from app.services.mcp_rag.singleflight import SingleFlight
+from app.services.mcp_rag.token_manager import token_manager
 
 
 mcp = FastMCP('sa_rag_agent')
-mcp.settings.port = 8003
+mcp.settings.port = settings.mcp_server_port
 mcp.settings.host = '0.0.0.0'
 
+retrieve_flight = SingleFlight()
+retrieve_breaker = CircuitBreaker(
+    failure_threshold=settings.rag_circuit_failure_threshold,
+    recovery_timeout=settings.rag_circuit_recovery_timeout,
+)
+hedged_retrieve = HedgedCaller(
+    percentile=settings.rag_hedge_percentile,
+    min_samples=settings.rag_hedge_min_samples,
+    min_delay=settings.rag_hedge_min_delay,
+)
+_kb_breakers: dict[str, CircuitBreaker] = {}
+_background_tasks: set[asyncio.Task] = set()
 
-_access_token: str | None = 'no token'
-_access_token_lock = asyncio.Lock()
+registry.gauge_callback(
+    'rag_cache_hit_ratio',
+    'Доля обращений, обслуженных кэшем в памяти',
+    lambda: retrieval_cache.stats['hit_ratio'],
+)
+registry.gauge_callback(
+    'rag_cache_entries',
+    'Записей в кэше в памяти',
+    lambda: len(retrieval_cache),
+)
+registry.gauge_callback(
+    'rag_upstream_in_flight',
+    'Выполняющиеся запросы к Managed RAG',
+    lambda: upstream_limiter.active,
+)
+registry.gauge_callback(
+    'rag_upstream_queue_waiting',
+    'Запросы в очереди к Managed RAG',
+    lambda: upstream_limiter.waiting,
+)
+registry.counter_callback(
+    'rag_upstream_rejected',
+    'Запросы, отклоненные из-за перегрузки',
+    lambda: upstream_limiter.rejected,
+)
+registry.gauge_callback(
+    'rag_singleflight_in_flight',
+    'Уникальные запросы retrieve в процессе выполнения',
+    lambda: retrieve_flight.inflight,
+)
+registry.counter_callback(
+    'rag_singleflight_coalesced',
+    'Запросы, объединенные с уже выполняющимися',
+    lambda: retrieve_flight.coalesced,
+)
+registry.gauge_callback(
+    'rag_similarity_cache_entries',
+    'Запросов в индексе похожих запросов',
+    lambda: len(similarity_cache),
+)
+registry.gauge_callback(
+    'rag_lexical_index_documents',
+    'Документов в локальном BM25 индексе',
+    lambda: len(lexical_index),
+)
+registry.gauge_callback(
+    'rag_document_store_documents',
+    'Полных текстов документов в хранилище в памяти',
+    lambda: len(document_store),
+)
+registry.gauge_callback(
+    'rag_circuit_open',
+    '1, если circuit breaker разомкнут',
+    lambda: int(retrieve_breaker.state != CircuitBreaker.CLOSED),
+)
+registry.counter_callback(
+    'rag_circuit_rejected',
+    'Запросы, отклоненные circuit breaker',
+    lambda: retrieve_breaker.rejected,
+)
+registry.counter_callback(
+    'rag_hedged_requests',
+    'Отправленные хеджирующие запросы',
+    lambda: hedged_retrieve.hedges,
+)
+registry.counter_callback(
+    'rag_hedge_wins',
+    'Хеджирующие запросы, ответившие первыми',
+    lambda: hedged_retrieve.hedge_wins,
+)
+
+
+@mcp.custom_route('/metrics', methods=['GET'])
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    '''Метрики процесса в текстовом формате Prometheus.'''
+    return PlainTextResponse(
+        registry.render(),
+        media_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@asynccontextmanager
+async def server_lifespan():
+    '''
+    Ресурсы, общие для всех MCP сессий процесса.
+
+    Lifespan самого FastMCP выполняется на каждую SSE сессию,
+    поэтому общий HTTP клиент привязан к жизненному циклу
+    Starlette приложения (см. create_app).
+    '''
+    rag_http_client.start()
+    await persistent_cache.open()
+    await shared_state.open()
+    await warm_up_retrieval_cache()
+    if settings.rag_lexical_index_enabled:
+        await lexical_index.load(settings.rag_lexical_index_path)
+    await token_manager.start()
+    try:
+        yield
+    finally:
+        await drain_background_tasks(settings.mcp_graceful_shutdown_timeout)
+        if settings.rag_lexical_index_enabled:
+            await lexical_index.save(settings.rag_lexical_index_path)
+        await token_manager.stop()
+        await shared_state.close()
+        await persistent_cache.close()
+        await rag_http_client.aclose()
+
+
+async def drain_background_tasks(timeout: float) -> None:
+    '''
+    Дожидается фоновых обновлений кэша при остановке сервера.
+
+    Незавершенные за timeout секунд задачи отменяются.
+    '''
+    tasks = list(_background_tasks)
+    if not tasks:
+        return
+    logging_config.get_endpoint_logger('mcp_rag_server').info(
+        f'Ожидание завершения {len(tasks)} фоновых задач'
+    )
+    _, pending = await asyncio.wait(tasks, timeout=max(timeout, 0.0))
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def warm_up_retrieval_cache() -> None:
+    '''Загружает самые популярные записи с диска в кэш в памяти.'''
+    if not settings.rag_cache_enabled:
+        return
+    hottest = await persistent_cache.hottest(
+        settings.rag_persistent_cache_warm_entries
+    )
+    for key, value, created_at in hottest:
+        retrieval_cache.set(key, value, age=time.time() - created_at)
+        remember_similar(key[0], key)
+    if hottest:
+        logging_config.get_endpoint_logger('mcp_rag_server').info(
+            f'Загружено {len(hottest)} записей кэша с диска'
+        )
+
+
+def create_app(transport: str | None = None):
+    '''
+    Создает ASGI приложение MCP сервера с общим lifespan.
+
+    Args:
+        transport: 'sse' или 'streamable-http' (см. MCP_TRANSPORTS);
+            по умолчанию settings.mcp_transport.
+    Raises:
+        ValueError: Неизвестный транспорт.
+    '''
+    transport = normalize_mcp_transport(transport or settings.mcp_transport)
+    if transport == 'sse':
+        app = mcp.http_app(transport='sse')
+    else:
+        # Несколько процессов на одном сокете не разделяют сессии,
+        # поэтому в этом режиме streamable HTTP работает без них
+        app = mcp.http_app(
+            transport=transport,
+            stateless_http=(
+                settings.mcp_stateless_http
+                or settings.mcp_server_workers > 1
+            ),
+        )
+    transport_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(starlette_app):
+        async with server_lifespan():
+            async with transport_lifespan(starlette_app):
+                yield
+
+    app.router.lifespan_context = lifespan
+    return app
 
 
 def _parse_retrieve_limit(value: str | None, default: int = 6) -> int:
@@ -32,100 +253,189 @@ def _parse_retrieve_limit(value: str | None, default: int = 6) -> int:
         return default
 
 
-async def postprocess_retrieve_result(retrieve_result: Dict[str, Any]) -> str:
-    result_str = 'Context:\n\n'
-    results = retrieve_result.get('results', [])
-    for idx, el in enumerate(results, start=1):
-        content = el.get('content', '')
-        metadata = el.get('metadata', {})
-        result_str += (
-            f'Document {idx}:\n'
-            f'Content: {content}\n'
-            f'Metadata: {metadata}\n\n'
-        )
-    return result_str
+def _run_in_background(coro) -> None:
+    """Запускает фоновую задачу, сохраняя ссылку до ее завершения."""
+    _track_background(asyncio.create_task(coro))
 
 
-async def get_access_token() -> str:
-    async with _access_token_lock:
-        global _access_token
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                token_response = await client.post(
-                    settings.auth_url,
-                    data={
-                        'grant_type': 'client_credentials',
-                        'client_id': settings.key_id,
-                        'client_secret': settings.key_secret,
-                    },
-                )
-                token_response.raise_for_status()
-                access_token = token_response.json().get('access_token')
-                if not access_token:
-                    raise ValueError(
-                        'Ответ аутентификации не содержит access_token'
-                        )
-                _access_token = access_token
-                return access_token
-        except httpx.HTTPStatusError as e:
-            raise RuntimeError(
-                f'Ошибка при получении access token. '
-                f'Статус: {e.response.status_code}; '
-                f'Сообщение: {e.response.text}'
-            )
-        except httpx.TimeoutException:
-            raise RuntimeError('Таймаут при получении access token.')
-        except httpx.RequestError as e:
-            raise RuntimeError(f'Сетевая ошибка аутентификации: {e}')
-        except Exception as e:
-            raise RuntimeError(f'Неожиданная ошибка аутентификации: {e}')
+def _track_background(task: asyncio.Task) -> None:
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
 
 
-@mcp.tool()
-async def request_to_rag(query: str) -> str:
+def _on_background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if task.cancelled() or task.exception() is None:
+        return
+    logging_config.get_endpoint_logger('mcp_rag_server').warning(
+        f'Фоновое обновление кэша не удалось: {task.exception()}'
+    )
+
+
+def knowledge_base_versions() -> list[str]:
+    '''Версии баз знаний, опрашиваемые одним вызовом инструмента.'''
+    return (
+        settings.knowledge_base_version_ids
+        or [settings.knowledge_base_version_id]
+    )
+
+
+def breaker_for(kb_version: str) -> CircuitBreaker:
+    '''Circuit breaker базы знаний: отказ одной не блокирует другие.'''
+    if kb_version == settings.knowledge_base_version_id:
+        return retrieve_breaker
+    breaker = _kb_breakers.get(kb_version)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            failure_threshold=settings.rag_circuit_failure_threshold,
+            recovery_timeout=settings.rag_circuit_recovery_timeout,
+        )
+        _kb_breakers[kb_version] = breaker
+    return breaker
+
+
+async def fetch_retrieve_result(
+    query: str,
+    retrieve_limit: int,
+    kb_version: str | None = None,
+    timeout: float | None = None,
+) -> Dict[str, Any]:
     """
-    Инструмент обращается к API Базы Знаний и получает
-    релевантные документы по запросу пользователя.
-    На выходе выдает релевантные документы, которые нужно использовать
-    для ответа на вопрос пользователя.
-    Args:
-        query: str - Запрос пользователя.
-    Returns:
-        Отформатированная строка с релевантными документами из базы знаний.
+    Запрашивает релевантные документы у Managed RAG через
+    circuit breaker и, если включено, с хеджированием.
+
+    Превышение timeout секунд считается отказом базы знаний
+    для ее circuit breaker.
     Raises:
-        ValueError: Ошибки связанные с некорректными параметрами.
-        RuntimeError: Серверная ошибка.
+        CircuitOpenError: Managed RAG признан недоступным.
+        RuntimeError: Ошибка аутентификации или запроса к Managed RAG.
     """
-    retrieve_limit = _parse_retrieve_limit(
-        settings.retrieve_limit,
-        default=6
+    kb_version = kb_version or settings.knowledge_base_version_id
+    breaker = breaker_for(kb_version)
+    breaker.before_call()
+    try:
+        retrieve_result = await asyncio.wait_for(
+            hedged_retrieve.call(
+                lambda: _request_retrieve(query, retrieve_limit, kb_version),
+                hedge=settings.rag_hedging_enabled,
+            ),
+            timeout=timeout,
         )
-    global _access_token
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        raise UpstreamUnavailableError(
+            f'База знаний {kb_version} не ответила за {timeout} с'
+        )
+    except UpstreamUnavailableError:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        # Ошибки авторизации и ответа не говорят о недоступности upstream
+        breaker.release()
+        raise
+    breaker.record_success()
+    return retrieve_result
 
-    async def do_rag_request(access_token: str):
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            payload = {
-                'project_id': settings.evolution_project_id,
-                'query': query,
-                'retrieve_limit': retrieve_limit,
-                'rag_version': settings.knowledge_base_version_id,
-            }
-            return await client.post(
-                settings.retrieve_url_template,
-                json=payload,
-                headers={'Authorization': f'Bearer {access_token}'},
+
+async def fan_out_retrieve(
+    query: str,
+    retrieve_limit: int,
+) -> Dict[str, Any]:
+    """
+    Опрашивает все настроенные базы знаний параллельно и объединяет
+    выдачи reciprocal rank fusion.
+
+    Каждая база ограничена rag_kb_timeout, поэтому медленная база не
+    задерживает ответ. Ошибка возвращается, только если не ответила
+    ни одна база; если не ответила часть баз, результат помечается
+    ключом partial, чтобы его не кэшировали как полный.
+    """
+    kb_versions = knowledge_base_versions()
+    if len(kb_versions) == 1:
+        return await fetch_retrieve_result(
+            query, retrieve_limit, kb_versions[0]
+        )
+
+    timeout = settings.rag_kb_timeout if settings.rag_kb_timeout > 0 else None
+    responses = await asyncio.gather(
+        *(
+            fetch_retrieve_result(
+                query, retrieve_limit, kb_version, timeout=timeout
+            )
+            for kb_version in kb_versions
+        ),
+        return_exceptions=True,
+    )
+    ranked_lists = []
+    errors = []
+    for kb_version, response in zip(kb_versions, responses):
+        if isinstance(response, Exception):
+            errors.append(response)
+            logging_config.get_endpoint_logger('mcp_rag_server').warning(
+                f'База знаний {kb_version} исключена из ответа: {response}'
             )
+            continue
+        ranked_lists.append(response.get('results') or [])
+    if not ranked_lists:
+        # Недоступность предпочтительнее: для нее есть локальный ответ
+        for error in errors:
+            if isinstance(
+                error,
+                (UpstreamUnavailableError, CircuitOpenError, OverloadedError),
+            ):
+                raise error
+        raise errors[0]
+    merged = {
+        'results': reciprocal_rank_fusion(
+            ranked_lists, k=settings.rag_rrf_k, limit=retrieve_limit
+        )
+    }
+    if errors:
+        merged['partial'] = True
+    return merged
 
-    if _access_token is None:
-        await get_access_token()
 
+async def _request_retrieve(
+    query: str,
+    retrieve_limit: int,
+    kb_version: str | None = None,
+) -> Dict[str, Any]:
+    async def do_rag_request(access_token: str):
+        payload = {
+            'project_id': settings.evolution_project_id,
+            'query': query,
+            'retrieve_limit': retrieve_limit,
+            'rag_version': kb_version or settings.knowledge_base_version_id,
+        }
+        async with upstream_limiter.acquire():
+            try:
+                with stage_duration.time(stage='upstream'):
+                    response = await rag_http_client.client.post(
+                        settings.retrieve_url_template,
+                        json=payload,
+                        headers={'Authorization': f'Bearer {access_token}'},
+                        timeout=rag_http_client.retrieve_timeout,
+                    )
+            except httpx.TimeoutException:
+                upstream_responses.inc(status='timeout')
+                raise
+            except httpx.RequestError:
+                upstream_responses.inc(status='network_error')
+                raise
+        upstream_responses.inc(status=str(response.status_code))
+        return response
+
+    with stage_duration.time(stage='token'):
+        access_token = await token_manager.get_token()
     try:
-        response = await do_rag_request(_access_token)
+        response = await do_rag_request(access_token)
         if response.status_code == 401:
-            # Токен истёк или неверен,
-            # пробуем обновить токен и повторить попытку
-            await get_access_token()  # обновит _access_token
-            response = await do_rag_request(_access_token)
+            # Токен отозван раньше срока,
+            # обновляем его один раз для всех ожидающих и повторяем
+            access_token = await token_manager.refresh(
+                stale_token=access_token
+            )
+            response = await do_rag_request(access_token)
             if response.status_code == 401:
                 # Второй 401 подряд = реальные проблемы.
                 raise RuntimeError(
@@ -133,7 +443,8 @@ async def request_to_rag(query: str) -> str:
                     'повторный 401 при запросе к базе знаний.'
                 )
         response.raise_for_status()
-        retrieve_result = response.json()
+        with stage_duration.time(stage='decode'):
+            retrieve_result = response.json()
     except httpx.HTTPStatusError as e:
         status = (
             e.response.status_code if e.response is not None else 'unknown'
@@ -141,38 +452,363 @@ async def request_to_rag(query: str) -> str:
         message = (
             e.response.text if e.response is not None else 'no message'
             )
-        raise RuntimeError(
+        error_class = (
+            UpstreamUnavailableError
+            if status == 429 or (isinstance(status, int) and status >= 500)
+            else RuntimeError
+        )
+        raise error_class(
             f'Не удалось получить релевантные документы. '
             f'Статус: {status}; Сообщение: {message}'
         )
     except httpx.TimeoutException:
-        raise RuntimeError(
+        raise UpstreamUnavailableError(
             'Не удалось получить релевантные документы. '
             'Таймаут запроса к Managed RAG'
         )
     except httpx.RequestError as e:
-        raise RuntimeError(
+        raise UpstreamUnavailableError(
             f'Не удалось получить релевантные документы. '
             f'Сетевая ошибка при запросе к Managed RAG: {e}'
         )
+    except OverloadedError:
+        raise
     except Exception as e:
         # Непредвиденная ошибка
         raise RuntimeError(
             f'Не удалось получить релевантные документы. '
             f'Неожиданная ошибка при запросе к Managed RAG: {e}'
         )
+    return retrieve_result
+
+
+def remember_similar(query: str, cache_key: tuple) -> None:
+    '''Добавляет запрос с результатом в кэше в индекс похожих запросов.'''
+    if settings.rag_similarity_cache_enabled:
+        similarity_cache.add(query, cache_key, namespace=cache_key[1:])
+
 
-    postprocessed_retrieve_result = (
-        await postprocess_retrieve_result(retrieve_result)
+def lookup_similar(
+    query: str,
+    cache_key: tuple,
+) -> list[Dict[str, Any]] | None:
+    '''Свежий результат похожего запроса из кэша или None.'''
+    if not settings.rag_similarity_cache_enabled:
+        return None
+    neighbour = similarity_cache.find(query, namespace=cache_key[1:])
+    if neighbour is None:
+        return None
+    similar_key, _ = neighbour
+    cached_result = retrieval_cache.get(similar_key)
+    if cached_result is None:
+        # Запись вытеснена из кэша или устарела
+        similarity_cache.discard(similar_key)
+    return cached_result
+
+
+def lexical_answer(
+    query: str,
+    retrieve_limit: int,
+    min_score: float,
+) -> list[Dict[str, Any]] | None:
+    '''Документы из локального BM25 индекса или None.'''
+    if not settings.rag_lexical_index_enabled:
+        return None
+    retrieve_result = lexical_index.answer(query, retrieve_limit, min_score)
+    if retrieve_result is None:
+        return None
+    return pack_documents(retrieve_result, query)
+
+
+async def fetch_with_lexical_fallback(
+    query: str,
+    retrieve_limit: int,
+    fetch: Callable[[], Awaitable[list[Dict[str, Any]]]],
+) -> list[Dict[str, Any]]:
+    '''
+    Выполняет fetch, подменяя ответ локальным индексом, если Managed
+    RAG недоступен или не ответил за rag_lexical_fallback_timeout.
+
+    Медленный запрос при этом не отменяется: он завершается в фоне
+    и обновляет кэш.
+    '''
+    task = asyncio.ensure_future(fetch())
+    timeout = settings.rag_lexical_fallback_timeout
+    try:
+        if timeout > 0 and len(lexical_index):
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if not done:
+                local_result = lexical_answer(
+                    query,
+                    retrieve_limit,
+                    settings.rag_lexical_fallback_min_score,
+                )
+                if local_result is not None:
+                    lexical_answers.inc(reason='slow')
+                    _track_background(task)
+                    return local_result
+        return await task
+    except (UpstreamUnavailableError, CircuitOpenError, OverloadedError):
+        local_result = lexical_answer(
+            query, retrieve_limit, settings.rag_lexical_fallback_min_score
         )
-    return postprocessed_retrieve_result
+        if local_result is None:
+            raise
+        lexical_answers.inc(reason='fallback')
+        return local_result
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
 
 
-def signal_handler(signum, frame):
-    """Обработчик сигналов для корректного завершения."""
-    mcp_logger = logging_config.get_endpoint_logger('mcp_rag_server')
-    mcp_logger.info('🛑 Получен сигнал завершения, останавливаем сервер...')
-    sys.exit(0)
+async def share_documents(documents: list[Dict[str, Any]]) -> None:
+    '''
+    Публикует полные тексты документов для остальных worker процессов.
+
+    Без общего хранилища ресурс документа доступен только в процессе,
+    выполнившем запрос к Managed RAG.
+    '''
+    if not shared_state.enabled:
+        return
+    await shared_state.set_many(
+        {
+            f'document:{document["id"]}': document['body']
+            for document in documents
+        },
+        time.time() + settings.rag_cache_ttl,
+    )
+
+
+async def read_document(doc_id: str) -> str | None:
+    '''Полный текст документа по id или None.'''
+    body = document_store.get(doc_id)
+    if body is not None:
+        return body
+    shared = await shared_state.get(f'document:{doc_id}')
+    if shared is None:
+        return None
+    body, _ = shared
+    document_store.put(doc_id, body)
+    return body
+
+
+async def retrieve_context(query: str) -> list[Dict[str, Any]]:
+    """
+    Возвращает документы для запроса через кэш и объединение
+    одинаковых одновременных запросов.
+
+    Документы содержат полный текст в поле body, его убирает
+    public_documents перед ответом клиенту.
+    Raises:
+        RuntimeError: Серверная ошибка.
+    """
+    retrieve_limit = _parse_retrieve_limit(
+        settings.retrieve_limit,
+        default=6
+        )
+
+    cache_key = retrieval_cache.make_key(
+        query,
+        ','.join(knowledge_base_versions()),
+        retrieve_limit,
+    )
+
+    async def fetch_and_postprocess() -> list[Dict[str, Any]]:
+        retrieve_result = await fan_out_retrieve(query, retrieve_limit)
+        if settings.rag_lexical_index_enabled:
+            lexical_index.add(retrieve_result.get('results') or [])
+        with stage_duration.time(stage='postprocess'):
+            postprocessed_retrieve_result = pack_documents(
+                retrieve_result, query
+            )
+        if retrieve_result.get('partial'):
+            partial_results.inc()
+        if (
+            not retrieve_result.get('results')
+            or retrieve_result.get('partial')
+        ):
+            # Пустой ответ кэшируем ненадолго и не сохраняем на диск,
+            # чтобы повторные промахи не нагружали API. Так же поступаем
+            # с ответом без части баз знаний: после восстановления базы
+            # ее документы должны появиться в выдаче
+            if settings.rag_cache_enabled:
+                retrieval_cache.set(
+                    cache_key,
+                    postprocessed_retrieve_result,
+                    ttl=settings.rag_negative_cache_ttl,
+                    stale_ttl=0.0,
+                )
+            await share_documents(postprocessed_retrieve_result)
+            return postprocessed_retrieve_result
+        if settings.rag_cache_enabled:
+            retrieval_cache.set(cache_key, postprocessed_retrieve_result)
+            remember_similar(query, cache_key)
+        await persistent_cache.set(cache_key, postprocessed_retrieve_result)
+        await share_documents(postprocessed_retrieve_result)
+        return postprocessed_retrieve_result
+
+    async def retrieve_and_postprocess(
+        refresh: bool = False,
+    ) -> list[Dict[str, Any]]:
+        # Фоновое обновление устаревшей записи всегда идет в upstream
+        if refresh:
+            return await fetch_and_postprocess()
+
+        stored = await persistent_cache.get(cache_key)
+        if stored is not None:
+            stored_result, created_at = stored
+            age = time.time() - created_at
+            if settings.rag_cache_enabled:
+                retrieval_cache.set(cache_key, stored_result, age=age)
+                remember_similar(query, cache_key)
+            if age >= settings.rag_cache_ttl:
+                # Запись с диска старше ttl кэша в памяти: отдаем ее
+                # как устаревшую и обновляем в фоне
+                _run_in_background(fetch_and_postprocess())
+            return stored_result
+
+        if settings.rag_lexical_local_enabled:
+            local_result = lexical_answer(
+                query, retrieve_limit, settings.rag_lexical_local_min_score
+            )
+            if local_result is not None:
+                lexical_answers.inc(reason='local')
+                return local_result
+
+        return await fetch_with_lexical_fallback(
+            query, retrieve_limit, fetch_and_postprocess
+        )
+
+    started = time.perf_counter()
+    cache_outcome = 'miss'
+    with tool_calls_in_flight.track_inprogress():
+        try:
+            if settings.rag_cache_enabled:
+                cached_result, is_stale = retrieval_cache.lookup(cache_key)
+                if cached_result is not None:
+                    cache_outcome = 'stale' if is_stale else 'hit'
+                    if is_stale:
+                        # Отдаем устаревший результат сразу
+                        # и обновляем его в фоне
+                        _run_in_background(retrieve_flight.do(
+                            cache_key,
+                            lambda: retrieve_and_postprocess(refresh=True),
+                        ))
+                    return cached_result
+                similar_result = lookup_similar(query, cache_key)
+                if similar_result is not None:
+                    cache_outcome = 'similar'
+                    return similar_result
+
+            # Одинаковые одновременные запросы разделяют
+            # один вызов upstream
+            return await retrieve_flight.do(
+                cache_key, retrieve_and_postprocess
+            )
+        finally:
+            tool_duration.observe(
+                time.perf_counter() - started, cache=cache_outcome
+            )
+
+
+@mcp.tool()
+async def request_to_rag(query: str) -> list[dict[str, Any]]:
+    """
+    Инструмент обращается к API Базы Знаний и получает
+    релевантные документы по запросу пользователя.
+    На выходе выдает релевантные документы, которые нужно использовать
+    для ответа на вопрос пользователя.
+    Args:
+        query: str - Запрос пользователя.
+    Returns:
+        Список документов: id, score, фрагмент content и metadata.
+        Полный текст документа доступен ресурсом rag://documents/{id}.
+    Raises:
+        ValueError: Ошибки связанные с некорректными параметрами.
+        RuntimeError: Серверная ошибка.
+    """
+    return public_documents(await retrieve_context(query), document_store)
+
+
+@mcp.resource('rag://documents/{doc_id}', mime_type='text/plain')
+async def rag_document(doc_id: str) -> str:
+    """
+    Полный текст документа из ответа request_to_rag по его id.
+    Raises:
+        ValueError: Документ не найден.
+    """
+    body = await read_document(doc_id)
+    if body is None:
+        raise ValueError(
+            f'Документ {doc_id} не найден, повторите запрос к базе знаний'
+        )
+    return body
+
+
+@mcp.tool()
+async def request_to_rag_batch(queries: list[str]) -> list[dict[str, Any]]:
+    """
+    Инструмент получает релевантные документы из базы знаний сразу
+    для нескольких запросов. Используй его, когда вопрос пользователя
+    разбит на несколько подзапросов.
+    Args:
+        queries: list[str] - Список запросов.
+    Returns:
+        Список результатов в порядке запросов. Каждый элемент содержит
+        query и result со списком документов либо error с описанием
+        ошибки.
+    Raises:
+        ValueError: Ошибки связанные с некорректными параметрами.
+    """
+    if not queries:
+        raise ValueError('Список запросов не может быть пустым')
+    if len(queries) > settings.rag_batch_max_queries:
+        raise ValueError(
+            f'Слишком много запросов в пакете '
+            f'(максимум {settings.rag_batch_max_queries})'
+        )
+
+    semaphore = asyncio.Semaphore(max(settings.rag_batch_concurrency, 1))
+
+    async def run_query(query: str) -> dict[str, Any]:
+        async with semaphore:
+            try:
+                return {
+                    'query': query,
+                    'result': public_documents(
+                        await retrieve_context(query), document_store
+                    ),
+                }
+            except RuntimeError as e:
+                return {'query': query, 'error': str(e)}
+
+    return list(await asyncio.gather(*(run_query(q) for q in queries)))
+
+
+def transport_path(transport: str) -> str:
+    '''Путь MCP эндпоинта для выбранного транспорта.'''
+    if normalize_mcp_transport(transport) == 'sse':
+        return fastmcp.settings.sse_path
+    return fastmcp.settings.streamable_http_path
+
+
+def server_workers() -> int:
+    '''
+    Число worker процессов с учетом транспорта.
+
+    SSE сессия состоит из потока событий и отдельных POST запросов,
+    которые при нескольких процессах на одном сокете попадают в разные
+    процессы, поэтому для SSE всегда используется один процесс.
+    '''
+    workers = max(settings.mcp_server_workers, 1)
+    transport = normalize_mcp_transport(settings.mcp_transport)
+    if workers > 1 and transport == 'sse':
+        logging_config.get_endpoint_logger('mcp_rag_server').warning(
+            'Транспорт SSE не поддерживает несколько процессов, '
+            'сервер запускается с одним worker'
+        )
+        return 1
+    return workers
 
 
 if __name__ == '__main__':
@@ -183,15 +819,49 @@ if __name__ == '__main__':
         f'{mcp.settings.host}:{mcp.settings.port}'
         )
     mcp_logger.info(
-        f'📡 SSE endpoint: http://{mcp.settings.host}:{mcp.settings.port}/sse'
+        f'📡 MCP endpoint ({settings.mcp_transport}): '
+        f'http://{mcp.settings.host}:{mcp.settings.port}'
+        f'{transport_path(settings.mcp_transport)}'
+        )
+    mcp_logger.info(
+        f'📊 Метрики: http://{mcp.settings.host}:{mcp.settings.port}/metrics'
         )
     mcp_logger.info('✋ Для остановки нажмите Ctrl+C')
 
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-
+    workers = server_workers()
+    # SIGINT и SIGTERM обрабатывает uvicorn: новые соединения не
+    # принимаются, текущие запросы завершаются в пределах
+    # mcp_graceful_shutdown_timeout, затем выполняется server_lifespan
     try:
-        mcp.run(transport='sse')
+        if workers > 1:
+            if (
+                settings.rag_persistent_cache_path is None
+                or settings.rag_shared_state_path is None
+            ):
+                mcp_logger.warning(
+                    'Для общего кэша и токена между процессами задайте '
+                    'RAG_PERSISTENT_CACHE_PATH и RAG_SHARED_STATE_PATH'
+                )
+            mcp_logger.info(f'⚙️ Worker процессов: {workers}')
+            uvicorn.run(
+                'app.services.mcp_rag.server:create_app',
+                factory=True,
+                host=mcp.settings.host,
+                port=mcp.settings.port,
+                workers=workers,
+                timeout_graceful_shutdown=(
+                    settings.mcp_graceful_shutdown_timeout
+                ),
+            )
+        else:
+            uvicorn.run(
+                create_app(),
+                host=mcp.settings.host,
+                port=mcp.settings.port,
+                timeout_graceful_shutdown=(
+                    settings.mcp_graceful_shutdown_timeout
+                ),
+            )
     except KeyboardInterrupt:
         mcp_logger.info('🛑 Сервер остановлен пользователем')
     except Exception as e:
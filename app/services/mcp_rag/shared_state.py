@@ -0,0 +1,120 @@
+import asyncio
+import json
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from app.core.config import settings
+
+
+class SharedStateStore:
+    '''
+    Общее для worker процессов хранилище ключ-значение в SQLite файле.
+
+    Используется для access token Managed RAG: токен, полученный одним
+    процессом, подхватывают остальные вместо собственного запроса к
+    auth API. Срок действия хранится по системным часам, так как
+    time.monotonic() не сопоставим между процессами. Просроченные
+    записи удаляются при записи, не чаще раза в prune_interval секунд.
+    '''
+
+    def __init__(self, path: str | None, prune_interval: float = 60.0):
+        self.path = path
+        self.prune_interval = prune_interval
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._connection is not None
+
+    async def open(self) -> None:
+        if self.path is None or self._connection is not None:
+            return
+        await asyncio.to_thread(self._open)
+
+    async def close(self) -> None:
+        if self._connection is None:
+            return
+        with self._lock:
+            self._connection.close()
+            self._connection = None
+
+    async def get(self, name: str) -> tuple[Any, float] | None:
+        '''Возвращает значение и его срок действия (time.time()).'''
+        if self._connection is None:
+            return None
+        return await asyncio.to_thread(self._get, name)
+
+    async def set(self, name: str, value: Any, expires_at: float) -> None:
+        if self._connection is None:
+            return
+        await asyncio.to_thread(self._set, name, value, expires_at)
+
+    async def set_many(
+        self, values: dict[str, Any], expires_at: float
+    ) -> None:
+        '''Записывает несколько значений одной транзакцией.'''
+        if self._connection is None or not values:
+            return
+        await asyncio.to_thread(self._set_many, values, expires_at)
+
+    def _open(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS shared_state ('
+            'name TEXT PRIMARY KEY, '
+            'value TEXT NOT NULL, '
+            'expires_at REAL NOT NULL)'
+        )
+        with self._lock:
+            self._connection = connection
+            self._prune_locked()
+            self._connection.commit()
+
+    def _get(self, name: str) -> tuple[Any, float] | None:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value, expires_at FROM shared_state '
+                'WHERE name = ? AND expires_at > ?',
+                (name, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _set(self, name: str, value: Any, expires_at: float) -> None:
+        self._set_many({name: value}, expires_at)
+
+    def _set_many(self, values: dict[str, Any], expires_at: float) -> None:
+        rows = [
+            (name, json.dumps(value, ensure_ascii=False), expires_at)
+            for name, value in values.items()
+        ]
+        with self._lock:
+            self._connection.executemany(
+                'INSERT INTO shared_state (name, value, expires_at) '
+                'VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET '
+                'value = excluded.value, '
+                'expires_at = excluded.expires_at',
+                rows,
+            )
+            if time.monotonic() >= self._next_prune:
+                self._prune_locked()
+            self._connection.commit()
+
+    def _prune_locked(self) -> None:
+        '''Удаляет просроченные записи (без commit).'''
+        self._connection.execute(
+            'DELETE FROM shared_state WHERE expires_at <= ?', (time.time(),)
+        )
+        self._next_prune = time.monotonic() + self.prune_interval
+
+
+shared_state = SharedStateStore(settings.rag_shared_state_path)
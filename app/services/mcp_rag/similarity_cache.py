@@ -0,0 +1,235 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import random
+import re
+from typing import Callable, Hashable
+import zlib
+
+from app.core.config import settings
+from app.services.mcp_rag.lexical_index import lexical_index
+from app.services.mcp_rag.russian_text import tokenize
+
+
+# Простое число Мерсенна 2^61 - 1 для универсального хеширования
+_MERSENNE_PRIME = (1 << 61) - 1
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 32
+NGRAM_SIZE = 3
+_LATIN_OR_DIGIT = re.compile(r'[0-9a-z]')
+
+
+def query_shingles(query: str, size: int = NGRAM_SIZE) -> frozenset[str]:
+    '''
+    Символьные n-граммы основ значимых слов запроса.
+
+    N-граммы строятся отдельно для каждого слова, поэтому порядок слов
+    не влияет на результат, а составные слова ("техподдержка")
+    пересекаются со своими частями ("поддержка").
+    '''
+    shingles = set()
+    for token in tokenize(query):
+        padded = f' {token} '
+        if len(padded) <= size:
+            shingles.add(padded)
+            continue
+        for idx in range(len(padded) - size + 1):
+            shingles.add(padded[idx:idx + size])
+    return frozenset(shingles)
+
+
+def query_terms(query: str) -> frozenset[str]:
+    '''Основы значимых слов запроса.'''
+    return frozenset(tokenize(query))
+
+
+def jaccard(first: frozenset, second: frozenset) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class MinHasher:
+    '''MinHash сигнатуры множеств строк.'''
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, seed=1):
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(_MERSENNE_PRIME))
+            for _ in range(num_permutations)
+        ]
+
+    def signature(self, shingles: frozenset[str]) -> tuple[int, ...]:
+        hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+        return tuple(
+            min((a * value + b) % _MERSENNE_PRIME for value in hashes)
+            for a, b in self._permutations
+        )
+
+
+@dataclass
+class SimilarityEntry:
+    cache_key: Hashable
+    namespace: tuple
+    shingles: frozenset[str]
+    terms: frozenset[str]
+    bands: tuple[tuple, ...]
+
+
+class SimilarityCache:
+    '''
+    Индекс похожих запросов на MinHash и LSH.
+
+    Хранит не сами результаты, а ключи записей RetrievalCache: для
+    нового запроса LSH находит кандидатов с совпадающими полосами
+    сигнатуры, среди них выбирается запрос с наибольшим сходством
+    Жаккара по n-граммам. Соседи ищутся только среди запросов с той же
+    версией базы знаний и лимитом (namespace).
+
+    Сходство n-грамм не отличает перефразирование от запроса про другую
+    марку или модель ("техподдержка Киа" и "техподдержка Хендай"
+    похожи сильнее, чем два варианта одного вопроса). Поэтому сосед
+    переиспользуется, только если слова, которые есть лишь в одном из
+    запросов, не ключевые: ключевыми считаются слова с латиницей или
+    цифрами и редкие слова - встречающиеся меньше чем в rare_share
+    документов по оценке term_share (без term_share - только первые).
+    '''
+
+    def __init__(
+        self,
+        threshold: float,
+        max_entries: int,
+        num_permutations: int = NUM_PERMUTATIONS,
+        bands: int = LSH_BANDS,
+        term_share: Callable[[str], float] | None = None,
+        rare_share: float = 0.01,
+    ):
+        if num_permutations % bands:
+            raise ValueError(
+                'Число перестановок должно делиться на число полос'
+            )
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.term_share = term_share
+        self.rare_share = rare_share
+        self._rows = num_permutations // bands
+        self._hasher = MinHasher(num_permutations)
+        self._entries: OrderedDict[Hashable, SimilarityEntry] = OrderedDict()
+        self._buckets: dict[tuple, set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.guarded = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+
+    def add(self, query: str, cache_key: Hashable, namespace: tuple) -> None:
+        shingles = query_shingles(query)
+        if not shingles:
+            return
+        if cache_key in self._entries:
+            self._entries.move_to_end(cache_key)
+            return
+        entry = SimilarityEntry(
+            cache_key=cache_key,
+            namespace=namespace,
+            shingles=shingles,
+            terms=query_terms(query),
+            bands=self._bands(shingles, namespace),
+        )
+        self._entries[cache_key] = entry
+        for band in entry.bands:
+            self._buckets.setdefault(band, set()).add(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def find(
+        self,
+        query: str,
+        namespace: tuple,
+        threshold: float | None = None,
+    ) -> tuple[Hashable, float] | None:
+        '''
+        Ключ самого похожего запроса и сходство или None, если сходство
+        ниже порога.
+        '''
+        threshold = self.threshold if threshold is None else threshold
+        shingles = query_shingles(query)
+        terms = query_terms(query)
+        best: tuple[Hashable, float] | None = None
+        guarded = False
+        if shingles:
+            candidates = set()
+            for band in self._bands(shingles, namespace):
+                candidates |= self._buckets.get(band, set())
+            for cache_key in candidates:
+                entry = self._entries[cache_key]
+                similarity = jaccard(shingles, entry.shingles)
+                if similarity < threshold or (
+                    best is not None and similarity <= best[1]
+                ):
+                    continue
+                if not self.key_terms_match(terms, entry.terms):
+                    guarded = True
+                    continue
+                best = (cache_key, similarity)
+        if best is None:
+            self.misses += 1
+            self.guarded += guarded
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best[0])
+        return best
+
+    def is_key_term(self, term: str) -> bool:
+        '''Марка, модель, номер или другое слово, меняющее смысл.'''
+        if _LATIN_OR_DIGIT.search(term):
+            return True
+        if self.term_share is None:
+            return False
+        return self.term_share(term) < self.rare_share
+
+    def key_terms_match(
+        self,
+        first: frozenset[str],
+        second: frozenset[str],
+    ) -> bool:
+        '''Ключевые слова двух запросов совпадают точно.'''
+        return not any(self.is_key_term(term) for term in first ^ second)
+
+    def discard(self, cache_key: Hashable) -> None:
+        if cache_key in self._entries:
+            self._remove(cache_key)
+
+    def _bands(
+        self,
+        shingles: frozenset[str],
+        namespace: tuple,
+    ) -> tuple[tuple, ...]:
+        signature = self._hasher.signature(shingles)
+        rows = self._rows
+        return tuple(
+            (namespace, idx, signature[idx * rows:(idx + 1) * rows])
+            for idx in range(len(signature) // rows)
+        )
+
+    def _remove(self, cache_key: Hashable) -> None:
+        entry = self._entries.pop(cache_key)
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is None:
+                continue
+            bucket.discard(cache_key)
+            if not bucket:
+                del self._buckets[band]
+
+
+similarity_cache = SimilarityCache(
+    threshold=settings.rag_similarity_threshold,
+    max_entries=settings.rag_similarity_max_entries,
+    term_share=lexical_index.term_share,
+    rare_share=settings.rag_similarity_rare_share,
+)
@@ -0,0 +1,104 @@
+'''
+Точность кэша похожих запросов на размеченном журнале.
+
+Файл содержит строки "запрос<TAB>метка", где метка обозначает
+намерение: запросы с одной меткой должны получать один и тот же
+контекст. Журнал прогоняется через SimilarityCache так же, как в
+сервере (промах добавляет запрос в индекс), для нескольких порогов:
+
+    python -m app.services.mcp_rag.similarity_replay labelled.tsv \
+        --thresholds 0.5 0.6 0.7 0.8
+
+precision - доля переиспользований с правильной меткой, recall - доля
+запросов с уже встречавшейся меткой, обслуженных переиспользованием.
+'''
+import argparse
+from dataclasses import dataclass
+
+from app.services.mcp_rag.similarity_cache import SimilarityCache
+
+
+@dataclass
+class ReplayResult:
+    threshold: float
+    queries: int = 0
+    reused: int = 0
+    correct: int = 0
+    reusable: int = 0
+
+    @property
+    def precision(self) -> float:
+        return self.correct / self.reused if self.reused else 1.0
+
+    @property
+    def recall(self) -> float:
+        return self.correct / self.reusable if self.reusable else 0.0
+
+
+def replay_labelled(
+    labelled: list[tuple[str, str]],
+    threshold: float,
+) -> ReplayResult:
+    cache = SimilarityCache(threshold=threshold, max_entries=len(labelled))
+    result = ReplayResult(threshold=threshold)
+    labels: dict[str, str] = {}
+    seen_labels: set[str] = set()
+    for query, label in labelled:
+        result.queries += 1
+        if label in seen_labels:
+            result.reusable += 1
+        seen_labels.add(label)
+        neighbour = cache.find(query, namespace=())
+        if neighbour is not None:
+            result.reused += 1
+            result.correct += labels[neighbour[0]] == label
+            continue
+        cache.add(query, query, namespace=())
+        labels[query] = label
+    return result
+
+
+def read_labelled(path: str) -> list[tuple[str, str]]:
+    labelled = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            query, _, label = line.rstrip('\n').partition('\t')
+            labelled.append((query.strip(), label.strip()))
+    return labelled
+
+
+def format_similarity_report(results: list[ReplayResult]) -> str:
+    lines = [
+        f'{"порог":>6}{"запросов":>10}{"переисп.":>10}'
+        f'{"precision":>11}{"recall":>9}',
+    ]
+    for result in results:
+        lines.append(
+            f'{result.threshold:>6.2f}{result.queries:>10}'
+            f'{result.reused:>10}{result.precision:>11.1%}'
+            f'{result.recall:>9.1%}'
+        )
+    return '\n'.join(lines)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Точность кэша похожих запросов на размеченном журнале'
+    )
+    parser.add_argument('labelled', help='TSV файл: запрос<TAB>метка')
+    parser.add_argument(
+        '--thresholds', type=float, nargs='+',
+        default=[0.5, 0.6, 0.7, 0.8, 0.9],
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    labelled_queries = read_labelled(args.labelled)
+    print(format_similarity_report([
+        replay_labelled(labelled_queries, threshold)
+        for threshold in args.thresholds
+    ]))
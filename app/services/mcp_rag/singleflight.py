@@ -0,0 +1,45 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    '''
+    Объединяет одновременные одинаковые вызовы в один.
+
+    Первый вызов с ключом запускает задачу, остальные до ее завершения
+    ожидают тот же результат или то же исключение.
+    '''
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.create_task(func())
+            self._inflight[key] = task
+            task.add_done_callback(
+                lambda done_task: self._forget(key, done_task)
+            )
+        else:
+            self.coalesced += 1
+        # shield: отмена одного ожидающего не отменяет общий вызов
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Помечаем исключение полученным, даже если все ожидающие
+            # были отменены
+            task.exception()
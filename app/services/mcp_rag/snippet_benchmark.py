@@ -0,0 +1,184 @@
+'''
+Размер промпта и время до первого токена с фрагментами документов.
+
+Сравнивает три варианта контекста для одних и тех же выдач Managed RAG:
+чанки целиком, начало каждого чанка и фрагменты,
+относящиеся к запросу (extract_snippets). Выдачи читаются из JSON файла
+со списком {"query": ..., "results": [...]} или генерируются:
+
+    python -m app.services.mcp_rag.snippet_benchmark --queries 50
+    python -m app.services.mcp_rag.snippet_benchmark \
+        --retrieved retrieved.json --gigachat --repeats 5
+
+С --gigachat для каждого варианта замеряется время до первого токена
+потокового ответа GigaChat (параметры подключения берутся из настроек).
+'''
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import json
+import random
+import time
+from typing import Any
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.core.config import settings
+from app.services.agent.ai_agent import load_system_prompt, make_gigachat
+from app.services.agent.mcp_client import format_documents
+from app.services.mcp_rag.benchmark import BASE_QUERIES, percentile
+from app.services.mcp_rag.context_packer import (
+    estimate_tokens,
+    pack_documents,
+)
+from app.services.mcp_rag.fake_rag_server import FILLER_WORDS
+
+
+MODES = ('full', 'head', 'snippets')
+
+
+@dataclass
+class ModeResult:
+    mode: str
+    prompt_tokens: list[int] = field(default_factory=list)
+    ttft: list[float] = field(default_factory=list)
+
+
+def synthetic_retrieved(
+    queries: int,
+    documents: int = 6,
+    sentences: int = 12,
+    seed: int = 1,
+) -> list[dict[str, Any]]:
+    '''
+    Выдачи из чанков по sentences предложений, одно из которых
+    повторяет запрос, остальные - случайные слова.
+    '''
+    rng = random.Random(seed)
+    retrieved = []
+    for idx in range(queries):
+        query = BASE_QUERIES[idx % len(BASE_QUERIES)]
+        results = []
+        for _ in range(documents):
+            chunk = [
+                ' '.join(rng.choices(FILLER_WORDS, k=12)).capitalize() + '.'
+                for _ in range(sentences)
+            ]
+            chunk[rng.randrange(sentences)] = f'{query}: ' + ' '.join(
+                rng.choices(FILLER_WORDS, k=8)
+            ) + '.'
+            results.append({
+                'content': ' '.join(chunk),
+                'metadata': {'source': f'document_{idx}.pdf'},
+            })
+        retrieved.append({'query': query, 'results': results})
+    return retrieved
+
+
+def build_context(mode: str, query: str, retrieve_result: dict) -> str:
+    documents = pack_documents(
+        retrieve_result, query if mode == 'snippets' else None
+    )
+    if mode == 'full':
+        # Как агент, подставляющий полные тексты вместо фрагментов
+        return format_documents(
+            documents, {doc['id']: doc['body'] for doc in documents}
+        )
+    return format_documents(documents)
+
+
+def build_messages(system_prompt: str, query: str, context: str) -> list:
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=f'{context}\nВопрос: {query}'),
+    ]
+
+
+async def measure_ttft(llm, messages: list) -> float:
+    '''Время до первого непустого фрагмента потокового ответа.'''
+    started = time.perf_counter()
+    async for chunk in llm.astream(messages):
+        if getattr(chunk, 'content', None):
+            break
+    return time.perf_counter() - started
+
+
+async def run_snippet_benchmark(
+    retrieved: list[dict[str, Any]],
+    llm=None,
+    repeats: int = 1,
+) -> list[ModeResult]:
+    system_prompt = load_system_prompt()
+    results = {mode: ModeResult(mode) for mode in MODES}
+    for item in retrieved:
+        query = item['query']
+        for mode in MODES:
+            context = build_context(mode, query, item)
+            messages = build_messages(system_prompt, query, context)
+            results[mode].prompt_tokens.append(sum(
+                estimate_tokens(message.content) for message in messages
+            ))
+            if llm is None:
+                continue
+            for _ in range(repeats):
+                results[mode].ttft.append(
+                    await measure_ttft(llm, messages)
+                )
+    return list(results.values())
+
+
+def format_snippet_report(results: list[ModeResult]) -> str:
+    baseline = results[0]
+    base_tokens = sum(baseline.prompt_tokens) or 1
+    lines = [
+        f'{"контекст":<10}{"токенов":>10}{"к full":>9}'
+        f'{"TTFT p50, мс":>15}{"TTFT p95, мс":>15}',
+    ]
+    for result in results:
+        tokens = sum(result.prompt_tokens)
+        average = tokens / max(len(result.prompt_tokens), 1)
+        if result.ttft:
+            ttft = (
+                f'{percentile(result.ttft, 0.5) * 1000:>15.0f}'
+                f'{percentile(result.ttft, 0.95) * 1000:>15.0f}'
+            )
+        else:
+            ttft = f'{"-":>15}{"-":>15}'
+        lines.append(
+            f'{result.mode:<10}{average:>10.0f}'
+            f'{tokens / base_tokens - 1:>+9.1%}{ttft}'
+        )
+    return '\n'.join(lines)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Размер промпта и TTFT с фрагментами документов'
+    )
+    parser.add_argument(
+        '--retrieved', help='JSON файл со списком выдач Managed RAG'
+    )
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--gigachat', action='store_true')
+    parser.add_argument('--repeats', type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.retrieved:
+        with open(args.retrieved, encoding='utf-8') as file:
+            retrieved_results = json.load(file)
+    else:
+        retrieved_results = synthetic_retrieved(args.queries)
+    print(format_snippet_report(asyncio.run(run_snippet_benchmark(
+        retrieved_results,
+        llm=make_gigachat(
+            model_name=settings.gigachat_model,
+            temperature=settings.gigachat_temperature,
+            scope=settings.gigachat_scope,
+            credentials=settings.gigachat_credentials,
+            verify_ssl=settings.gigachat_verify_ssl,
+        ) if args.gigachat else None,
+        repeats=args.repeats,
+    ))))
@@ -0,0 +1,237 @@
+import asyncio
+import time
+from typing import Any
+
+import httpx
+
+from app.core.config import settings
+from app.logging import logging_config
+from app.services.mcp_rag.http_client import rag_http_client
+from app.services.mcp_rag.metrics import stage_duration, token_refreshes
+from app.services.mcp_rag.shared_state import shared_state
+
+
+SHARED_TOKEN_KEY = 'rag_access_token'
+
+
+class TokenManager:
+    '''
+    Управляет access token для Evolution Managed RAG.
+
+    Токен запрашивается при старте сервера и обновляется фоновой задачей
+    до истечения срока действия из expires_in. Пока идет обновление,
+    вызовы получают прежний токен до его истечения; без действующего
+    токена одновременные обращения ожидают один общий запрос. Если
+    настроено общее хранилище, токен разделяется между worker
+    процессами сервера.
+    '''
+
+    def __init__(self):
+        self._token: str | None = None
+        # Истечение токена и момент, с которого его обновляют в фоне
+        self._expires_at: float = 0.0
+        self._refresh_at: float = 0.0
+        self._inflight: asyncio.Task | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self.refresh_count = 0
+
+    @property
+    def is_valid(self) -> bool:
+        return (
+            self._token is not None
+            and time.monotonic() < self._expires_at
+        )
+
+    @property
+    def needs_refresh(self) -> bool:
+        return time.monotonic() >= self._refresh_at
+
+    async def start(self) -> None:
+        '''Получает первый токен и запускает фоновое обновление.'''
+        logger = logging_config.get_endpoint_logger('mcp_rag_server')
+        try:
+            await self.refresh()
+        except RuntimeError as e:
+            logger.error(f'Не удалось получить токен при старте: {e}')
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        '''Останавливает фоновое обновление токена.'''
+        tasks = [
+            task for task in (self._refresh_task, self._inflight)
+            if task is not None and not task.done()
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refresh_task = None
+        self._inflight = None
+
+    def reset(self) -> None:
+        '''
+        Забывает текущий токен: следующий get_token запросит новый.
+
+        Фоновое обновление не останавливается, для этого есть stop().
+        '''
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._inflight = None
+
+    async def get_token(self) -> str:
+        '''
+        Возвращает действующий токен, при необходимости обновляя его.
+
+        Токен, который пора обновить, но который еще не истек,
+        возвращается сразу, а обновление идет в фоне: ждать auth API
+        приходится только без действующего токена.
+        '''
+        if self.is_valid:
+            if self.needs_refresh:
+                self._start_fetch()
+            return self._token
+        return await self.refresh()
+
+    async def refresh(self, stale_token: str | None = None) -> str:
+        '''
+        Обновляет токен, объединяя одновременные вызовы в один запрос.
+
+        Args:
+            stale_token: Токен, на который upstream ответил 401. Если он
+                уже заменен другим вызовом, повторный запрос не делается.
+        '''
+        if (
+            stale_token is not None
+            and self._token is not None
+            and self._token != stale_token
+            and self.is_valid
+        ):
+            return self._token
+        # shield: отмена одного ожидающего не прерывает общий запрос
+        return await asyncio.shield(self._start_fetch(stale_token))
+
+    def _start_fetch(self, stale_token: str | None = None) -> asyncio.Task:
+        '''Запускает запрос токена, если он еще не выполняется.'''
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(
+                self._fetch_token(stale_token)
+            )
+            # Ошибку фонового обновления без ожидающих не логируем
+            # как необработанную: ее увидит следующий refresh
+            self._inflight.add_done_callback(
+                lambda task: task.cancelled() or task.exception()
+            )
+        return self._inflight
+
+    def _refresh_delay(self) -> float:
+        if self._token is None:
+            return settings.rag_token_retry_delay
+        remaining = self._refresh_at - time.monotonic()
+        return max(remaining, 0.0)
+
+    async def _refresh_loop(self) -> None:
+        logger = logging_config.get_endpoint_logger('mcp_rag_server')
+        while True:
+            await asyncio.sleep(self._refresh_delay())
+            try:
+                await self.refresh()
+            except RuntimeError as e:
+                logger.error(f'Фоновое обновление токена не удалось: {e}')
+                await asyncio.sleep(settings.rag_token_retry_delay)
+
+    async def _fetch_token(self, stale_token: str | None = None) -> str:
+        shared_token = await self._load_shared_token(stale_token)
+        if shared_token is not None:
+            return shared_token
+        try:
+            with stage_duration.time(stage='auth'):
+                access_token, expires_in = await self._request_token()
+        except RuntimeError:
+            token_refreshes.inc(result='error')
+            raise
+        token_refreshes.inc(result='success')
+        ttl = self._token_ttl(expires_in)
+        now = time.monotonic()
+        self._token = access_token
+        self._expires_at = now + ttl
+        self._refresh_at = now + self._refresh_after(ttl)
+        self.refresh_count += 1
+        await shared_state.set(
+            SHARED_TOKEN_KEY, access_token, time.time() + ttl
+        )
+        return access_token
+
+    async def _load_shared_token(
+        self,
+        stale_token: str | None,
+    ) -> str | None:
+        '''Берет токен, уже полученный другим worker процессом.'''
+        shared = await shared_state.get(SHARED_TOKEN_KEY)
+        if shared is None:
+            return None
+        access_token, expires_at = shared
+        if access_token in (stale_token, self._token):
+            return None
+        token_refreshes.inc(result='shared')
+        remaining = expires_at - time.time()
+        now = time.monotonic()
+        self._token = access_token
+        self._expires_at = now + remaining
+        self._refresh_at = now + remaining - min(
+            settings.rag_token_refresh_margin, remaining / 2
+        )
+        return access_token
+
+    async def _request_token(self) -> tuple[str, Any]:
+        try:
+            token_response = await rag_http_client.client.post(
+                settings.auth_url,
+                data={
+                    'grant_type': 'client_credentials',
+                    'client_id': settings.key_id,
+                    'client_secret': settings.key_secret,
+                },
+                timeout=rag_http_client.auth_timeout,
+            )
+            token_response.raise_for_status()
+            token_data = token_response.json()
+            access_token = token_data.get('access_token')
+            if not access_token:
+                raise ValueError(
+                    'Ответ аутентификации не содержит access_token'
+                    )
+        except httpx.HTTPStatusError as e:
+            raise RuntimeError(
+                f'Ошибка при получении access token. '
+                f'Статус: {e.response.status_code}; '
+                f'Сообщение: {e.response.text}'
+            )
+        except httpx.TimeoutException:
+            raise RuntimeError('Таймаут при получении access token.')
+        except httpx.RequestError as e:
+            raise RuntimeError(f'Сетевая ошибка аутентификации: {e}')
+        except Exception as e:
+            raise RuntimeError(f'Неожиданная ошибка аутентификации: {e}')
+        return access_token, token_data.get('expires_in')
+
+    @staticmethod
+    def _token_ttl(expires_in) -> float:
+        '''Срок жизни токена в секундах по expires_in.'''
+        try:
+            ttl = float(expires_in)
+        except (TypeError, ValueError):
+            ttl = settings.rag_token_default_ttl
+        if ttl <= 0:
+            ttl = settings.rag_token_default_ttl
+        return ttl
+
+    @classmethod
+    def _refresh_after(cls, expires_in) -> float:
+        '''Через сколько секунд токен пора обновлять в фоне.'''
+        ttl = cls._token_ttl(expires_in)
+        # Для коротких токенов запас не превышает половины срока жизни
+        return ttl - min(settings.rag_token_refresh_margin, ttl / 2)
+
+
+token_manager = TokenManager()
@@ -0,0 +1,137 @@
+'''
+Сравнение транспортов MCP: SSE и streamable HTTP.
+
+Для каждого транспорта открывает sessions сессий через McpClient (тот же
+клиент, что использует AI агент), замеряет время установки сессии
+(подключение и initialize) и задержку вызовов инструмента. Сервер
+запускается дважды, по одному процессу на транспорт:
+
+    python -m app.services.mcp_rag.fake_rag_server --port 8010
+    export AUTH_URL=http://localhost:8010/token
+    export RETRIEVE_URL_TEMPLATE=http://localhost:8010/retrieve
+    MCP_TRANSPORT=sse python -m app.services.mcp_rag.server
+    MCP_TRANSPORT=streamable-http MCP_SERVER_PORT=8004 \
+        python -m app.services.mcp_rag.server
+    python -m app.services.mcp_rag.transport_benchmark \
+        --sse-url http://localhost:8003/sse \
+        --http-url http://localhost:8004/mcp
+'''
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import time
+
+from app.services.agent.mcp_client import McpClient
+from app.services.mcp_rag.benchmark import build_queries, summarize_latencies
+
+
+SSE_URL = 'http://localhost:8003/sse'
+STREAMABLE_HTTP_URL = 'http://localhost:8004/mcp'
+
+
+@dataclass
+class TransportResult:
+    '''Замеры одного транспорта.'''
+
+    transport: str
+    setup: list[float] = field(default_factory=list)
+    calls: list[float] = field(default_factory=list)
+    errors: int = 0
+
+
+async def measure_transport(
+    url: str,
+    transport: str,
+    tool: str,
+    sessions: int,
+    calls_per_session: int,
+    concurrency: int,
+    queries: list[str],
+) -> TransportResult:
+    '''Открывает sessions сессий и выполняет в каждой серию вызовов.'''
+    result = TransportResult(transport=transport)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run_session(session_idx: int) -> None:
+        async with semaphore:
+            try:
+                started = time.perf_counter()
+                async with McpClient(url, transport=transport) as client:
+                    result.setup.append(time.perf_counter() - started)
+                    for call_idx in range(calls_per_session):
+                        query = queries[
+                            (session_idx * calls_per_session + call_idx)
+                            % len(queries)
+                        ]
+                        call_started = time.perf_counter()
+                        # Ошибка инструмента (isError) поднимает
+                        # McpToolError и считается в errors
+                        await client.call_tool_documents(
+                            tool, {'query': query}
+                        )
+                        result.calls.append(
+                            time.perf_counter() - call_started
+                        )
+            except Exception:
+                result.errors += 1
+
+    await asyncio.gather(*(run_session(idx) for idx in range(sessions)))
+    return result
+
+
+def format_transport_report(result: TransportResult) -> str:
+    setup = summarize_latencies(result.setup)
+    calls = summarize_latencies(result.calls)
+    return (
+        f'{result.transport}\n'
+        f'  сессий: {len(result.setup)}, вызовов: {len(result.calls)}, '
+        f'ошибок: {result.errors}\n'
+        f'  установка сессии, мс: '
+        f'p50={setup["p50"] * 1000:.1f} '
+        f'p95={setup["p95"] * 1000:.1f} '
+        f'max={setup["max"] * 1000:.1f}\n'
+        f'  вызов инструмента, мс: '
+        f'p50={calls["p50"] * 1000:.1f} '
+        f'p95={calls["p95"] * 1000:.1f} '
+        f'p99={calls["p99"] * 1000:.1f}'
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Сравнение транспортов MCP: SSE и streamable HTTP'
+    )
+    parser.add_argument('--sse-url', default=SSE_URL)
+    parser.add_argument('--http-url', default=STREAMABLE_HTTP_URL)
+    parser.add_argument('--tool', default='request_to_rag')
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument(
+        '--calls', type=int, default=10,
+        help='Вызовов инструмента в каждой сессии',
+    )
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--distinct-queries', type=int, default=20)
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    queries = build_queries(args.distinct_queries)
+    for transport, url in (
+        ('sse', args.sse_url),
+        ('streamable-http', args.http_url),
+    ):
+        result = await measure_transport(
+            url=url,
+            transport=transport,
+            tool=args.tool,
+            sessions=args.sessions,
+            calls_per_session=args.calls,
+            concurrency=args.concurrency,
+            queries=queries,
+        )
+        print(format_transport_report(result))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -2,9 +2,11 @@
 Конфигурация для тестов
 '''
 import asyncio
+import socket
 import pytest
 import pytest_asyncio
 from typing import AsyncGenerator, Generator
+import httpx
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import (
     AsyncSession, create_async_engine, async_sessionmaker
@@ -16,6 +18,16 @@ from app.core.db import get_async_session, Base
 from app.models.user import User
 from app.core.user import get_user_manager
 from app.schemas.user import UserCreate
+from app.core.config import settings
+from app.services.mcp_rag.cache import retrieval_cache
+from app.services.mcp_rag.document_store import document_store
+from app.services.mcp_rag.fake_rag_server import (
+    FakeRagConfig, create_fake_rag_app
+)
+from app.services.mcp_rag.http_client import rag_http_client
+from app.services.mcp_rag.lexical_index import lexical_index
+from app.services.mcp_rag.similarity_cache import similarity_cache
+from app.services.mcp_rag.token_manager import token_manager
 
 
 # Тестовая база данных
@@ -265,3 +277,120 @@ async def superuser_auth_headers(
         assert verify_response.status_code == 200
         token = verify_response.json()['access_token']
         return {'Authorization': f'Bearer {token}'}
+
+
+# Общие helpers и фикстуры тестов MCP RAG сервера
+
+FAKE_RAG_URL = 'http://fake-rag'
+
+
+class FakeClock:
+    '''Управляемые часы для проверки TTL и таймаутов'''
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_rag_handler(
+    calls: list,
+    documents: list | None = None,
+    expired_tokens: set | None = None,
+):
+    '''Создает обработчик, имитирующий auth и retrieve API'''
+    if documents is None:
+        documents = [{
+            'content': 'Телефон поддержки 8-800',
+            'metadata': {'file': 'a.pdf'},
+        }]
+    expired_tokens = expired_tokens if expired_tokens is not None else set()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if str(request.url) == settings.auth_url:
+            token_number = sum(
+                str(call.url) == settings.auth_url for call in calls
+            )
+            return httpx.Response(
+                200,
+                json={
+                    'access_token': f'token-{token_number}',
+                    'expires_in': 3600,
+                },
+            )
+        token = request.headers['Authorization'].removeprefix('Bearer ')
+        if token in expired_tokens:
+            return httpx.Response(401, text='token expired')
+        return httpx.Response(200, json={'results': documents})
+
+    return handler
+
+
+def contents(documents: list[dict]) -> str:
+    '''Фрагменты документов из ответа инструмента одной строкой'''
+    return '\n'.join(document['content'] for document in documents)
+
+
+def use_mock_transport(monkeypatch, handler) -> None:
+    '''Подменяет общий HTTP клиент клиентом с MockTransport'''
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(rag_http_client, '_client', client)
+
+
+async def serve(transport: str):
+    '''Запускает MCP сервер в текущем event loop на свободном порту'''
+    import uvicorn
+
+    from app.services.mcp_rag import server
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    uvicorn_server = uvicorn.Server(uvicorn.Config(
+        server.mcp.http_app(transport=transport), log_level='warning'
+    ))
+    task = asyncio.create_task(uvicorn_server.serve(sockets=[sock]))
+    while not uvicorn_server.started:
+        await asyncio.sleep(0.01)
+    url = f'http://127.0.0.1:{port}{server.transport_path(transport)}'
+    return url, uvicorn_server, task
+
+
+@pytest.fixture(autouse=True)
+def reset_rag_state():
+    '''Сбрасывает общий токен, кэши и HTTP клиент MCP RAG между тестами'''
+    yield
+    retrieval_cache.clear()
+    similarity_cache.clear()
+    lexical_index.clear()
+    document_store.clear()
+    token_manager.reset()
+    rag_http_client._client = None
+
+
+@pytest.fixture
+def fake_rag(monkeypatch):
+    '''
+    Направляет MCP сервер на заглушку Managed RAG через ASGITransport.
+
+    Возвращает функцию, которая запускает заглушку с заданной
+    конфигурацией и возвращает ее приложение.
+    '''
+    def use(config: FakeRagConfig | None = None):
+        app = create_fake_rag_app(
+            config or FakeRagConfig(latency_median=0)
+        )
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url=FAKE_RAG_URL,
+        )
+        monkeypatch.setattr(rag_http_client, '_client', client)
+        monkeypatch.setattr(settings, 'auth_url', f'{FAKE_RAG_URL}/token')
+        monkeypatch.setattr(
+            settings, 'retrieve_url_template', f'{FAKE_RAG_URL}/retrieve'
+        )
+        return app
+
+    return use
@@ -0,0 +1,420 @@
+'''
+Тесты AI агента с MCP RAG инструментом
+'''
+import asyncio
+from itertools import cycle
+import json
+from unittest.mock import AsyncMock
+
+from httpx import ASGITransport, AsyncClient
+from langchain_core.language_models.fake_chat_models import (
+    GenericFakeChatModel,
+)
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+import pytest
+
+from app.api.validators import current_admin_or_superuser
+from app.core.config import settings
+from app.main import app
+from app.services.agent import ai_agent
+from app.services.agent.agent_benchmark import (
+    FakeGigaChat,
+    format_agent_report,
+    run_agent_benchmark,
+)
+from app.services.agent.ai_agent import FAST_MODE, RagAgent
+from app.services.agent.prefetch import (
+    SpeculativeRetrieval,
+    prefetch_hit_rate,
+    prefetch_misses,
+    prefetch_outcomes,
+    query_similarity,
+)
+from app.services.mcp_rag.benchmark import percentile
+
+
+ANSWER = 'Гарантия составляет три года'
+
+
+class FakeToolCallingModel(GenericFakeChatModel):
+    '''Модель, которая сначала вызывает инструмент, затем отвечает'''
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = next(self.messages)
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content='',
+                tool_call_chunks=[{
+                    'name': call['name'],
+                    'args': json.dumps(call['args'], ensure_ascii=False),
+                    'id': call['id'],
+                    'index': idx,
+                } for idx, call in enumerate(message.tool_calls)],
+            ))
+            return
+        for word in message.content.split(' '):
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=f'{word} '
+            ))
+
+
+def make_model(query: str = 'гарантия') -> FakeToolCallingModel:
+    return FakeToolCallingModel(messages=cycle([
+        AIMessage(content='', tool_calls=[{
+            'name': 'request_to_rag',
+            'args': {'query': query},
+            'id': 'call-1',
+        }]),
+        AIMessage(content=ANSWER),
+    ]))
+
+
+class FakeMcp:
+    '''MCP клиент, записывающий вызовы инструмента'''
+
+    def __init__(self, name: str = 'session', empty: bool = False):
+        self.name = name
+        self.empty = empty
+        self.calls = []
+
+    async def call_tool_text(self, name, arguments):
+        self.calls.append((name, arguments))
+        await asyncio.sleep(0)
+        return f'Context: {self.name}'
+
+    async def call_tool_documents(self, name, arguments):
+        self.calls.append((name, arguments))
+        if self.empty and len(self.calls) == 1:
+            return []
+        return [
+            {'id': 'a', 'content': 'фрагмент…', 'metadata': {}},
+            {'id': 'b', 'content': 'второй', 'metadata': {}},
+        ]
+
+    async def read_document(self, doc_id):
+        if doc_id != 'a':
+            raise RuntimeError('not found')
+        return 'полный текст'
+
+
+async def collect(agent: RagAgent, mcp) -> str:
+    return ''.join([
+        chunk async for chunk in agent.astream_answer('Гарантия?', mcp)
+    ])
+
+
+class TestRagAgent:
+    '''Тесты общего для процесса агента'''
+
+    @pytest.mark.asyncio
+    async def test_streams_answer_after_tool_call(self):
+        '''Тест ответа с вызовом инструмента через сессию запроса'''
+        agent = RagAgent(make_model(), 'request_to_rag', system_prompt='sys')
+        mcp = FakeMcp()
+
+        answer = await collect(agent, mcp)
+
+        assert answer.strip() == ANSWER
+        assert mcp.calls == [('request_to_rag', {'query': 'гарантия'})]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_use_own_sessions(self):
+        '''Тест что один граф обслуживает запросы с разными сессиями'''
+        agent = RagAgent(make_model(), 'request_to_rag', system_prompt='sys')
+        sessions = [FakeMcp(f'session-{idx}') for idx in range(2)]
+
+        for mcp in sessions:
+            await collect(agent, mcp)
+
+        assert [len(mcp.calls) for mcp in sessions] == [1, 1]
+
+    @pytest.mark.asyncio
+    async def test_inlines_full_documents(self):
+        '''Тест подстановки полного текста первых документов'''
+        agent = RagAgent(
+            make_model(), 'request_to_rag',
+            inline_documents=2, system_prompt='sys',
+        )
+
+        context = await agent.fetch_context(FakeMcp(), 'гарантия')
+
+        assert 'Content: полный текст' in context
+        assert 'Content: второй' in context
+
+    @pytest.mark.asyncio
+    async def test_inlined_body_cut_to_context_budget(self, monkeypatch):
+        '''Тест обрезки полного текста по бюджету контекста'''
+        monkeypatch.setattr(settings, 'rag_context_chars_per_token', 1.0)
+        monkeypatch.setattr(settings, 'rag_context_max_tokens', 20)
+        mcp = FakeMcp()
+        mcp.read_document = AsyncMock(return_value='слово ' * 20)
+        agent = RagAgent(
+            make_model(), 'request_to_rag',
+            inline_documents=2, system_prompt='sys',
+        )
+
+        documents, bodies = await agent.retrieve(mcp, 'гарантия')
+
+        snippets = sum(len(doc['content']) for doc in documents)
+        assert len(bodies['a']) <= 20 - snippets + len('фрагмент…')
+        assert bodies['a'].endswith('…')
+        assert 'b' not in bodies
+
+    @pytest.mark.asyncio
+    async def test_no_reads_without_budget(self, monkeypatch):
+        '''Тест что тексты не читаются, если фрагменты заняли бюджет'''
+        monkeypatch.setattr(settings, 'rag_context_chars_per_token', 1.0)
+        monkeypatch.setattr(settings, 'rag_context_max_tokens', 10)
+        mcp = FakeMcp()
+        mcp.read_document = AsyncMock(return_value='полный текст')
+        agent = RagAgent(
+            make_model(), 'request_to_rag',
+            inline_documents=2, system_prompt='sys',
+        )
+
+        _, bodies = await agent.retrieve(mcp, 'гарантия')
+
+        assert bodies == {}
+        mcp.read_document.assert_not_awaited()
+
+    def test_agent_built_once(self, monkeypatch):
+        '''Тест что агент создается один раз на процесс'''
+        built = []
+
+        def fake_make_gigachat(**kwargs):
+            built.append(kwargs)
+            return make_model()
+
+        monkeypatch.setattr(ai_agent, 'make_gigachat', fake_make_gigachat)
+        ai_agent.get_rag_agent.cache_clear()
+        try:
+            first = ai_agent.get_rag_agent()
+            second = ai_agent.get_rag_agent()
+        finally:
+            ai_agent.get_rag_agent.cache_clear()
+
+        assert first is second
+        assert len(built) == 1
+
+
+class RecordingGigaChat(FakeGigaChat):
+    '''Быстрая модель, запоминающая промпты своих вызовов'''
+
+    first_token_latency: float = 0
+    token_latency: float = 0
+    prompts: list = []
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={'tools_bound': True})
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kw):
+        self.prompts.append(messages)
+        async for chunk in super()._astream(messages, stop, run_manager):
+            yield chunk
+
+
+class TestFastPath:
+    '''Тесты режима с прямым поиском и одним вызовом LLM'''
+
+    def make_agent(self) -> RagAgent:
+        return RagAgent(
+            RecordingGigaChat(answer=ANSWER), 'request_to_rag',
+            inline_documents=1, system_prompt='sys', mode=FAST_MODE,
+        )
+
+    @pytest.mark.asyncio
+    async def test_single_llm_call_with_context(self):
+        '''Тест поиска по вопросу и одного потокового вызова LLM'''
+        agent = self.make_agent()
+        mcp = FakeMcp()
+
+        answer = await collect(agent, mcp)
+
+        assert answer.strip() == ANSWER
+        assert mcp.calls == [('request_to_rag', {'query': 'Гарантия?'})]
+        [prompt] = agent.llm.prompts
+        assert prompt[0].content == agent.fast_system_prompt
+        assert 'Content: полный текст' in prompt[1].content
+        assert prompt[1].content.endswith('Вопрос: Гарантия?')
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_react_without_documents(self):
+        '''Тест перехода к ReAct агенту, если поиск ничего не нашел'''
+        agent = self.make_agent()
+        mcp = FakeMcp(empty=True)
+
+        answer = await collect(agent, mcp)
+
+        assert answer.strip() == ANSWER
+        assert len(mcp.calls) == 2
+        assert len(agent.llm.prompts) == 2
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_react_on_tool_error(self):
+        '''Тест перехода к ReAct агенту при ошибке инструмента'''
+        agent = self.make_agent()
+        mcp = FakeMcp()
+        calls = 0
+
+        async def failing_once(name, arguments):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise RuntimeError('connection reset')
+            return await FakeMcp.call_tool_documents(mcp, name, arguments)
+
+        mcp.call_tool_documents = failing_once
+
+        answer = await collect(agent, mcp)
+
+        assert answer.strip() == ANSWER
+        assert calls == 2
+
+    def test_unknown_mode_rejected(self):
+        '''Тест ошибки для неизвестного режима агента'''
+        with pytest.raises(ValueError):
+            RagAgent(make_model(), 'request_to_rag', mode='planner')
+
+    @pytest.mark.asyncio
+    async def test_benchmark_fast_path_ttft(self):
+        '''Тест что быстрый режим экономит один проход LLM до ответа'''
+        results = await run_agent_benchmark(
+            ['Гарантия?', 'Сроки доставки?'],
+            llm=FakeGigaChat(first_token_latency=0.05, token_latency=0),
+            rag_latency=0.05,
+        )
+
+        fast, react, prefetch = results
+        assert [result.mode for result in results] == [
+            'fast', 'react', 'prefetch'
+        ]
+        assert fast.tool_calls == react.tool_calls == 2
+        react_ttft = percentile(react.ttft, 0.5)
+        assert percentile(fast.ttft, 0.5) + 0.025 < react_ttft
+        assert percentile(prefetch.ttft, 0.5) + 0.025 < react_ttft
+        assert 'fast' in format_agent_report(results)
+
+
+class TestSpeculativePrefetch:
+    '''Тесты упреждающего поиска параллельно с планированием LLM'''
+
+    def make_agent(self, query: str) -> RagAgent:
+        return RagAgent(
+            make_model(query), 'request_to_rag',
+            system_prompt='sys', speculative_prefetch=True,
+        )
+
+    def test_query_similarity(self):
+        '''Тест сходства вопроса и запроса к инструменту'''
+        question = 'Какая гарантия на аккумуляторную батарею?'
+
+        assert query_similarity(
+            question, 'гарантия аккумуляторная батарея'
+        ) >= 0.7
+        assert query_similarity(question, 'сроки доставки') < 0.3
+        assert query_similarity('', 'доставка') == 0.0
+
+    @pytest.mark.asyncio
+    async def test_similar_tool_query_reuses_prefetch(self):
+        '''Тест что похожий запрос инструмента берет готовый поиск'''
+        agent = self.make_agent('гарантия')
+        mcp = FakeMcp()
+        hits = prefetch_outcomes.value(outcome='hit')
+
+        answer = await collect(agent, mcp)
+
+        assert answer.strip() == ANSWER
+        assert mcp.calls == [('request_to_rag', {'query': 'Гарантия?'})]
+        assert prefetch_outcomes.value(outcome='hit') == hits + 1
+        assert prefetch_hit_rate() > 0
+
+    @pytest.mark.asyncio
+    async def test_different_tool_query_cancels_prefetch(self):
+        '''Тест отмены поиска, если агент искал другой запрос'''
+        agent = self.make_agent('сроки доставки')
+        mcp = FakeMcp()
+        started = asyncio.Event()
+        cancelled = []
+
+        async def slow_documents(name, arguments):
+            if arguments['query'] == 'Гарантия?':
+                started.set()
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.append(arguments['query'])
+                    raise
+            return await FakeMcp.call_tool_documents(mcp, name, arguments)
+
+        mcp.call_tool_documents = slow_documents
+        misses = prefetch_misses.value()
+        unused = prefetch_outcomes.value(outcome='unused')
+
+        answer = await collect(agent, mcp)
+
+        assert answer.strip() == ANSWER
+        assert started.is_set()
+        assert cancelled == ['Гарантия?']
+        assert mcp.calls == [('request_to_rag', {'query': 'сроки доставки'})]
+        assert prefetch_misses.value() == misses + 1
+        assert prefetch_outcomes.value(outcome='unused') == unused + 1
+
+    @pytest.mark.asyncio
+    async def test_failed_prefetch_not_reused(self):
+        '''Тест что после ошибки упреждающего поиска инструмент ищет сам'''
+        calls = []
+
+        async def fetch(query):
+            calls.append(query)
+            if len(calls) == 1:
+                raise RuntimeError('connection reset')
+            return query
+
+        failed = prefetch_outcomes.value(outcome='failed')
+        prefetch = SpeculativeRetrieval('Гарантия?', fetch)
+
+        assert await prefetch.claim('гарантия') is None
+        await prefetch.finish()
+
+        assert prefetch_outcomes.value(outcome='failed') == failed + 1
+        assert calls == ['Гарантия?']
+
+    @pytest.mark.asyncio
+    async def test_unclaimed_failed_prefetch_counted_as_failed(self):
+        '''Тест что неиспользованный упавший поиск считается failed'''
+        async def fetch(query):
+            raise RuntimeError('connection reset')
+
+        failed = prefetch_outcomes.value(outcome='failed')
+        unused = prefetch_outcomes.value(outcome='unused')
+        prefetch = SpeculativeRetrieval('Гарантия?', fetch)
+        await asyncio.sleep(0)
+
+        await prefetch.finish()
+
+        assert prefetch_outcomes.value(outcome='failed') == failed + 1
+        assert prefetch_outcomes.value(outcome='unused') == unused
+
+    @pytest.mark.asyncio
+    async def test_metrics_exported(self):
+        '''Тест что метрики упреждающего поиска видны в /metrics'''
+        async def fetch(query):
+            return ['документ']
+
+        prefetch = SpeculativeRetrieval('Гарантия?', fetch)
+        await prefetch.claim('Гарантия?')
+        app.dependency_overrides[current_admin_or_superuser] = object
+        try:
+            async with AsyncClient(
+                transport=ASGITransport(app=app), base_url='http://test'
+            ) as client:
+                response = await client.get('/metrics')
+        finally:
+            app.dependency_overrides.pop(current_admin_or_superuser)
+
+        assert 'agent_prefetch_total{outcome="hit"}' in response.text
+        assert 'agent_prefetch_hit_ratio' in response.text
@@ -0,0 +1,300 @@
+'''
+Тесты кэша готовых ответов AI агента
+'''
+import asyncio
+
+from httpx import ASGITransport, AsyncClient
+import pytest
+
+from app.api.validators import current_admin_or_superuser
+from app.core.config import settings
+from app.core.user import current_user
+from app.main import app
+from app.services.agent import answer_cache as answer_cache_module
+from app.services.agent.agent_benchmark import FakeGigaChat
+from app.services.agent.ai_agent import RagAgent, get_rag_agent
+from app.services.agent.answer_cache import (
+    AnswerCache,
+    answer_cache,
+    answer_cache_requests,
+    answer_key,
+)
+
+
+ANSWER = 'Гарантия на аккумуляторную батарею составляет три года.'
+
+
+class FakeAgent:
+    '''Агент, отдающий ответ частями и считающий генерации'''
+
+    system_prompt = 'sys'
+
+    def __init__(self, answer: str = ANSWER, fail: bool = False,
+                 grounded: bool = True):
+        self.answer = answer
+        self.fail = fail
+        self.grounded = grounded
+        self.questions = []
+
+    async def astream_answer(self, user_text, mcp, outcome=None):
+        self.questions.append(user_text)
+        if outcome is not None:
+            outcome.grounded = self.grounded
+        for word in self.answer.split(' '):
+            await asyncio.sleep(0)
+            yield f'{word} '
+        if self.fail:
+            raise RuntimeError('stream broken')
+
+
+async def collect(cache: AnswerCache, key, agent: FakeAgent, question: str):
+    return ''.join([
+        chunk async for chunk in cache.astream(
+            key,
+            lambda outcome: agent.astream_answer(question, None, outcome),
+        )
+    ])
+
+
+def make_key(question: str, **kwargs):
+    params = {
+        'knowledge_base': 'kb-1',
+        'model_name': 'GigaChat-2',
+        'temperature': 0.0,
+        'system_prompt': 'sys',
+        **kwargs,
+    }
+    return AnswerCache.make_key(question, **params)
+
+
+class TestAnswerCache:
+    '''Тесты хранения и воспроизведения ответов'''
+
+    @pytest.mark.asyncio
+    async def test_repeated_question_replayed_in_chunks(self):
+        '''Тест ответа на повторный вопрос из кэша частями'''
+        cache = AnswerCache(max_entries=10, max_bytes=1024, ttl=60,
+                            chunk_chars=8)
+        agent = FakeAgent()
+
+        first = await collect(
+            cache, make_key('Гарантия на батарею?'), agent, 'q'
+        )
+        chunks = [
+            chunk async for chunk in cache.astream(
+                make_key('  гарантия на БАТАРЕЮ '),
+                lambda outcome: agent.astream_answer('q', None, outcome),
+            )
+        ]
+
+        assert ''.join(chunks) == first
+        assert len(chunks) == -(-len(first) // 8)
+        assert len(agent.questions) == 1
+
+    def test_key_includes_model_settings(self):
+        '''Тест что ключ зависит от базы знаний, модели и промпта'''
+        base = make_key('Гарантия?')
+
+        assert make_key('гарантия') == base
+        assert make_key('Гарантия?', knowledge_base='kb-2') != base
+        assert make_key('Гарантия?', model_name='GigaChat-Max') != base
+        assert make_key('Гарантия?', temperature=0.3) != base
+        assert make_key('Гарантия?', system_prompt='sys 2') != base
+
+    def test_limits_and_ttl(self, monkeypatch):
+        '''Тест вытеснения по числу записей, размеру и TTL'''
+        now = [100.0]
+        monkeypatch.setattr(
+            answer_cache_module.time, 'monotonic', lambda: now[0]
+        )
+        cache = AnswerCache(max_entries=2, max_bytes=30, ttl=10)
+
+        cache.put(make_key('a'), 'x' * 10)
+        cache.put(make_key('b'), 'y' * 10)
+        cache.put(make_key('c'), 'z' * 10)
+        assert cache.get(make_key('a')) is None
+        assert len(cache) == 2
+
+        cache.put(make_key('d'), 'w' * 25)
+        assert len(cache) == 1
+        assert cache.size == 25
+        cache.put(make_key('e'), 'v' * 31)
+        assert cache.get(make_key('e')) is None
+
+        now[0] += 10
+        assert cache.get(make_key('d')) is None
+        assert cache.size == 0
+
+    @pytest.mark.asyncio
+    async def test_broken_answer_not_cached(self):
+        '''Тест что оборванный ответ не сохраняется'''
+        cache = AnswerCache(max_entries=10, max_bytes=1024, ttl=60)
+        agent = FakeAgent(fail=True)
+
+        with pytest.raises(RuntimeError):
+            await collect(cache, make_key('Гарантия?'), agent, 'q')
+
+        assert len(cache) == 0
+
+    @pytest.mark.asyncio
+    async def test_invalidate_during_generation(self):
+        '''Тест что ответ, начатый до очистки, не сохраняется'''
+        cache = AnswerCache(max_entries=10, max_bytes=1024, ttl=60)
+        cache.put(make_key('Доставка?'), 'два дня')
+        agent = FakeAgent()
+        stream = cache.astream(
+            make_key('Гарантия?'),
+            lambda outcome: agent.astream_answer('q', None, outcome),
+        )
+
+        await stream.__anext__()
+        assert cache.invalidate() == 1
+        async for _ in stream:
+            pass
+
+        assert len(cache) == 0
+
+    @pytest.mark.asyncio
+    async def test_ungrounded_answer_not_cached(self):
+        '''Тест что ответ без найденных документов не сохраняется'''
+        cache = AnswerCache(max_entries=10, max_bytes=1024, ttl=60)
+        agent = FakeAgent(grounded=False)
+
+        await collect(cache, make_key('Гарантия?'), agent, 'q')
+        await collect(cache, make_key('Гарантия?'), agent, 'q')
+
+        assert len(cache) == 0
+        assert len(agent.questions) == 2
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('mode', ['fast', 'react'])
+    async def test_answer_during_mcp_outage_not_cached(self, mode):
+        '''Тест что ответ агента при недоступном MCP не кэшируется'''
+        cache = AnswerCache(max_entries=10, max_bytes=1024, ttl=60)
+        agent = RagAgent(
+            FakeGigaChat(first_token_latency=0, token_latency=0),
+            'request_to_rag', system_prompt='sys', mode=mode,
+        )
+
+        class BrokenMcp:
+            async def call_tool_documents(self, name, arguments):
+                raise ConnectionError('MCP server is down')
+
+        answer = ''.join([
+            chunk async for chunk in cache.astream(
+                make_key('Гарантия?'),
+                lambda outcome: agent.astream_answer(
+                    'Гарантия?', BrokenMcp(), outcome
+                ),
+            )
+        ])
+
+        assert answer.strip()
+        assert cache.get(make_key('Гарантия?')) is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('mode', ['fast', 'react'])
+    async def test_grounded_agent_answer_cached(self, mode):
+        '''Тест что ответ агента по найденным документам кэшируется'''
+        cache = AnswerCache(max_entries=10, max_bytes=1024, ttl=60)
+        agent = RagAgent(
+            FakeGigaChat(first_token_latency=0, token_latency=0),
+            'request_to_rag', system_prompt='sys', mode=mode,
+        )
+
+        class Mcp:
+            async def call_tool_documents(self, name, arguments):
+                return [{'id': 'a', 'content': 'три года', 'metadata': {}}]
+
+        answer = ''.join([
+            chunk async for chunk in cache.astream(
+                make_key('Гарантия?'),
+                lambda outcome: agent.astream_answer(
+                    'Гарантия?', Mcp(), outcome
+                ),
+            )
+        ])
+
+        assert cache.get(make_key('Гарантия?')) == answer
+
+    def test_invalidate_one_question(self):
+        '''Тест удаления ответов на один вопрос'''
+        cache = AnswerCache(max_entries=10, max_bytes=1024, ttl=60)
+        cache.put(make_key('Гарантия?'), 'три года')
+        cache.put(make_key('Гарантия?', model_name='GigaChat-Max'), 'три')
+        cache.put(make_key('Доставка?'), 'два дня')
+
+        assert cache.invalidate('гарантия') == 2
+        assert cache.get(make_key('Доставка?')) == 'два дня'
+
+    def test_bypass_for_sampling_temperature(self, monkeypatch):
+        '''Тест обхода кэша при temperature > 0, если так настроено'''
+        monkeypatch.setattr(settings, 'agent_answer_cache_enabled', True)
+        monkeypatch.setattr(settings, 'gigachat_temperature', 0.3)
+        monkeypatch.setattr(
+            settings, 'agent_answer_cache_bypass_sampling', False
+        )
+        assert answer_key('Гарантия?', 'sys') is not None
+
+        monkeypatch.setattr(
+            settings, 'agent_answer_cache_bypass_sampling', True
+        )
+        assert answer_key('Гарантия?', 'sys') is None
+
+        monkeypatch.setattr(settings, 'gigachat_temperature', 0.0)
+        assert answer_key('Гарантия?', 'sys') is not None
+
+
+class FakeUser:
+    id = 1
+    email = 'admin@example.com'
+
+
+@pytest.fixture
+def api():
+    agent = FakeAgent()
+    answer_cache.invalidate()
+    app.dependency_overrides[get_rag_agent] = lambda: agent
+    app.dependency_overrides[current_user] = FakeUser
+    app.dependency_overrides[current_admin_or_superuser] = FakeUser
+    yield agent
+    for dependency in (get_rag_agent, current_user,
+                       current_admin_or_superuser):
+        app.dependency_overrides.pop(dependency, None)
+    answer_cache.invalidate()
+
+
+class TestAnswerCacheEndpoints:
+    '''Тесты кэша ответов через API'''
+
+    @pytest.mark.asyncio
+    async def test_cached_answer_streamed_and_invalidated(
+        self, api, monkeypatch
+    ):
+        '''Тест потокового ответа из кэша и очистки администратором'''
+        monkeypatch.setattr(settings, 'agent_answer_cache_enabled', True)
+        monkeypatch.setattr(
+            settings, 'agent_answer_cache_bypass_sampling', False
+        )
+        hits = answer_cache_requests.value(outcome='hit')
+        transport = ASGITransport(app=app)
+        async with AsyncClient(
+            transport=transport, base_url='http://test'
+        ) as client:
+            answers = [
+                (await client.post(
+                    '/ask_with_ai', json={'query': 'Гарантия?'}
+                )).text
+                for _ in range(2)
+            ]
+            stats = (await client.get('/ask_with_ai/cache')).json()
+            cleared = (await client.delete(
+                '/ask_with_ai/cache', params={'query': 'гарантия'}
+            )).json()
+            await client.post('/ask_with_ai', json={'query': 'Гарантия?'})
+
+        assert answers[0] == answers[1] == f'{ANSWER} '
+        assert len(api.questions) == 2
+        assert answer_cache_requests.value(outcome='hit') == hits + 1
+        assert stats['entries'] == 1
+        assert cleared == {'removed': 1}
@@ -0,0 +1,252 @@
+'''
+Тесты пула MCP сессий FastAPI приложения
+'''
+import asyncio
+
+from httpx import ASGITransport, AsyncClient
+import pytest
+import pytest_asyncio
+
+from app.api.validators import current_admin_or_superuser
+from app.main import app
+from app.services.agent.mcp_client import McpToolError
+from app.services.agent.mcp_pool import McpClientPool, pool_acquire_wait
+from tests.conftest import serve
+
+
+class FakeSession:
+    def __init__(self, client):
+        self.client = client
+
+    async def send_ping(self):
+        if self.client.broken:
+            raise ConnectionError('ping failed')
+
+
+class FakeClient:
+    '''MCP клиент с журналом подключений'''
+
+    opened: list['FakeClient'] = []
+
+    def __init__(self):
+        self.broken = False
+        self.closed = False
+        self.session = FakeSession(self)
+
+    async def __aenter__(self):
+        FakeClient.opened.append(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+    async def call_tool_text(self, name, arguments):
+        if self.broken:
+            raise ConnectionError('connection reset')
+        if arguments.get('query') == 'ошибка':
+            raise McpToolError('tool failed')
+        await asyncio.sleep(0.01)
+        return f'ответ на {arguments["query"]}'
+
+
+@pytest_asyncio.fixture
+async def make_pool():
+    FakeClient.opened = []
+    pools = []
+
+    def make(**kwargs):
+        kwargs.setdefault('health_check_interval', 0)
+        pool = McpClientPool(
+            'http://mcp', client_factory=FakeClient, **kwargs
+        )
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        await pool.close()
+
+
+class TestMcpClientPool:
+    '''Тесты выдачи, проверки и переподключения сессий'''
+
+    @pytest.mark.asyncio
+    async def test_sessions_opened_once(self, make_pool):
+        '''Тест что вызовы используют заранее открытые сессии'''
+        pool = make_pool(size=2)
+        await pool.start()
+
+        results = await asyncio.gather(*(
+            pool.call_tool_text('request_to_rag', {'query': str(idx)})
+            for idx in range(10)
+        ))
+
+        assert results == [f'ответ на {idx}' for idx in range(10)]
+        assert len(FakeClient.opened) == 2
+        assert pool.stats['alive'] == 2
+        await pool.close()
+        assert all(client.closed for client in FakeClient.opened)
+
+    @pytest.mark.asyncio
+    async def test_acquire_wait_recorded(self, make_pool):
+        '''Тест ожидания свободной сессии и таймаута'''
+        pool = make_pool(size=1, acquire_timeout=0.05)
+        await pool.start()
+        acquires_before = pool_acquire_wait.count()
+
+        async with pool.acquire():
+            with pytest.raises(asyncio.TimeoutError):
+                async with pool.acquire():
+                    pass
+
+        async with pool.acquire():
+            pass
+        assert pool_acquire_wait.count() == acquires_before + 2
+        assert pool.stats['idle'] == 1
+
+    @pytest.mark.asyncio
+    async def test_broken_session_reconnected(self, make_pool):
+        '''Тест переподключения после обрыва вызова'''
+        pool = make_pool(size=1)
+        await pool.start()
+        FakeClient.opened[0].broken = True
+
+        with pytest.raises(ConnectionError):
+            await pool.call_tool_text('request_to_rag', {'query': 'a'})
+        result = await pool.call_tool_text('request_to_rag', {'query': 'b'})
+
+        assert result == 'ответ на b'
+        assert len(FakeClient.opened) == 2
+        assert FakeClient.opened[0].closed
+
+    @pytest.mark.asyncio
+    async def test_tool_error_keeps_session(self, make_pool):
+        '''Тест что ошибка инструмента не закрывает сессию'''
+        pool = make_pool(size=1)
+        await pool.start()
+
+        with pytest.raises(McpToolError):
+            await pool.call_tool_text('request_to_rag', {'query': 'ошибка'})
+
+        assert len(FakeClient.opened) == 1
+        assert pool.stats['alive'] == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_call_keeps_session(self, make_pool):
+        '''Тест что отмененный вызов не закрывает сессию'''
+        pool = make_pool(size=1)
+        await pool.start()
+
+        task = asyncio.create_task(
+            pool.call_tool_text('request_to_rag', {'query': 'a'})
+        )
+        await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert len(FakeClient.opened) == 1
+        assert pool.stats == {**pool.stats, 'idle': 1, 'alive': 1}
+
+    @pytest.mark.asyncio
+    async def test_health_check_replaces_dead_session(self, make_pool):
+        '''Тест что проверка ping закрывает неисправную сессию'''
+        pool = make_pool(size=2)
+        await pool.start()
+        FakeClient.opened[0].broken = True
+
+        await pool.check_health()
+
+        assert pool.stats['alive'] == 1
+        await asyncio.gather(*(
+            pool.call_tool_text('request_to_rag', {'query': str(idx)})
+            for idx in range(4)
+        ))
+        assert pool.stats['alive'] == 2
+        assert len(FakeClient.opened) == 3
+
+    @pytest.mark.asyncio
+    async def test_lazy_connect_when_server_down(self, make_pool):
+        '''Тест старта без MCP сервера и подключения при первом вызове'''
+        attempts = []
+
+        def factory():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ConnectionError('refused')
+            return FakeClient()
+
+        pool = McpClientPool(
+            'http://mcp', size=1, health_check_interval=0,
+            client_factory=factory,
+        )
+        await pool.start()
+        assert pool.stats['alive'] == 0
+
+        result = await pool.call_tool_text('request_to_rag', {'query': 'a'})
+        await pool.close()
+
+        assert result == 'ответ на a'
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('transport', ['sse', 'streamable-http'])
+    async def test_pool_against_mcp_server(
+        self, fake_rag, transport,
+    ):
+        '''Тест пула с настоящим MCP сервером'''
+        fake_rag()
+        url, uvicorn_server, task = await serve(transport)
+        pool = McpClientPool(
+            url, transport=transport, size=2,
+            health_check_interval=0,
+        )
+        try:
+            await pool.start()
+            texts = await asyncio.gather(*(
+                pool.call_tool_text('request_to_rag', {'query': 'Гарантия'})
+                for _ in range(4)
+            ))
+            await pool.check_health()
+            alive = pool.stats['alive']
+        finally:
+            await pool.close()
+            uvicorn_server.should_exit = True
+            await task
+
+        assert all(text.startswith('Context:') for text in texts)
+        assert alive == 2
+
+
+class TestAppMetrics:
+    '''Тесты метрик FastAPI процесса'''
+
+    @pytest.mark.asyncio
+    async def test_pool_metrics_exported(self, make_pool):
+        '''Тест что ожидание сессии пула видно в /metrics приложения'''
+        pool = make_pool(size=1)
+        await pool.start()
+        async with pool.acquire():
+            pass
+        app.dependency_overrides[current_admin_or_superuser] = object
+        try:
+            async with AsyncClient(
+                transport=ASGITransport(app=app), base_url='http://test'
+            ) as client:
+                response = await client.get('/metrics')
+        finally:
+            app.dependency_overrides.pop(current_admin_or_superuser)
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/plain')
+        assert 'mcp_pool_acquire_wait_seconds_count' in response.text
+        assert 'mcp_pool_reconnects' in response.text
+
+    @pytest.mark.asyncio
+    async def test_metrics_require_admin(self):
+        '''Тест что метрики недоступны без авторизации'''
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url='http://test'
+        ) as client:
+            response = await client.get('/metrics')
+
+        assert response.status_code == 401
@@ -0,0 +1,95 @@
+'''
+Тесты для кэша результатов MCP RAG сервера
+'''
+import pytest
+
+from app.core.config import settings
+from app.services.mcp_rag import cache as cache_module
+from app.services.mcp_rag.cache import RetrievalCache, normalize_query
+from tests.conftest import FakeClock
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(cache_module.time, 'monotonic', fake_clock)
+    return fake_clock
+
+
+class TestRetrievalCache:
+    '''Тесты TTL+LRU кэша'''
+
+    def test_normalize_query(self):
+        '''Тест нормализации регистра и пробелов'''
+        assert normalize_query('  Гарантия   МОТРЕКС\n') == 'гарантия мотрекс'
+
+    def test_key_includes_version_and_limit(self):
+        '''Тест что ключ учитывает версию базы знаний и лимит'''
+        key = RetrievalCache.make_key('Гарантия', 'v1', 6)
+        assert key != RetrievalCache.make_key('Гарантия', 'v2', 6)
+        assert key != RetrievalCache.make_key('Гарантия', 'v1', 3)
+        assert key == RetrievalCache.make_key(' гарантия ', 'v1', 6)
+
+    def test_hit_and_miss_counters(self, clock):
+        '''Тест счетчиков попаданий и промахов'''
+        cache = RetrievalCache(max_size=10, ttl=60)
+        assert cache.get('a') is None
+        cache.set('a', 'result')
+        assert cache.get('a') == 'result'
+
+        assert cache.stats['hits'] == 1
+        assert cache.stats['misses'] == 1
+        assert cache.stats['hit_ratio'] == 0.5
+
+    def test_entry_expires_after_ttl(self, clock):
+        '''Тест истечения записи по TTL'''
+        cache = RetrievalCache(max_size=10, ttl=60)
+        cache.set('a', 'result')
+        clock.now += 61
+
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_evicted(self, clock):
+        '''Тест вытеснения давно не использованной записи'''
+        cache = RetrievalCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_cleared_when_kb_version_changes(self, clock, monkeypatch):
+        '''Тест инвалидации при смене версии базы знаний'''
+        cache = RetrievalCache(max_size=10, ttl=60)
+        cache.set('a', 'result')
+        monkeypatch.setattr(
+            settings, 'knowledge_base_version_id', 'new-version'
+        )
+
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_stale_entry_served_within_stale_window(self, clock):
+        '''Тест выдачи устаревшей записи в окне stale_ttl'''
+        cache = RetrievalCache(max_size=10, ttl=60, stale_ttl=30)
+        cache.set('a', 'result')
+        clock.now += 70
+
+        assert cache.get('a') is None
+        assert cache.lookup('a') == ('result', True)
+        assert cache.stats['stale_hits'] == 1
+
+        clock.now += 30
+        assert cache.lookup('a') == (None, False)
+
+    def test_custom_ttl_for_entry(self, clock):
+        '''Тест отдельного TTL для записи'''
+        cache = RetrievalCache(max_size=10, ttl=60, stale_ttl=30)
+        cache.set('empty', 'no documents', ttl=5, stale_ttl=0)
+        clock.now += 6
+
+        assert cache.lookup('empty') == (None, False)
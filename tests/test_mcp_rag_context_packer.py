@@ -0,0 +1,174 @@
+'''
+Тесты для упаковки контекста MCP RAG сервера
+'''
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.mcp_rag.context_packer import (
+    deduplicate,
+    estimate_tokens,
+    extract_snippets,
+    pack_documents,
+)
+from app.services.mcp_rag.snippet_benchmark import (
+    format_snippet_report,
+    run_snippet_benchmark,
+    synthetic_retrieved,
+)
+
+
+LONG_TEXT = ' '.join(f'слово{idx}' for idx in range(400))
+CHUNK = (
+    'Компания основана в 1990 году. Офис находится в Москве. '
+    'Гарантия на лакокрасочное покрытие составляет 3 года. '
+    'Гарантия не распространяется на шины. '
+    'Сервисные центры работают ежедневно. '
+    'Телефон поддержки 8-800-100. Запчасти поставляются со склада.'
+)
+
+
+class TestContextPacker:
+    '''Тесты упаковки выдачи в документы'''
+
+    def test_documents_kept_in_order(self):
+        '''Тест порядка документов и их метаданных'''
+        documents = pack_documents({
+            'results': [
+                {'content': 'Первый документ', 'metadata': {'file': 'a.pdf'}},
+                {'content': 'Второй документ', 'metadata': {}},
+            ]
+        })
+
+        assert [doc['content'] for doc in documents] == [
+            'Первый документ', 'Второй документ',
+        ]
+        assert [doc['metadata'] for doc in documents] == [
+            {'file': 'a.pdf'}, {},
+        ]
+
+    def test_noisy_metadata_dropped(self):
+        '''Тест удаления шумных и пустых ключей метаданных'''
+        document, = pack_documents({
+            'results': [{
+                'content': 'Документ',
+                'metadata': {
+                    'chunk_id': '42',
+                    'embedding': [0.1, 0.2],
+                    'source': 'warranty.pdf',
+                    'page': None,
+                },
+            }]
+        })
+
+        assert document['metadata'] == {'source': 'warranty.pdf'}
+
+    def test_near_duplicates_removed(self):
+        '''Тест удаления почти одинаковых фрагментов'''
+        results = [
+            {'content': LONG_TEXT},
+            {'content': LONG_TEXT + ' хвост'},
+            {'content': 'Совсем другой документ про гарантию'},
+        ]
+
+        kept = deduplicate(results)
+
+        assert kept == [results[0], results[2]]
+
+    def test_context_fits_token_budget(self, monkeypatch):
+        '''Тест ограничения контекста бюджетом токенов'''
+        monkeypatch.setattr(settings, 'rag_context_max_tokens', 200)
+        monkeypatch.setattr(settings, 'rag_document_preview_tokens', 0)
+        documents = pack_documents({
+            'results': [
+                {'content': LONG_TEXT},
+                {'content': 'Другой ' + LONG_TEXT[::-1]},
+            ]
+        })
+
+        document, = documents
+        assert estimate_tokens(document['content']) <= 200
+        assert document['content'].endswith('…')
+
+    def test_unlimited_budget(self, monkeypatch):
+        '''Тест отключения бюджета'''
+        monkeypatch.setattr(settings, 'rag_context_max_tokens', 0)
+        monkeypatch.setattr(settings, 'rag_document_preview_tokens', 0)
+        document, = pack_documents({'results': [{'content': LONG_TEXT}]})
+
+        assert document['content'] == LONG_TEXT
+
+
+class TestExtractSnippets:
+    '''Тесты извлечения фрагментов по запросу'''
+
+    def test_keeps_sentences_matching_query(self):
+        '''Тест выбора окна с наибольшим покрытием слов запроса'''
+        snippet = extract_snippets(CHUNK, 'Какая гарантия на покрытие?', 30)
+
+        assert snippet == (
+            '… Гарантия на лакокрасочное покрытие составляет 3 года. '
+            'Гарантия не распространяется на шины. …'
+        )
+        assert estimate_tokens(snippet) <= 30
+
+    def test_windows_kept_in_document_order(self):
+        '''Тест нескольких окон с маркером пропуска между ними'''
+        snippet = extract_snippets(
+            CHUNK, 'основание компании и телефон', 40, window=1
+        )
+
+        assert snippet == (
+            'Компания основана в 1990 году. … '
+            'Телефон поддержки 8-800-100. …'
+        )
+
+    def test_short_text_unchanged(self):
+        '''Тест что текст в пределах бюджета не меняется'''
+        assert extract_snippets(CHUNK, 'телефон', 1000) == CHUNK
+
+    def test_no_matches_falls_back_to_trim(self):
+        '''Тест обрезки, если слов запроса в тексте нет'''
+        snippet = extract_snippets(CHUNK, 'аккумулятор', 10)
+
+        assert snippet.startswith('Компания')
+        assert snippet.endswith('…')
+
+    def test_pack_documents_uses_query(self, monkeypatch):
+        '''Тест фрагментов в структурированном ответе'''
+        monkeypatch.setattr(settings, 'rag_document_preview_tokens', 30)
+
+        document, = pack_documents(
+            {'results': [{'content': CHUNK}]}, 'телефон поддержки'
+        )
+
+        assert 'Телефон поддержки 8-800-100.' in document['content']
+        assert document['body'] == CHUNK
+
+
+class FakeLLM:
+    '''LLM, задержка первого токена которой растет с длиной промпта'''
+
+    async def astream(self, messages):
+        size = sum(len(message.content) for message in messages)
+        await asyncio.sleep(size / 200_000)
+        yield type('Chunk', (), {'content': 'ответ'})()
+
+
+class TestSnippetBenchmark:
+    '''Тесты бенчмарка размера промпта'''
+
+    @pytest.mark.asyncio
+    async def test_snippets_shrink_prompt_and_ttft(self):
+        '''Тест что фрагменты уменьшают промпт и TTFT'''
+        results = await run_snippet_benchmark(
+            synthetic_retrieved(queries=3), llm=FakeLLM()
+        )
+        by_mode = {result.mode: result for result in results}
+
+        assert sum(by_mode['snippets'].prompt_tokens) < sum(
+            by_mode['full'].prompt_tokens
+        )
+        assert sum(by_mode['snippets'].ttft) < sum(by_mode['full'].ttft)
+        assert 'snippets' in format_snippet_report(results)
@@ -0,0 +1,151 @@
+'''
+Тесты структурированного ответа request_to_rag и ресурса документов
+'''
+from fastmcp import Client
+from mcp.shared.exceptions import McpError
+import pytest
+
+from app.core.config import settings
+from app.services.agent.mcp_client import format_documents
+from app.services.mcp_rag import server
+from app.services.mcp_rag.context_packer import document_id, pack_documents
+from app.services.mcp_rag.document_store import (
+    DocumentStore,
+    document_store,
+    public_documents,
+)
+from tests.conftest import make_rag_handler, use_mock_transport
+
+
+LONG_TEXT = ' '.join(f'слово{idx}' for idx in range(400))
+
+
+class TestPackDocuments:
+    '''Тесты pack_documents'''
+
+    def test_documents_have_id_score_and_metadata(self):
+        '''Тест полей структурированного документа'''
+        documents = pack_documents({'results': [{
+            'content': 'Телефон поддержки',
+            'metadata': {'file': 'a.pdf', 'chunk_id': '42', 'page': None},
+            'score': 0.9,
+        }]})
+
+        assert documents == [{
+            'id': document_id('Телефон поддержки'),
+            'score': 0.9,
+            'content': 'Телефон поддержки',
+            'metadata': {'file': 'a.pdf'},
+            'body': 'Телефон поддержки',
+        }]
+
+    def test_content_trimmed_to_preview(self, monkeypatch):
+        '''Тест что фрагмент обрезается, а полный текст сохраняется'''
+        monkeypatch.setattr(settings, 'rag_document_preview_tokens', 50)
+
+        document, = pack_documents({'results': [{'content': LONG_TEXT}]})
+
+        assert document['content'].endswith('…')
+        assert len(document['content']) <= 50 * 3.5
+        assert document['body'] == LONG_TEXT
+        assert document['id'] == document_id(LONG_TEXT)
+
+    def test_previews_fit_context_budget(self, monkeypatch):
+        '''Тест что фрагменты вместе укладываются в общий бюджет'''
+        monkeypatch.setattr(settings, 'rag_context_max_tokens', 300)
+        monkeypatch.setattr(settings, 'rag_document_preview_tokens', 200)
+
+        documents = pack_documents({'results': [
+            {'content': LONG_TEXT.replace('слово', f'текст{idx}_')}
+            for idx in range(3)
+        ]})
+
+        assert len(documents) == 2
+        assert sum(len(doc['content']) for doc in documents) <= 300 * 3.5
+
+
+class TestDocumentStore:
+    '''Тесты хранилища полных текстов'''
+
+    def test_lru_eviction_by_size(self):
+        '''Тест вытеснения давно не использованных документов'''
+        store = DocumentStore(max_bytes=10)
+        store.put('a', 'aaaa')
+        store.put('b', 'bbbb')
+        store.get('a')
+        store.put('c', 'cccc')
+
+        assert store.get('b') is None
+        assert store.get('a') == 'aaaa'
+        assert store.size == 8
+
+    def test_public_documents_strip_body(self):
+        '''Тест что полный текст уходит в хранилище, а не клиенту'''
+        store = DocumentStore(max_bytes=1024)
+        documents = pack_documents({'results': [{'content': 'Текст'}]})
+
+        public = public_documents(documents, store)
+
+        assert 'body' not in public[0]
+        assert 'body' in documents[0]
+        assert store.get(public[0]['id']) == 'Текст'
+
+
+class TestDocumentResource:
+    '''Тесты инструмента и ресурса через MCP клиент'''
+
+    @pytest.mark.asyncio
+    async def test_tool_returns_structured_documents(self, monkeypatch):
+        '''Тест структурированного ответа и чтения полного текста'''
+        use_mock_transport(monkeypatch, make_rag_handler([]))
+
+        async with Client(server.mcp) as client:
+            result = await client.call_tool_mcp(
+                'request_to_rag', {'query': 'Контакты поддержки'}
+            )
+            documents = result.structuredContent['result']
+            contents = await client.read_resource(
+                f'rag://documents/{documents[0]["id"]}'
+            )
+
+        assert documents[0]['content'] == 'Телефон поддержки 8-800'
+        assert documents[0]['metadata'] == {'file': 'a.pdf'}
+        assert contents[0].text == 'Телефон поддержки 8-800'
+
+    @pytest.mark.asyncio
+    async def test_cached_result_restores_bodies(self, monkeypatch):
+        '''Тест что попадание в кэш снова публикует полные тексты'''
+        use_mock_transport(monkeypatch, make_rag_handler([]))
+
+        first = await server.request_to_rag.fn('Контакты поддержки')
+        document_store.clear()
+        second = await server.request_to_rag.fn('Контакты поддержки')
+
+        assert first == second
+        assert document_store.get(second[0]['id']) is not None
+
+    @pytest.mark.asyncio
+    async def test_unknown_document(self):
+        '''Тест ошибки для неизвестного документа'''
+        async with Client(server.mcp) as client:
+            with pytest.raises(McpError, match='не найден'):
+                await client.read_resource('rag://documents/unknown')
+
+
+class TestFormatDocuments:
+    '''Тесты форматирования документов в клиенте агента'''
+
+    def test_inlined_bodies_replace_previews(self):
+        '''Тест подстановки полного текста для выбранных документов'''
+        documents = [
+            {'id': 'a', 'content': 'начало…', 'metadata': {'file': 'a.pdf'}},
+            {'id': 'b', 'content': 'второй…', 'metadata': {}},
+        ]
+
+        context = format_documents(documents, {'a': 'начало и конец'})
+
+        assert context == (
+            'Context:\n\n'
+            'Document 1:\nContent: начало и конец\nMetadata: file: a.pdf\n\n'
+            'Document 2:\nContent: второй…\n\n'
+        )
@@ -0,0 +1,121 @@
+'''
+Тесты для заглушки Managed RAG и утилит нагрузочного теста
+'''
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.mcp_rag import server
+from app.services.mcp_rag.benchmark import (
+    percentile,
+    run_benchmark,
+    summarize_latencies,
+)
+from app.services.mcp_rag.fake_rag_server import (
+    FakeRagConfig,
+    make_documents,
+    sample_latency,
+)
+from tests.conftest import contents
+
+
+class TestFakeRagServer:
+    '''Тесты заглушки auth и retrieve API'''
+
+    def test_documents_are_deterministic(self):
+        '''Тест что одинаковый запрос дает одинаковые документы'''
+        config = FakeRagConfig(documents=3, document_chars=200)
+        first = make_documents('гарантия', config, limit=6)
+
+        assert first == make_documents('гарантия', config, limit=6)
+        assert len(first) == 3
+        assert all(len(doc['content']) <= 200 for doc in first)
+
+    def test_latency_distribution(self):
+        '''Тест что задержки соответствуют заданной медиане'''
+        config = FakeRagConfig(latency_median=0.1, latency_p99=0.5)
+        rng = random.Random(1)
+        samples = [sample_latency(config, rng) for _ in range(2000)]
+
+        assert percentile(samples, 0.5) == pytest.approx(0.1, rel=0.15)
+        assert percentile(samples, 0.99) == pytest.approx(0.5, rel=0.3)
+
+    @pytest.mark.asyncio
+    async def test_request_to_rag_against_fake(self, fake_rag):
+        '''Тест полного цикла request_to_rag через заглушку'''
+        app = fake_rag(FakeRagConfig(latency_median=0, auth_latency=0))
+
+        result = await server.request_to_rag.fn('Гарантия Мотрекс')
+
+        assert 'Гарантия Мотрекс' in contents(result)
+        assert app.state.stats.auth_requests == 1
+        assert app.state.stats.retrieve_requests == 1
+
+    @pytest.mark.asyncio
+    async def test_injected_unauthorized(self, fake_rag):
+        '''Тест внедрения 401 ответов'''
+        app = fake_rag(FakeRagConfig(
+            latency_median=0, auth_latency=0, unauthorized_rate=1.0
+        ))
+
+        with pytest.raises(RuntimeError):
+            await server.request_to_rag.fn('Гарантия')
+
+        assert app.state.stats.unauthorized == 2
+        assert app.state.stats.auth_requests == 2
+
+
+class FlakyClient:
+    '''MCP клиент, каждый третий вызов которого обрывает транспорт'''
+
+    calls = 0
+
+    def __init__(self, url):
+        self.url = url
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def call_tool(self, name, arguments, raise_on_error=True):
+        FlakyClient.calls += 1
+        if FlakyClient.calls % 3 == 0:
+            raise ConnectionError('connection reset')
+        return SimpleNamespace(is_error=False)
+
+
+class TestBenchmarkUtils:
+    '''Тесты расчета перцентилей и нагрузочного теста'''
+
+    def test_summarize_latencies(self):
+        '''Тест сводки по задержкам'''
+        latencies = [idx / 100 for idx in range(1, 101)]
+        summary = summarize_latencies(latencies)
+
+        assert summary['p50'] == 0.5
+        assert summary['p95'] == 0.95
+        assert summary['p99'] == 0.99
+        assert summary['max'] == 1.0
+
+    def test_empty_latencies(self):
+        '''Тест сводки без данных'''
+        assert summarize_latencies([])['p99'] == 0.0
+
+    @pytest.mark.asyncio
+    async def test_transport_errors_counted(self, monkeypatch):
+        '''Тест что сбой транспорта считается ошибкой, а не прерывает замер'''
+        monkeypatch.setattr(FlakyClient, 'calls', 0)
+        monkeypatch.setattr(
+            'app.services.mcp_rag.benchmark.Client', FlakyClient
+        )
+
+        latencies, errors, _ = await run_benchmark(
+            'http://localhost/mcp', 'request_to_rag',
+            concurrency=2, requests=9, queries=['Гарантия'],
+        )
+
+        assert errors == 3
+        assert len(latencies) == 6
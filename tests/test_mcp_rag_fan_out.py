@@ -0,0 +1,223 @@
+'''
+Тесты параллельного опроса нескольких баз знаний
+'''
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services.mcp_rag import server
+from app.services.mcp_rag.cache import retrieval_cache
+from app.services.mcp_rag.metrics import partial_results
+from app.services.mcp_rag.rank_fusion import reciprocal_rank_fusion
+from app.services.mcp_rag.resilience import CircuitBreaker
+from tests.conftest import use_mock_transport
+
+
+def doc(content: str) -> dict:
+    return {'content': content, 'metadata': {'file': f'{content}.pdf'}}
+
+
+def make_kb_handler(documents: dict, delays: dict | None = None):
+    '''Обработчик, отвечающий документами выбранной версии базы'''
+    delays = delays or {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if str(request.url) == settings.auth_url:
+            return httpx.Response(
+                200, json={'access_token': 'token', 'expires_in': 3600}
+            )
+        kb_version = json.loads(request.content)['rag_version']
+        await asyncio.sleep(delays.get(kb_version, 0))
+        if documents[kb_version] is None:
+            return httpx.Response(503, text='unavailable')
+        return httpx.Response(200, json={'results': documents[kb_version]})
+
+    return handler
+
+
+@pytest.fixture
+def kb_versions(monkeypatch):
+    monkeypatch.setattr(
+        settings, 'knowledge_base_version_ids',
+        ['support', 'warranty', 'dealers'],
+    )
+    yield
+    server._kb_breakers.clear()
+
+
+class TestReciprocalRankFusion:
+    '''Тесты объединения выдач'''
+
+    def test_documents_in_several_lists_rank_higher(self):
+        fused = reciprocal_rank_fusion([
+            [doc('a'), doc('b'), doc('c')],
+            [doc('c'), doc('d')],
+        ], k=60)
+
+        assert [item['content'] for item in fused] == ['c', 'a', 'b', 'd']
+        assert fused[0]['score'] == pytest.approx(1 / 61 + 1 / 63, abs=1e-6)
+
+    def test_duplicates_are_merged(self):
+        fused = reciprocal_rank_fusion([
+            [doc('Гарантия 3 года')],
+            [{'content': '  гарантия  3 года ', 'metadata': {}}],
+        ])
+
+        assert len(fused) == 1
+        assert fused[0]['metadata'] == {'file': 'Гарантия 3 года.pdf'}
+
+    def test_limit(self):
+        fused = reciprocal_rank_fusion(
+            [[doc('a'), doc('b')], [doc('c')]], limit=2
+        )
+
+        assert len(fused) == 2
+
+
+class TestFanOut:
+    '''Тесты fan_out_retrieve'''
+
+    @pytest.mark.asyncio
+    async def test_merges_all_knowledge_bases(self, monkeypatch, kb_versions):
+        use_mock_transport(monkeypatch, make_kb_handler({
+            'support': [doc('телефон'), doc('почта')],
+            'warranty': [doc('гарантия'), doc('телефон')],
+            'dealers': [doc('дилеры')],
+        }))
+
+        result = await server.fan_out_retrieve('контакты', 6)
+
+        assert 'partial' not in result
+        contents = [item['content'] for item in result['results']]
+        assert contents[0] == 'телефон'
+        assert sorted(contents) == [
+            'гарантия', 'дилеры', 'почта', 'телефон'
+        ]
+
+    @pytest.mark.asyncio
+    async def test_slow_kb_does_not_block(self, monkeypatch, kb_versions):
+        monkeypatch.setattr(settings, 'rag_kb_timeout', 0.05)
+        use_mock_transport(monkeypatch, make_kb_handler(
+            {
+                'support': [doc('телефон')],
+                'warranty': [doc('гарантия')],
+                'dealers': [doc('дилеры')],
+            },
+            delays={'dealers': 1.0},
+        ))
+
+        started = time.perf_counter()
+        result = await server.fan_out_retrieve('контакты', 6)
+
+        assert time.perf_counter() - started < 0.5
+        assert sorted(item['content'] for item in result['results']) == [
+            'гарантия', 'телефон'
+        ]
+
+    @pytest.mark.asyncio
+    async def test_timing_out_kb_opens_breaker(self, monkeypatch, kb_versions):
+        monkeypatch.setattr(settings, 'rag_kb_timeout', 0.05)
+        monkeypatch.setattr(settings, 'rag_circuit_failure_threshold', 2)
+        handler = make_kb_handler(
+            {
+                'support': [doc('телефон')],
+                'warranty': [doc('гарантия')],
+                'dealers': [doc('дилеры')],
+            },
+            delays={'dealers': 1.0},
+        )
+        dealers_requests = []
+
+        async def counting_handler(request: httpx.Request) -> httpx.Response:
+            if (
+                str(request.url) != settings.auth_url
+                and json.loads(request.content)['rag_version'] == 'dealers'
+            ):
+                dealers_requests.append(request)
+            return await handler(request)
+
+        use_mock_transport(monkeypatch, counting_handler)
+
+        for _ in range(2):
+            result = await server.fan_out_retrieve('контакты', 6)
+            assert result['partial'] is True
+        started = time.perf_counter()
+        result = await server.fan_out_retrieve('контакты', 6)
+
+        assert time.perf_counter() - started < 0.05
+        assert result['partial'] is True
+        assert server.breaker_for('dealers').state == CircuitBreaker.OPEN
+        assert len(dealers_requests) == 2
+
+    @pytest.mark.asyncio
+    async def test_failing_kb_has_own_breaker(self, monkeypatch, kb_versions):
+        use_mock_transport(monkeypatch, make_kb_handler({
+            'support': [doc('телефон')],
+            'warranty': None,
+            'dealers': None,
+        }))
+
+        result = await server.fan_out_retrieve('контакты', 6)
+
+        assert [item['content'] for item in result['results']] == [
+            'телефон'
+        ]
+        assert result['partial'] is True
+        assert server.breaker_for('warranty')._failures == 1
+        assert server.breaker_for('support')._failures == 0
+
+    @pytest.mark.asyncio
+    async def test_all_failed_raises(self, monkeypatch, kb_versions):
+        use_mock_transport(monkeypatch, make_kb_handler({
+            'support': None,
+            'warranty': None,
+            'dealers': None,
+        }))
+
+        with pytest.raises(server.UpstreamUnavailableError):
+            await server.fan_out_retrieve('контакты', 6)
+
+    @pytest.mark.asyncio
+    async def test_partial_merge_cached_briefly(
+        self, monkeypatch, kb_versions
+    ):
+        '''Тест что выдача без части баз не кэшируется надолго'''
+        monkeypatch.setattr(settings, 'rag_cache_enabled', True)
+        monkeypatch.setattr(settings, 'rag_negative_cache_ttl', 30.0)
+        documents = {
+            'support': [doc('телефон')],
+            'warranty': None,
+            'dealers': [doc('дилеры')],
+        }
+        use_mock_transport(monkeypatch, make_kb_handler(documents))
+        stored = []
+
+        async def persistent_set(key, value):
+            stored.append(key)
+
+        monkeypatch.setattr(server.persistent_cache, 'set', persistent_set)
+        retrieval_cache.clear()
+        partial_before = partial_results.value()
+        started = time.monotonic()
+
+        partial = await server.retrieve_context('контакты')
+
+        assert partial_results.value() == partial_before + 1
+        assert stored == []
+        [(fresh_until, stale_until, _)] = retrieval_cache._entries.values()
+        assert fresh_until - started <= 30.0 + 1
+        assert stale_until == fresh_until
+
+        # База восстановилась: после короткого TTL выдача снова полная
+        documents['warranty'] = [doc('гарантия')]
+        retrieval_cache.clear()
+        full = await server.retrieve_context('контакты')
+        retrieval_cache.clear()
+
+        assert len(partial) == 2
+        assert len(full) == 3
+        assert len(stored) == 1
@@ -0,0 +1,211 @@
+'''
+Тесты локального BM25 индекса MCP RAG сервера
+'''
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services.mcp_rag import server
+from app.services.mcp_rag.lexical_index import LexicalIndex, lexical_index
+from app.services.mcp_rag.russian_text import stem, tokenize
+from tests.conftest import (
+    contents,
+    make_rag_handler,
+    use_mock_transport,
+)
+
+
+DOCUMENTS = [
+    {
+        'content': 'Гарантия на лакокрасочное покрытие составляет 3 года',
+        'metadata': {'file': 'warranty.pdf'},
+    },
+    {
+        'content': 'Телефон технической поддержки дилеров 8-800-100',
+        'metadata': {'file': 'support.pdf'},
+    },
+    {
+        'content': 'Регламент технического обслуживания автомобиля',
+        'metadata': {'file': 'service.pdf'},
+    },
+]
+
+
+class TestRussianText:
+    '''Тесты токенизации и стемминга'''
+
+    @pytest.mark.parametrize('word, expected', [
+        ('гарантия', 'гарант'),
+        ('гарантии', 'гарант'),
+        ('автомобиля', 'автомобил'),
+        ('красивейший', 'красив'),
+        ('читавшая', 'чита'),
+        ('Ёлки', 'елк'),
+        ('kia', 'kia'),
+    ])
+    def test_stem(self, word, expected):
+        assert stem(word) == expected
+
+    def test_tokenize_drops_stopwords_but_keeps_negation(self):
+        tokens = tokenize('Какие условия гарантии? Не работает!')
+
+        assert tokens == ['услов', 'гарант', 'не', 'работа']
+
+
+class TestLexicalIndex:
+    '''Тесты LexicalIndex'''
+
+    def test_search_ranks_matching_document_first(self):
+        index = LexicalIndex(max_bytes=10_000)
+        index.add(DOCUMENTS)
+
+        results = index.search('Какая гарантия на покрытие?', limit=3)
+
+        assert results[0][1]['metadata'] == {'file': 'warranty.pdf'}
+        assert 0 < results[0][0] <= 1
+        assert len(results) == 1
+
+    def test_add_is_incremental(self):
+        index = LexicalIndex(max_bytes=10_000)
+
+        assert index.add(DOCUMENTS) == 3
+        assert index.add(DOCUMENTS[:1] + [{'content': ''}]) == 0
+        assert len(index) == 3
+
+    def test_memory_cap_evicts_least_recent(self):
+        sizes = [len(doc['content'].encode('utf-8')) for doc in DOCUMENTS]
+        index = LexicalIndex(max_bytes=sizes[1] + sizes[2])
+        index.add(DOCUMENTS)
+
+        assert len(index) == 2
+        assert index.search('гарантия покрытие', limit=3) == []
+        assert index.size <= index.max_bytes
+
+    def test_answer_respects_min_score(self):
+        index = LexicalIndex(max_bytes=10_000)
+        index.add(DOCUMENTS)
+
+        assert index.answer('гарантия покрытия', 3, min_score=0.5)
+        assert index.answer('гарантия на двигатель', 3, min_score=0.9) is (
+            None
+        )
+
+    def test_kb_version_change_clears_index(self, monkeypatch):
+        index = LexicalIndex(max_bytes=10_000)
+        index.add(DOCUMENTS)
+        monkeypatch.setattr(settings, 'knowledge_base_version_id', 'v2')
+
+        assert index.search('гарантия', limit=3) == []
+        assert len(index) == 0
+
+    @pytest.mark.asyncio
+    async def test_save_and_load(self, tmp_path):
+        path = str(tmp_path / 'index' / 'lexical.json')
+        index = LexicalIndex(max_bytes=10_000)
+        index.add(DOCUMENTS)
+        await index.save(path)
+
+        restored = LexicalIndex(max_bytes=10_000)
+        await restored.load(path)
+
+        assert len(restored) == 3
+        assert restored.search('поддержка дилеров', 1)[0][1]['metadata'] == (
+            {'file': 'support.pdf'}
+        )
+
+    @pytest.mark.asyncio
+    async def test_save_uses_unique_temp_file(self, tmp_path):
+        '''Тест что сохранение не трогает чужой временный файл'''
+        path = tmp_path / 'lexical.json'
+        foreign = tmp_path / 'lexical.json.tmp'
+        foreign.write_text('другой процесс')
+        index = LexicalIndex(max_bytes=10_000)
+        index.add(DOCUMENTS)
+
+        await index.save(str(path))
+
+        assert foreign.read_text() == 'другой процесс'
+        assert sorted(item.name for item in tmp_path.iterdir()) == [
+            'lexical.json', 'lexical.json.lock', 'lexical.json.tmp',
+        ]
+
+    @pytest.mark.asyncio
+    async def test_only_owner_saves(self, tmp_path):
+        '''Тест что индекс сохраняет только процесс-владелец файла'''
+        path = str(tmp_path / 'lexical.json')
+        owner = LexicalIndex(max_bytes=10_000)
+        other = LexicalIndex(max_bytes=10_000)
+        await owner.load(path)
+        await other.load(path)
+        owner.add(DOCUMENTS[:1])
+        other.add(DOCUMENTS)
+
+        await other.save(path)
+        assert not (tmp_path / 'lexical.json').exists()
+        await owner.save(path)
+
+        restored = LexicalIndex(max_bytes=10_000)
+        await restored.load(path)
+        assert len(restored) == 1
+
+
+class TestLexicalFallback:
+    '''Тесты ответов из локального индекса в request_to_rag'''
+
+    @pytest.mark.asyncio
+    async def test_answers_when_upstream_unavailable(self, monkeypatch):
+        def handler(request: httpx.Request) -> httpx.Response:
+            if str(request.url) == settings.auth_url:
+                return make_rag_handler([])(request)
+            return httpx.Response(503, text='unavailable')
+
+        use_mock_transport(monkeypatch, handler)
+        lexical_index.add(DOCUMENTS)
+        server.retrieve_breaker.record_success()
+
+        result = await server.request_to_rag.fn('Гарантия на покрытие')
+        server.retrieve_breaker.record_success()
+
+        assert 'лакокрасочное покрытие' in contents(result)
+
+    @pytest.mark.asyncio
+    async def test_retrieved_documents_are_indexed(self, monkeypatch):
+        use_mock_transport(
+            monkeypatch, make_rag_handler([], documents=DOCUMENTS)
+        )
+
+        await server.request_to_rag.fn('Контакты поддержки')
+
+        assert len(lexical_index) == 3
+
+    @pytest.mark.asyncio
+    async def test_hot_query_resolved_locally(self, monkeypatch):
+        calls = []
+        use_mock_transport(monkeypatch, make_rag_handler(calls))
+        monkeypatch.setattr(settings, 'rag_lexical_local_enabled', True)
+        lexical_index.add(DOCUMENTS)
+
+        result = await server.request_to_rag.fn('Регламент обслуживания')
+
+        assert 'Регламент технического обслуживания' in contents(result)
+        assert calls == []
+
+    @pytest.mark.asyncio
+    async def test_slow_upstream_served_locally(self, monkeypatch):
+        monkeypatch.setattr(settings, 'rag_lexical_fallback_timeout', 0.01)
+        lexical_index.add(DOCUMENTS)
+        finished = asyncio.Event()
+
+        async def slow_fetch() -> list:
+            await asyncio.sleep(0.05)
+            finished.set()
+            return []
+
+        result = await server.fetch_with_lexical_fallback(
+            'Телефон поддержки', 6, slow_fetch
+        )
+
+        assert 'Телефон технической поддержки' in contents(result)
+        await asyncio.wait_for(finished.wait(), timeout=1)
@@ -0,0 +1,117 @@
+'''
+Тесты для ограничения нагрузки на Managed RAG
+'''
+import asyncio
+import time
+
+import pytest
+
+from app.services.mcp_rag.limiter import (
+    OverloadedError,
+    TokenBucket,
+    UpstreamLimiter,
+)
+
+
+def make_limiter(**overrides) -> UpstreamLimiter:
+    params = {
+        'max_concurrency': 2,
+        'rate': 0.0,
+        'burst': 1,
+        'max_queue': 10,
+        'queue_timeout': 1.0,
+    }
+    params.update(overrides)
+    return UpstreamLimiter(**params)
+
+
+class TestUpstreamLimiter:
+    '''Тесты UpstreamLimiter'''
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limited(self):
+        '''Тест ограничения одновременных запросов'''
+        limiter = make_limiter(max_concurrency=2)
+        max_active = 0
+
+        async def request():
+            nonlocal max_active
+            async with limiter.acquire():
+                max_active = max(max_active, limiter.active)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(request() for _ in range(6)))
+
+        assert max_active == 2
+        assert limiter.stats['acquired'] == 6
+        assert limiter.stats['queue_time_max'] > 0
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_full(self):
+        '''Тест отказа при переполненной очереди'''
+        limiter = make_limiter(max_concurrency=1, max_queue=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.acquire():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(OverloadedError):
+            async with limiter.acquire():
+                pass
+
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert limiter.stats['rejected'] == 1
+
+    @pytest.mark.asyncio
+    async def test_rejects_after_queue_timeout(self):
+        '''Тест отказа по таймауту ожидания в очереди'''
+        limiter = make_limiter(max_concurrency=1, queue_timeout=0.01)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.acquire():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(OverloadedError):
+            async with limiter.acquire():
+                pass
+
+        release.set()
+        await holder
+        assert limiter.stats['waiting'] == 0
+        assert limiter.stats['active'] == 0
+
+
+class TestTokenBucket:
+    '''Тесты TokenBucket'''
+
+    @pytest.mark.asyncio
+    async def test_rate_limited_after_burst(self):
+        '''Тест ограничения частоты после исчерпания запаса'''
+        bucket = TokenBucket(rate=100, capacity=2)
+        started = time.monotonic()
+
+        for _ in range(4):
+            await bucket.take()
+
+        assert time.monotonic() - started >= 0.015
+
+    @pytest.mark.asyncio
+    async def test_disabled_when_rate_zero(self):
+        '''Тест отключения ограничения частоты'''
+        bucket = TokenBucket(rate=0, capacity=1)
+        started = time.monotonic()
+
+        for _ in range(100):
+            await bucket.take()
+
+        assert time.monotonic() - started < 0.05
@@ -0,0 +1,171 @@
+'''
+Тесты метрик MCP RAG сервера
+'''
+import httpx
+import pytest
+
+from app.services.mcp_rag import server
+from app.services.mcp_rag.metrics import (
+    MetricsRegistry,
+    stage_duration,
+    token_refreshes,
+    tool_duration,
+    upstream_responses,
+)
+from tests.conftest import make_rag_handler, use_mock_transport
+
+
+class TestMetricsRegistry:
+    def test_counter_renders_labels_and_total_suffix(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('requests', 'Запросы', ('status',))
+        counter.inc(status='200')
+        counter.inc(2, status='503')
+
+        text = registry.render()
+
+        assert '# TYPE requests_total counter' in text
+        assert 'requests_total{status="200"} 1' in text
+        assert 'requests_total{status="503"} 2' in text
+
+    def test_samples_belong_to_declared_family(self):
+        registry = MetricsRegistry()
+        registry.counter('requests', 'Запросы', ('status',)).inc(status='ok')
+        registry.counter_callback('rejected', 'Отклонено', lambda: 3)
+        registry.gauge('in_flight', 'Выполняется').set(1)
+        registry.histogram('latency', 'Задержка', buckets=(1.0,)).observe(
+            0.5
+        )
+
+        families = {}
+        family = None
+        for line in registry.render().splitlines():
+            if line.startswith('# HELP '):
+                help_name = line.split()[2]
+            elif line.startswith('# TYPE '):
+                _, _, family, kind = line.split()
+                assert family == help_name
+                families[family] = kind
+            else:
+                sample = line.split('{')[0].split()[0]
+                suffixes = (
+                    ('_bucket', '_sum', '_count')
+                    if families[family] == 'histogram' else ('',)
+                )
+                assert sample in {family + suffix for suffix in suffixes}
+
+        assert families == {
+            'requests_total': 'counter',
+            'rejected_total': 'counter',
+            'in_flight': 'gauge',
+            'latency': 'histogram',
+        }
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram(
+            'latency', 'Задержка', ('stage',), buckets=(0.1, 1.0)
+        )
+        histogram.observe(0.05, stage='a')
+        histogram.observe(0.5, stage='a')
+        histogram.observe(5.0, stage='a')
+
+        text = registry.render()
+
+        assert 'latency_bucket{stage="a",le="0.1"} 1' in text
+        assert 'latency_bucket{stage="a",le="1"} 2' in text
+        assert 'latency_bucket{stage="a",le="+Inf"} 3' in text
+        assert 'latency_sum{stage="a"} 5.55' in text
+        assert 'latency_count{stage="a"} 3' in text
+
+    def test_unknown_labels_are_rejected(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('requests', 'Запросы', ('status',))
+
+        with pytest.raises(ValueError):
+            counter.inc(code='200')
+
+    def test_gauges_track_in_progress_and_callbacks(self):
+        registry = MetricsRegistry()
+        gauge = registry.gauge('in_flight', 'Выполняется')
+        registry.gauge_callback('ratio', 'Доля', lambda: 0.25)
+
+        with gauge.track_inprogress():
+            assert gauge.value() == 1
+        text = registry.render()
+
+        assert gauge.value() == 0
+        assert 'in_flight 0' in text
+        assert 'ratio 0.25' in text
+
+    def test_callback_counter(self):
+        registry = MetricsRegistry()
+        registry.counter_callback('rejected', 'Отклонено', lambda: 3)
+
+        text = registry.render()
+
+        assert '# TYPE rejected_total counter' in text
+        assert 'rejected_total 3' in text
+
+
+class TestServerMetrics:
+    @pytest.mark.asyncio
+    async def test_request_to_rag_records_stages(self, monkeypatch):
+        use_mock_transport(monkeypatch, make_rag_handler([]))
+        stages = ('token', 'queue', 'upstream', 'decode', 'postprocess')
+        before = {
+            stage: stage_duration.count(stage=stage) for stage in stages
+        }
+        ok_before = upstream_responses.value(status='200')
+        refreshes_before = token_refreshes.value(result='success')
+        misses_before = tool_duration.count(cache='miss')
+        hits_before = tool_duration.count(cache='hit')
+
+        await server.request_to_rag.fn('Контакты поддержки')
+        await server.request_to_rag.fn('Контакты поддержки')
+
+        for stage in stages:
+            assert stage_duration.count(stage=stage) == before[stage] + 1
+        assert upstream_responses.value(status='200') == ok_before + 1
+        assert token_refreshes.value(result='success') == (
+            refreshes_before + 1
+        )
+        assert tool_duration.count(cache='miss') == misses_before + 1
+        assert tool_duration.count(cache='hit') == hits_before + 1
+
+    @pytest.mark.asyncio
+    async def test_upstream_errors_are_counted_by_status(self, monkeypatch):
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith('token'):
+                return make_rag_handler([])(request)
+            return httpx.Response(503, text='unavailable')
+
+        use_mock_transport(monkeypatch, handler)
+        server.retrieve_breaker.record_success()
+        before = upstream_responses.value(status='503')
+
+        with pytest.raises(RuntimeError):
+            await server.request_to_rag.fn('Недоступный upstream')
+
+        assert upstream_responses.value(status='503') == before + 1
+        server.retrieve_breaker.record_success()
+
+    @pytest.mark.asyncio
+    async def test_metrics_route_serves_prometheus_text(self):
+        app = server.mcp.http_app(transport='sse')
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url='http://mcp'
+        ) as client:
+            response = await client.get('/metrics')
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/plain')
+        assert '# TYPE rag_stage_duration_seconds histogram' in response.text
+        assert 'rag_cache_hit_ratio' in response.text
+        assert 'rag_tool_calls_in_flight' in response.text
+        for name in ('rag_upstream_rejected', 'rag_singleflight_coalesced',
+                     'rag_circuit_rejected', 'rag_hedged_requests',
+                     'rag_hedge_wins'):
+            assert f'# TYPE {name}_total counter' in response.text
+            assert f'\n{name}_total ' in response.text
@@ -0,0 +1,167 @@
+'''
+Тесты для постоянного кэша MCP RAG сервера
+'''
+import time
+
+import pytest
+import pytest_asyncio
+
+from app.core.config import settings
+from app.services.mcp_rag import server
+from app.services.mcp_rag.cache import retrieval_cache
+from app.services.mcp_rag.persistent_cache import PersistentRetrievalCache
+
+
+@pytest_asyncio.fixture
+async def disk_cache(tmp_path):
+    '''Постоянный кэш во временном каталоге'''
+    cache = PersistentRetrievalCache(
+        path=str(tmp_path / 'cache' / 'rag.sqlite3'),
+        max_bytes=10_000,
+        ttl=3600,
+    )
+    await cache.open()
+    yield cache
+    await cache.close()
+
+
+def age(cache: PersistentRetrievalCache, key: tuple, seconds: float):
+    '''Делает запись на диске старше на seconds секунд'''
+    cache._connection.execute(
+        'UPDATE retrieval_cache SET created_at = created_at - ? '
+        'WHERE key = ?',
+        (seconds, cache.serialize_key(key)),
+    )
+    cache._connection.commit()
+
+
+def make_key(query: str) -> tuple:
+    return retrieval_cache.make_key(
+        query, settings.knowledge_base_version_id, 6
+    )
+
+
+class TestPersistentRetrievalCache:
+    '''Тесты PersistentRetrievalCache'''
+
+    @pytest.mark.asyncio
+    async def test_disabled_without_path(self):
+        '''Тест что кэш без пути ничего не хранит'''
+        cache = PersistentRetrievalCache(path=None, max_bytes=100, ttl=60)
+        await cache.open()
+        await cache.set(make_key('вопрос'), 'ответ')
+
+        assert not cache.enabled
+        assert await cache.get(make_key('вопрос')) is None
+
+    @pytest.mark.asyncio
+    async def test_value_survives_reopen(self, disk_cache):
+        '''Тест что запись доступна после перезапуска'''
+        await disk_cache.set(make_key('вопрос'), 'ответ')
+        await disk_cache.close()
+        await disk_cache.open()
+
+        value, created_at = await disk_cache.get(make_key('вопрос'))
+        assert value == 'ответ'
+        assert time.time() - 5 < created_at <= time.time()
+
+    @pytest.mark.asyncio
+    async def test_other_kb_version_ignored(self, disk_cache, monkeypatch):
+        '''Тест что записи другой версии базы знаний не отдаются'''
+        await disk_cache.set(make_key('вопрос'), 'ответ')
+        monkeypatch.setattr(settings, 'knowledge_base_version_id', 'v2')
+
+        assert await disk_cache.get(make_key('вопрос')) is None
+
+    @pytest.mark.asyncio
+    async def test_evicted_by_size(self, disk_cache):
+        '''Тест вытеснения давно не использованных записей по размеру'''
+        disk_cache.max_bytes = 250
+        await disk_cache.set(make_key('первый'), 'а' * 50)
+        await disk_cache.set(make_key('второй'), 'б' * 50)
+        await disk_cache.get(make_key('первый'))
+        await disk_cache.set(make_key('третий'), 'в' * 50)
+
+        assert await disk_cache.get(make_key('второй')) is None
+        assert await disk_cache.get(make_key('первый')) is not None
+        assert await disk_cache.get(make_key('третий')) is not None
+
+    @pytest.mark.asyncio
+    async def test_hottest_ordered_by_hits(self, disk_cache):
+        '''Тест выбора самых популярных записей'''
+        await disk_cache.set(make_key('редкий'), 'ответ 1')
+        await disk_cache.set(make_key('частый'), 'ответ 2')
+        for _ in range(3):
+            await disk_cache.get(make_key('частый'))
+
+        hottest = await disk_cache.hottest(1)
+
+        assert [(key, value) for key, value, _ in hottest] == [
+            (make_key('частый'), 'ответ 2')
+        ]
+
+    @pytest.mark.asyncio
+    async def test_warm_up_loads_memory_cache(self, disk_cache, monkeypatch):
+        '''Тест прогрева кэша в памяти при старте'''
+        await disk_cache.set(make_key('вопрос'), 'ответ')
+        monkeypatch.setattr(server, 'persistent_cache', disk_cache)
+        retrieval_cache.clear()
+
+        await server.warm_up_retrieval_cache()
+
+        try:
+            assert retrieval_cache.get(make_key('вопрос')) == 'ответ'
+        finally:
+            retrieval_cache.clear()
+
+    @pytest.mark.asyncio
+    async def test_warm_up_keeps_entry_age(self, disk_cache, monkeypatch):
+        '''Тест что запись с диска загружается с учетом ее возраста'''
+        await disk_cache.set(make_key('устаревший'), 'ответ 1')
+        await disk_cache.set(make_key('просроченный'), 'ответ 2')
+        age(disk_cache, make_key('устаревший'), settings.rag_cache_ttl + 1)
+        age(
+            disk_cache, make_key('просроченный'),
+            settings.rag_cache_ttl + settings.rag_cache_stale_ttl + 1,
+        )
+        monkeypatch.setattr(server, 'persistent_cache', disk_cache)
+        retrieval_cache.clear()
+
+        await server.warm_up_retrieval_cache()
+
+        try:
+            assert retrieval_cache.lookup(make_key('устаревший')) == (
+                'ответ 1', True
+            )
+            assert retrieval_cache.lookup(make_key('просроченный')) == (
+                None, False
+            )
+        finally:
+            retrieval_cache.clear()
+
+    @pytest.mark.asyncio
+    async def test_old_entry_refreshed_in_background(
+        self, disk_cache, monkeypatch
+    ):
+        '''Тест что устаревшая запись с диска обновляется в фоне'''
+        key = make_key('вопрос')
+        await disk_cache.set(key, [])
+        age(disk_cache, key, settings.rag_cache_ttl + 1)
+        monkeypatch.setattr(server, 'persistent_cache', disk_cache)
+        retrieval_cache.clear()
+        fetched = []
+
+        async def fan_out_retrieve(query, retrieve_limit):
+            fetched.append(query)
+            return {'results': []}
+
+        monkeypatch.setattr(server, 'fan_out_retrieve', fan_out_retrieve)
+        monkeypatch.setattr(settings, 'retrieve_limit', 6)
+
+        try:
+            assert await server.retrieve_context('вопрос') == []
+            await server.drain_background_tasks(1.0)
+        finally:
+            retrieval_cache.clear()
+
+        assert fetched == ['вопрос']
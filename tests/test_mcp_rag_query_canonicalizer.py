@@ -0,0 +1,93 @@
+'''
+Тесты канонизации запросов для ключей кэша
+'''
+import pytest
+
+from app.core.config import settings
+from app.services.mcp_rag.cache import RetrievalCache
+from app.services.mcp_rag.query_canonicalizer import canonicalize_query
+from app.services.mcp_rag.query_replay import (
+    KEY_STRATEGIES,
+    baseline_key,
+    replay_hit_rate,
+)
+
+
+class TestCanonicalizeQuery:
+    '''Тесты canonicalize_query'''
+
+    @pytest.mark.parametrize('query', [
+        'Гарантия на ЁЛКУ',
+        '  гарантия   на  елку?! ',
+        'ГАРАНТИЯ, на ёлку.',
+        'Гарантия на ёлку',
+        'Гарантия на «ёлку»',
+    ])
+    def test_variants_share_key(self, query):
+        '''Тест что варианты написания дают один ключ'''
+        assert canonicalize_query(
+            query, remove_stopwords=False, lemmatize=False
+        ) == 'гарантия на елку'
+
+    def test_stopwords_removed_when_enabled(self):
+        '''Тест удаления служебных слов без потери отрицаний'''
+        assert canonicalize_query(
+            'Какие условия гарантии, если не заводится?',
+            remove_stopwords=True,
+            lemmatize=False,
+        ) == 'условия гарантии не заводится'
+
+    def test_only_stopwords_kept(self):
+        '''Тест что запрос из одних служебных слов не становится пустым'''
+        assert canonicalize_query(
+            'Что это?', remove_stopwords=True, lemmatize=False
+        ) == 'что это'
+
+    def test_lemmatize_merges_word_forms(self):
+        '''Тест что формы слова сводятся к одному ключу'''
+        first = canonicalize_query(
+            'гарантия автомобиля', remove_stopwords=False, lemmatize=True
+        )
+        second = canonicalize_query(
+            'Гарантии автомобилю', remove_stopwords=False, lemmatize=True
+        )
+
+        assert first == second
+
+    def test_settings_control_optional_steps(self, monkeypatch):
+        '''Тест что опциональные шаги включаются настройками'''
+        monkeypatch.setattr(settings, 'rag_query_remove_stopwords', True)
+
+        key = RetrievalCache.make_key('Что такое гарантия?', 'v1', 6)
+
+        assert key[0] == 'такое гарантия'
+
+
+class TestQueryReplay:
+    '''Тесты оценки доли попаданий на журнале запросов'''
+
+    QUERIES = [
+        'Гарантия на покрытие',
+        'гарантия на покрытие?',
+        'Гарантия  на покрытие.',
+        'Телефон поддержки',
+        'телефон поддержки!',
+    ]
+
+    def test_canonical_key_improves_hit_rate(self):
+        baseline, baseline_keys = replay_hit_rate(
+            self.QUERIES, baseline_key, cache_size=10
+        )
+        canonical, canonical_keys = replay_hit_rate(
+            self.QUERIES, KEY_STRATEGIES['canonical'], cache_size=10
+        )
+
+        assert baseline == 0
+        assert canonical == pytest.approx(3 / 5)
+        assert (baseline_keys, canonical_keys) == (5, 2)
+
+    def test_lru_capacity_limits_hits(self):
+        queries = ['a', 'b', 'a', 'b']
+
+        assert replay_hit_rate(queries, baseline_key, cache_size=1)[0] == 0
+        assert replay_hit_rate(queries, baseline_key, cache_size=2)[0] == 0.5
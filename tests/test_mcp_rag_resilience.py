@@ -0,0 +1,139 @@
+'''
+Тесты для circuit breaker и хеджирования запросов MCP RAG сервера
+'''
+import asyncio
+
+import pytest
+
+from app.services.mcp_rag import resilience
+from app.services.mcp_rag.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    HedgedCaller,
+)
+from tests.conftest import FakeClock
+
+
+class TestCircuitBreaker:
+    '''Тесты CircuitBreaker'''
+
+    def test_opens_after_threshold(self):
+        '''Тест размыкания цепи после серии отказов'''
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        assert breaker.stats['rejected'] == 1
+
+    def test_success_resets_failures(self):
+        '''Тест что успешный запрос сбрасывает счетчик отказов'''
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_allows_single_probe(self, monkeypatch):
+        '''Тест пробного запроса после recovery_timeout'''
+        clock = FakeClock()
+        monkeypatch.setattr(resilience.time, 'monotonic', clock)
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+        breaker.record_failure()
+        clock.now += 31
+
+        breaker.before_call()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_probe_reopens(self, monkeypatch):
+        '''Тест повторного размыкания после неудачной пробы'''
+        clock = FakeClock()
+        monkeypatch.setattr(resilience.time, 'monotonic', clock)
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30)
+        for _ in range(3):
+            breaker.record_failure()
+        clock.now += 31
+        breaker.before_call()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+
+class TestHedgedCaller:
+    '''Тесты HedgedCaller'''
+
+    def test_no_delay_without_enough_samples(self):
+        '''Тест что без статистики хеджирование не включается'''
+        caller = HedgedCaller(percentile=0.95, min_samples=3, min_delay=0.1)
+        caller.observe(1.0)
+
+        assert caller.delay() is None
+
+    def test_delay_from_percentile(self):
+        '''Тест расчета задержки по перцентилю'''
+        caller = HedgedCaller(percentile=0.9, min_samples=10, min_delay=0.01)
+        for idx in range(1, 11):
+            caller.observe(idx / 10)
+
+        assert caller.delay() == pytest.approx(0.9)
+
+    @pytest.mark.asyncio
+    async def test_hedge_wins_over_slow_primary(self):
+        '''Тест что быстрый повторный запрос заменяет медленный'''
+        caller = HedgedCaller(percentile=0.5, min_samples=1, min_delay=0.01)
+        caller.observe(0.01)
+        delays = iter([1.0, 0.0])
+
+        async def request():
+            await asyncio.sleep(next(delays))
+            return 'ok'
+
+        result = await asyncio.wait_for(caller.call(request), timeout=0.5)
+
+        assert result == 'ok'
+        assert caller.stats['hedges'] == 1
+        assert caller.stats['hedge_wins'] == 1
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_not_hedged(self):
+        '''Тест что быстрый ответ не вызывает повторный запрос'''
+        caller = HedgedCaller(percentile=0.5, min_samples=1, min_delay=0.05)
+        caller.observe(0.05)
+        calls = 0
+
+        async def request():
+            nonlocal calls
+            calls += 1
+            return 'ok'
+
+        assert await caller.call(request) == 'ok'
+        assert calls == 1
+        assert caller.stats['hedges'] == 0
+
+    @pytest.mark.asyncio
+    async def test_hedging_disabled(self):
+        '''Тест отключения хеджирования'''
+        caller = HedgedCaller(percentile=0.5, min_samples=1, min_delay=0.01)
+        caller.observe(0.01)
+        calls = 0
+
+        async def request():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return 'ok'
+
+        assert await caller.call(request, hedge=False) == 'ok'
+        assert calls == 1
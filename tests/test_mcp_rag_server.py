@@ -0,0 +1,368 @@
+'''
+Тесты для MCP RAG сервера
+'''
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services.mcp_rag import server
+from app.services.mcp_rag import token_manager as token_manager_module
+from app.services.mcp_rag.cache import retrieval_cache
+from app.services.mcp_rag.http_client import rag_http_client
+from app.services.mcp_rag.resilience import CircuitBreaker, CircuitOpenError
+from app.services.mcp_rag.token_manager import TokenManager
+from tests.conftest import (
+    FakeClock,
+    contents,
+    make_rag_handler,
+    use_mock_transport,
+)
+
+
+@pytest.fixture
+def rag_calls(monkeypatch):
+    '''Мок auth и retrieve API с журналом запросов'''
+    calls = []
+    use_mock_transport(monkeypatch, make_rag_handler(calls))
+    return calls
+
+
+class TestRagHttpClient:
+    '''Тесты общего пула HTTP соединений'''
+
+    @pytest.mark.asyncio
+    async def test_client_is_reused_between_calls(self):
+        '''Тест что клиент создается один раз и переиспользуется'''
+        try:
+            first = rag_http_client.client
+            second = rag_http_client.client
+            assert first is second
+        finally:
+            await rag_http_client.aclose()
+        assert rag_http_client._client is None
+
+    @pytest.mark.asyncio
+    async def test_server_lifespan_closes_client(self):
+        '''Тест что lifespan сервера создает и закрывает клиент'''
+        async with server.server_lifespan():
+            client = rag_http_client.client
+            assert not client.is_closed
+        assert client.is_closed
+
+    def test_retrieve_timeout_from_settings(self):
+        '''Тест таймаутов для отдельных эндпоинтов'''
+        timeout = rag_http_client.retrieve_timeout
+        assert timeout.read == settings.rag_retrieve_timeout
+        assert timeout.connect <= settings.rag_connect_timeout
+
+
+class TestRequestToRag:
+    '''Тесты инструмента request_to_rag'''
+
+    @pytest.mark.asyncio
+    async def test_request_uses_shared_client(self, rag_calls):
+        '''Тест запроса к базе знаний через общий клиент'''
+        result = await server.request_to_rag.fn('Контакты поддержки')
+
+        assert 'Телефон поддержки 8-800' in contents(result)
+        assert [str(call.url) for call in rag_calls] == [
+            settings.auth_url,
+            settings.retrieve_url_template,
+        ]
+
+    @pytest.mark.asyncio
+    async def test_repeated_query_served_from_cache(self, rag_calls):
+        '''Тест что повторный запрос не обращается к upstream'''
+        hits_before = retrieval_cache.hits
+        first = await server.request_to_rag.fn('Контакты поддержки')
+        second = await server.request_to_rag.fn('  контакты   ПОДДЕРЖКИ ')
+
+        assert first == second
+        assert len(rag_calls) == 2
+        assert retrieval_cache.hits == hits_before + 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_queries_coalesced(self, rag_calls):
+        '''Тест что одновременные одинаковые запросы объединяются'''
+        results = await asyncio.gather(
+            *(server.request_to_rag.fn('Гарантия') for _ in range(10))
+        )
+
+        assert all(result == results[0] for result in results)
+        retrieve_calls = [
+            call for call in rag_calls
+            if str(call.url) == settings.retrieve_url_template
+        ]
+        assert len(retrieve_calls) == 1
+
+
+class TestTokenManager:
+    '''Тесты менеджера токенов Managed RAG'''
+
+    @pytest.mark.asyncio
+    async def test_concurrent_refresh_shares_one_request(self, rag_calls):
+        '''Тест что одновременные обновления делают один запрос'''
+        manager = TokenManager()
+
+        tokens = await asyncio.gather(
+            *(manager.get_token() for _ in range(10))
+        )
+
+        assert set(tokens) == {'token-1'}
+        assert len(rag_calls) == 1
+        assert manager.refresh_count == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_token_refreshed_once(self, rag_calls):
+        '''Тест что 401 по уже замененному токену не обновляет его снова'''
+        manager = TokenManager()
+        stale = await manager.get_token()
+        fresh = await manager.refresh(stale_token=stale)
+
+        assert fresh != stale
+        assert await manager.refresh(stale_token=stale) == fresh
+        assert manager.refresh_count == 2
+
+    @pytest.mark.asyncio
+    async def test_reset_forgets_token(self, rag_calls):
+        '''Тест что после reset токен запрашивается заново'''
+        manager = TokenManager()
+        first = await manager.get_token()
+
+        manager.reset()
+
+        assert not manager.is_valid
+        assert await manager.get_token() != first
+        assert len(rag_calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_get_token_does_not_wait_for_refresh(self, monkeypatch):
+        '''Тест что во время фонового обновления отдается прежний токен'''
+        clock = FakeClock()
+        monkeypatch.setattr(
+            token_manager_module, 'time',
+            SimpleNamespace(monotonic=clock, time=time.time),
+        )
+        calls = []
+        handler = make_rag_handler(calls)
+        release = asyncio.Event()
+
+        async def slow_auth(request: httpx.Request) -> httpx.Response:
+            response = handler(request)
+            if len(calls) > 1:
+                await release.wait()
+            return response
+
+        use_mock_transport(monkeypatch, slow_auth)
+        manager = TokenManager()
+        first = await manager.get_token()
+        clock.now += TokenManager._refresh_after(3600) + 1
+
+        token = await asyncio.wait_for(manager.get_token(), timeout=0.1)
+        await asyncio.sleep(0)
+
+        assert token == first
+        assert len(calls) == 2
+        release.set()
+        assert await manager.refresh() == 'token-2'
+        assert await manager.get_token() == 'token-2'
+
+    def test_refresh_after_uses_expires_in(self):
+        '''Тест расчета момента обновления по expires_in'''
+        margin = settings.rag_token_refresh_margin
+        assert TokenManager._refresh_after(3600) == 3600 - margin
+        assert TokenManager._refresh_after(10) == 5
+        assert TokenManager._refresh_after(None) == (
+            settings.rag_token_default_ttl - margin
+        )
+
+    @pytest.mark.asyncio
+    async def test_start_fetches_token(self, rag_calls):
+        '''Тест получения токена при старте сервера'''
+        manager = TokenManager()
+        await manager.start()
+        try:
+            assert manager.is_valid
+            assert len(rag_calls) == 1
+        finally:
+            await manager.stop()
+
+    @pytest.mark.asyncio
+    async def test_revoked_token_retried_after_refresh(self, monkeypatch):
+        '''Тест повтора запроса после 401 с новым токеном'''
+        calls = []
+        use_mock_transport(
+            monkeypatch,
+            make_rag_handler(calls, expired_tokens={'token-1'}),
+        )
+
+        result = await server.request_to_rag.fn('Контакты поддержки')
+
+        assert 'Телефон поддержки' in contents(result)
+        assert [str(call.url) for call in calls] == [
+            settings.auth_url,
+            settings.retrieve_url_template,
+            settings.auth_url,
+            settings.retrieve_url_template,
+        ]
+
+
+class TestStaleWhileRevalidate:
+    '''Тесты выдачи устаревших и пустых результатов'''
+
+    @pytest.mark.asyncio
+    async def test_stale_result_served_and_refreshed(self, monkeypatch):
+        '''Тест что устаревший результат отдается сразу и обновляется'''
+        answers = iter(['старый ответ', 'новый ответ'])
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if str(request.url) == settings.auth_url:
+                return httpx.Response(200, json={'access_token': 'token'})
+            return httpx.Response(
+                200, json={'results': [{'content': next(answers)}]}
+            )
+
+        use_mock_transport(monkeypatch, handler)
+        monkeypatch.setattr(retrieval_cache, 'ttl', 0.0)
+
+        first = await server.request_to_rag.fn('Гарантия')
+        monkeypatch.setattr(retrieval_cache, 'ttl', 300.0)
+        stale = await server.request_to_rag.fn('Гарантия')
+        await asyncio.gather(*server._background_tasks)
+        refreshed = await server.request_to_rag.fn('Гарантия')
+
+        assert 'старый ответ' in contents(first)
+        assert stale == first
+        assert 'новый ответ' in contents(refreshed)
+
+    @pytest.mark.asyncio
+    async def test_empty_result_cached_briefly(self, monkeypatch):
+        '''Тест короткого TTL для пустого ответа'''
+        calls = []
+        use_mock_transport(
+            monkeypatch, make_rag_handler(calls, documents=[])
+        )
+        monkeypatch.setattr(settings, 'rag_negative_cache_ttl', 0.0)
+
+        await server.request_to_rag.fn('Неизвестный вопрос')
+        await server.request_to_rag.fn('Неизвестный вопрос')
+
+        retrieve_calls = [
+            call for call in calls
+            if str(call.url) == settings.retrieve_url_template
+        ]
+        assert len(retrieve_calls) == 2
+
+
+class TestCircuitBreakerIntegration:
+    '''Тесты circuit breaker вокруг запросов retrieve'''
+
+    @pytest.mark.asyncio
+    async def test_fast_fail_after_upstream_errors(self, monkeypatch):
+        '''Тест отказа без обращения к upstream после серии 503'''
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            if str(request.url) == settings.auth_url:
+                return httpx.Response(200, json={'access_token': 'token'})
+            return httpx.Response(503, text='unavailable')
+
+        use_mock_transport(monkeypatch, handler)
+        monkeypatch.setattr(
+            server,
+            'retrieve_breaker',
+            CircuitBreaker(failure_threshold=2, recovery_timeout=30),
+        )
+
+        for query in ('первый', 'второй'):
+            with pytest.raises(RuntimeError, match='Статус: 503'):
+                await server.request_to_rag.fn(query)
+        calls_before = len(calls)
+        with pytest.raises(CircuitOpenError):
+            await server.request_to_rag.fn('третий')
+
+        assert len(calls) == calls_before
+
+    @pytest.mark.asyncio
+    async def test_client_errors_do_not_open_circuit(self, monkeypatch):
+        '''Тест что ошибки 4xx не размыкают цепь'''
+        def handler(request: httpx.Request) -> httpx.Response:
+            if str(request.url) == settings.auth_url:
+                return httpx.Response(200, json={'access_token': 'token'})
+            return httpx.Response(400, text='bad request')
+
+        use_mock_transport(monkeypatch, handler)
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+        monkeypatch.setattr(server, 'retrieve_breaker', breaker)
+
+        with pytest.raises(RuntimeError, match='Статус: 400'):
+            await server.request_to_rag.fn('вопрос')
+
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestRequestToRagBatch:
+    '''Тесты пакетного инструмента request_to_rag_batch'''
+
+    @pytest.mark.asyncio
+    async def test_results_returned_in_query_order(self, monkeypatch):
+        '''Тест порядка результатов и ограничения параллелизма'''
+        active = 0
+        max_active = 0
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            nonlocal active, max_active
+            if str(request.url) == settings.auth_url:
+                return httpx.Response(200, json={'access_token': 'token'})
+            query = json.loads(request.content)['query']
+            active += 1
+            max_active = max(max_active, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return httpx.Response(
+                200, json={'results': [{'content': f'ответ на {query}'}]}
+            )
+
+        use_mock_transport(monkeypatch, handler)
+        monkeypatch.setattr(settings, 'rag_batch_concurrency', 2)
+        queries = [f'вопрос {idx}' for idx in range(6)]
+
+        results = await server.request_to_rag_batch.fn(queries)
+
+        assert [item['query'] for item in results] == queries
+        for query, item in zip(queries, results):
+            assert f'ответ на {query}' in contents(item['result'])
+        assert max_active == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_query_reported_separately(self, monkeypatch):
+        '''Тест что ошибка одного запроса не ломает весь пакет'''
+        def handler(request: httpx.Request) -> httpx.Response:
+            if str(request.url) == settings.auth_url:
+                return httpx.Response(200, json={'access_token': 'token'})
+            if json.loads(request.content)['query'] == 'плохой':
+                return httpx.Response(500, text='internal error')
+            return httpx.Response(200, json={'results': []})
+
+        use_mock_transport(monkeypatch, handler)
+
+        results = await server.request_to_rag_batch.fn(['хороший', 'плохой'])
+
+        assert 'result' in results[0]
+        assert 'Статус: 500' in results[1]['error']
+
+    @pytest.mark.asyncio
+    async def test_batch_size_validated(self, monkeypatch):
+        '''Тест валидации размера пакета'''
+        monkeypatch.setattr(settings, 'rag_batch_max_queries', 2)
+
+        with pytest.raises(ValueError):
+            await server.request_to_rag_batch.fn([])
+        with pytest.raises(ValueError):
+            await server.request_to_rag_batch.fn(['a', 'b', 'c'])
@@ -0,0 +1,179 @@
+'''
+Тесты общего состояния worker процессов MCP RAG сервера
+'''
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+
+from app.core.config import settings
+from app.services.mcp_rag import server
+from app.services.mcp_rag import token_manager as token_manager_module
+from app.services.mcp_rag.shared_state import SharedStateStore
+from app.services.mcp_rag.token_manager import TokenManager
+from tests.conftest import make_rag_handler, use_mock_transport
+
+
+@pytest_asyncio.fixture
+async def store(tmp_path):
+    '''Общее хранилище во временном каталоге'''
+    shared = SharedStateStore(str(tmp_path / 'state' / 'shared.sqlite3'))
+    await shared.open()
+    yield shared
+    await shared.close()
+
+
+@pytest.fixture
+def shared_token_calls(monkeypatch, store):
+    '''Мок auth API и общее хранилище токена для TokenManager'''
+    calls = []
+    use_mock_transport(monkeypatch, make_rag_handler(calls))
+    monkeypatch.setattr(token_manager_module, 'shared_state', store)
+    return calls
+
+
+class TestSharedStateStore:
+    '''Тесты SharedStateStore'''
+
+    @pytest.mark.asyncio
+    async def test_disabled_without_path(self):
+        '''Тест что хранилище без пути ничего не хранит'''
+        shared = SharedStateStore(path=None)
+        await shared.open()
+        await shared.set('token', 'value', time.time() + 60)
+
+        assert not shared.enabled
+        assert await shared.get('token') is None
+
+    @pytest.mark.asyncio
+    async def test_value_expires(self, store):
+        '''Тест что просроченное значение не возвращается'''
+        await store.set('fresh', {'a': 1}, time.time() + 60)
+        await store.set('expired', 'value', time.time() - 1)
+
+        value, _ = await store.get('fresh')
+        assert value == {'a': 1}
+        assert await store.get('expired') is None
+
+    @pytest.mark.asyncio
+    async def test_visible_to_other_connection(self, store):
+        '''Тест что запись видна другому подключению к тому же файлу'''
+        other = SharedStateStore(store.path)
+        await other.open()
+        try:
+            await store.set('token', 'token-1', time.time() + 60)
+            value, _ = await other.get('token')
+        finally:
+            await other.close()
+
+        assert value == 'token-1'
+
+    @pytest.mark.asyncio
+    async def test_set_many(self, store):
+        '''Тест записи нескольких значений одной транзакцией'''
+        await store.set_many({'a': 1, 'b': [2]}, time.time() + 60)
+
+        assert (await store.get('a'))[0] == 1
+        assert (await store.get('b'))[0] == [2]
+
+    @pytest.mark.asyncio
+    async def test_expired_rows_pruned_on_write(self, tmp_path):
+        '''Тест что просроченные записи удаляются при записи'''
+        shared = SharedStateStore(
+            str(tmp_path / 'shared.sqlite3'), prune_interval=0.0
+        )
+        await shared.open()
+        try:
+            await shared.set('expired', 'value', time.time() - 1)
+            await shared.set('fresh', 'value', time.time() + 60)
+            rows = shared._connection.execute(
+                'SELECT name FROM shared_state'
+            ).fetchall()
+        finally:
+            await shared.close()
+
+        assert rows == [('fresh',)]
+
+    @pytest.mark.asyncio
+    async def test_documents_shared_in_one_write(self, monkeypatch, store):
+        '''Тест что документы ответа публикуются одной записью'''
+        batches = []
+        set_many = store.set_many
+
+        async def record(values, expires_at):
+            batches.append(sorted(values))
+            await set_many(values, expires_at)
+
+        monkeypatch.setattr(store, 'set_many', record)
+        monkeypatch.setattr(server, 'shared_state', store)
+
+        await server.share_documents([
+            {'id': 'a', 'body': 'первый'},
+            {'id': 'b', 'body': 'второй'},
+        ])
+
+        assert batches == [['document:a', 'document:b']]
+        assert (await store.get('document:b'))[0] == 'второй'
+
+
+class TestSharedToken:
+    '''Тесты разделения токена между процессами'''
+
+    @pytest.mark.asyncio
+    async def test_second_worker_reuses_token(self, shared_token_calls):
+        '''Тест что второй процесс берет токен из общего хранилища'''
+        first, second = TokenManager(), TokenManager()
+
+        assert await first.get_token() == 'token-1'
+        assert await second.get_token() == 'token-1'
+        assert second.is_valid
+        assert len(shared_token_calls) == 1
+        assert second.refresh_count == 0
+
+    @pytest.mark.asyncio
+    async def test_stale_shared_token_is_refreshed(self, shared_token_calls):
+        '''Тест что отклоненный upstream токен запрашивается заново'''
+        first, second = TokenManager(), TokenManager()
+        stale = await first.get_token()
+        await second.get_token()
+
+        fresh = await second.refresh(stale_token=stale)
+
+        assert fresh == 'token-2'
+        assert await first.refresh(stale_token=stale) == 'token-2'
+        assert len(shared_token_calls) == 2
+
+
+class TestGracefulShutdown:
+    '''Тесты остановки и числа процессов сервера'''
+
+    @pytest.mark.asyncio
+    async def test_drain_waits_for_background_tasks(self):
+        '''Тест что фоновые задачи дожидаются, а зависшие отменяются'''
+        finished = []
+
+        async def quick():
+            await asyncio.sleep(0.01)
+            finished.append('quick')
+
+        server._run_in_background(quick())
+        server._run_in_background(asyncio.sleep(10))
+
+        await server.drain_background_tasks(timeout=0.1)
+        await asyncio.sleep(0)
+
+        assert finished == ['quick']
+        assert not server._background_tasks
+
+    @pytest.mark.parametrize('transport, workers, expected', [
+        ('sse', 4, 1),
+        ('streamable-http', 4, 4),
+        ('streamable-http', 0, 1),
+    ])
+    def test_server_workers(self, monkeypatch, transport, workers, expected):
+        '''Тест что SSE всегда работает в одном процессе'''
+        monkeypatch.setattr(settings, 'mcp_transport', transport)
+        monkeypatch.setattr(settings, 'mcp_server_workers', workers)
+
+        assert server.server_workers() == expected
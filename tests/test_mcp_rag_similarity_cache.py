@@ -0,0 +1,200 @@
+'''
+Тесты кэша похожих запросов MCP RAG сервера
+'''
+import pytest
+
+from app.core.config import settings
+from app.services.mcp_rag import server
+from app.services.mcp_rag.lexical_index import LexicalIndex
+from app.services.mcp_rag.similarity_cache import (
+    MinHasher,
+    SimilarityCache,
+    jaccard,
+    query_shingles,
+    similarity_cache,
+)
+from app.services.mcp_rag.similarity_replay import replay_labelled
+from tests.conftest import make_rag_handler, use_mock_transport
+
+
+SUPPORT_DOCUMENTS = [{
+    'content': (
+        'Служба технической поддержки Киа: телефон 8-800. '
+        'Техподдержка отвечает на вопросы дилеров.'
+    ),
+    'metadata': {'file': 'support.pdf'},
+}]
+
+
+def support_index() -> LexicalIndex:
+    index = LexicalIndex(max_bytes=1024 * 1024)
+    index.add(SUPPORT_DOCUMENTS)
+    return index
+
+
+class TestSimilarityCache:
+    '''Тесты SimilarityCache'''
+
+    def test_shingles_ignore_word_order_and_form(self):
+        first = query_shingles('Контакты поддержки Киа')
+        second = query_shingles('киа, контакт поддержка')
+
+        assert jaccard(first, second) == 1.0
+
+    def test_minhash_estimates_jaccard(self):
+        hasher = MinHasher(num_permutations=256)
+        first = query_shingles('Гарантия на лакокрасочное покрытие')
+        second = query_shingles('Гарантия на покрытие кузова')
+
+        signatures = hasher.signature(first), hasher.signature(second)
+        estimate = sum(
+            a == b for a, b in zip(*signatures)
+        ) / len(signatures[0])
+
+        assert estimate == pytest.approx(jaccard(first, second), abs=0.1)
+
+    def test_finds_paraphrase_above_threshold(self):
+        cache = SimilarityCache(threshold=0.6, max_entries=10)
+        cache.add('Контакты техподдержки Киа', 'key-1', namespace=('v1',))
+
+        neighbour = cache.find(
+            'Киа контакты службы поддержки', namespace=('v1',)
+        )
+
+        assert neighbour is not None
+        assert neighbour[0] == 'key-1'
+        assert cache.find(
+            'Гарантия на аккумулятор', namespace=('v1',)
+        ) is None
+
+    def test_other_brand_not_reused(self):
+        '''Тест что запрос про другую марку не получает чужой контекст'''
+        cache = SimilarityCache(
+            threshold=0.6, max_entries=10,
+            term_share=support_index().term_share,
+        )
+        cache.add('Контакты техподдержки Киа', 'kia', namespace=())
+        cache.add('Периодичность ТО Kia Rio', 'rio', namespace=())
+
+        assert jaccard(
+            query_shingles('Контакты техподдержки Киа'),
+            query_shingles('Контакты техподдержки Хендай'),
+        ) >= 0.6
+        assert cache.find(
+            'Контакты техподдержки Хендай', namespace=()
+        ) is None
+        assert cache.find('Периодичность ТО Kia Ceed', namespace=()) is None
+        assert cache.guarded == 2
+        assert cache.find(
+            'Киа контакты службы поддержки', namespace=()
+        )[0] == 'kia'
+
+    def test_unknown_words_are_key_terms(self):
+        '''Тест что без статистики документов слова считаются редкими'''
+        cache = SimilarityCache(
+            threshold=0.6, max_entries=10,
+            term_share=LexicalIndex(max_bytes=1024).term_share,
+        )
+        cache.add('Контакты техподдержки Киа', 'kia', namespace=())
+
+        assert cache.find(
+            'Киа контакты службы поддержки', namespace=()
+        ) is None
+        assert cache.find('киа, контакты техподдержки', namespace=())
+
+    def test_namespace_separates_entries(self):
+        cache = SimilarityCache(threshold=0.6, max_entries=10)
+        cache.add('Контакты поддержки', 'key-1', namespace=('v1', 6))
+
+        assert cache.find('Контакты поддержки', namespace=('v2', 6)) is None
+
+    def test_eviction_removes_buckets(self):
+        cache = SimilarityCache(threshold=0.6, max_entries=1)
+        cache.add('Контакты поддержки', 'key-1', namespace=())
+        cache.add('Гарантия на покрытие', 'key-2', namespace=())
+
+        assert len(cache) == 1
+        assert cache.find('Контакты поддержки', namespace=()) is None
+        assert all(
+            bucket == {'key-2'} for bucket in cache._buckets.values()
+        )
+
+
+class TestSimilarityReplay:
+    '''Тесты оценки точности на размеченном журнале'''
+
+    LABELLED = [
+        ('Контакты техподдержки Киа', 'support'),
+        ('Киа контакты службы поддержки', 'support'),
+        ('Гарантия на лакокрасочное покрытие', 'paint'),
+        ('Какая гарантия на лакокрасочное покрытие?', 'paint'),
+        ('Гарантия на аккумулятор', 'battery'),
+    ]
+
+    def test_precision_and_recall(self):
+        result = replay_labelled(self.LABELLED, threshold=0.6)
+
+        assert result.reused == 2
+        assert result.precision == 1.0
+        assert result.recall == 1.0
+
+    def test_strict_threshold_reuses_only_equivalent_queries(self):
+        result = replay_labelled(self.LABELLED, threshold=1.0)
+
+        assert result.reused == 1
+        assert result.precision == 1.0
+        assert result.recall == 0.5
+
+
+class TestServerSimilarityCache:
+    '''Тесты переиспользования результатов в request_to_rag'''
+
+    @pytest.mark.asyncio
+    async def test_paraphrase_reuses_result(self, monkeypatch):
+        calls = []
+        use_mock_transport(
+            monkeypatch, make_rag_handler(calls, SUPPORT_DOCUMENTS)
+        )
+        monkeypatch.setattr(settings, 'rag_similarity_cache_enabled', True)
+
+        first = await server.request_to_rag.fn('Контакты техподдержки Киа')
+        second = await server.request_to_rag.fn(
+            'Киа контакты службы поддержки'
+        )
+
+        assert first == second
+        assert [str(call.url) for call in calls] == [
+            settings.auth_url,
+            settings.retrieve_url_template,
+        ]
+
+    @pytest.mark.asyncio
+    async def test_disabled_by_default(self, monkeypatch):
+        calls = []
+        use_mock_transport(monkeypatch, make_rag_handler(calls))
+
+        await server.request_to_rag.fn('Контакты техподдержки Киа')
+        await server.request_to_rag.fn('Киа контакты службы поддержки')
+
+        assert len(similarity_cache) == 0
+        assert sum(
+            str(call.url) == settings.retrieve_url_template
+            for call in calls
+        ) == 2
+
+    @pytest.mark.asyncio
+    async def test_other_brand_queries_upstream(self, monkeypatch):
+        '''Тест что запрос про другую марку идет в Managed RAG'''
+        calls = []
+        use_mock_transport(
+            monkeypatch, make_rag_handler(calls, SUPPORT_DOCUMENTS)
+        )
+        monkeypatch.setattr(settings, 'rag_similarity_cache_enabled', True)
+
+        await server.request_to_rag.fn('Контакты техподдержки Киа')
+        await server.request_to_rag.fn('Контакты техподдержки Хендай')
+
+        assert sum(
+            str(call.url) == settings.retrieve_url_template
+            for call in calls
+        ) == 2
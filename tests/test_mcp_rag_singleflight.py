@@ -0,0 +1,84 @@
+'''
+Тесты для объединения одинаковых одновременных запросов
+'''
+import asyncio
+
+import pytest
+
+from app.services.mcp_rag.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    '''Тесты SingleFlight'''
+
+    @pytest.mark.asyncio
+    async def test_identical_calls_share_one_execution(self):
+        '''Тест что одинаковые вызовы выполняются один раз'''
+        flight = SingleFlight()
+        executions = 0
+
+        async def work():
+            nonlocal executions
+            executions += 1
+            await asyncio.sleep(0.01)
+            return 'result'
+
+        results = await asyncio.gather(
+            *(flight.do('key', work) for _ in range(5))
+        )
+
+        assert results == ['result'] * 5
+        assert executions == 1
+        assert flight.coalesced == 4
+        assert flight.inflight == 0
+
+    @pytest.mark.asyncio
+    async def test_different_keys_run_separately(self):
+        '''Тест что разные ключи не объединяются'''
+        flight = SingleFlight()
+
+        async def work(value):
+            await asyncio.sleep(0)
+            return value
+
+        results = await asyncio.gather(
+            flight.do('a', lambda: work('a')),
+            flight.do('b', lambda: work('b')),
+        )
+
+        assert results == ['a', 'b']
+        assert flight.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_error_shared_by_all_waiters(self):
+        '''Тест что исключение получают все ожидающие'''
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError('upstream down')
+
+        results = await asyncio.gather(
+            flight.do('key', failing),
+            flight.do('key', failing),
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flight.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_call(self):
+        '''Тест что отмена одного ожидающего не отменяет общий вызов'''
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return 'result'
+
+        first = asyncio.create_task(flight.do('key', work))
+        second = asyncio.create_task(flight.do('key', work))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == 'result'
@@ -0,0 +1,150 @@
+'''
+Тесты транспортов MCP: SSE и streamable HTTP
+'''
+import pytest
+
+from app.core.config import normalize_mcp_transport
+from app.services.agent.mcp_client import McpClient
+from app.services.mcp_rag import server
+from app.services.mcp_rag.transport_benchmark import measure_transport
+from tests.conftest import serve
+
+
+class TestTransports:
+    '''Тесты выбора транспорта на сервере и в клиенте'''
+
+    @pytest.mark.parametrize('transport, path', [
+        ('sse', '/sse'),
+        ('streamable-http', '/mcp'),
+    ])
+    def test_create_app_uses_transport(self, transport, path):
+        '''Тест что приложение публикует эндпоинт выбранного транспорта'''
+        app = server.create_app(transport)
+
+        paths = {getattr(route, 'path', None) for route in app.routes}
+
+        assert path in paths
+        assert '/metrics' in paths
+
+    def test_unknown_transport_rejected(self):
+        '''Тест что неизвестный транспорт отклоняется на обеих сторонах'''
+        with pytest.raises(ValueError, match='ws'):
+            McpClient('http://localhost/mcp', transport='ws')
+        with pytest.raises(ValueError, match='ws'):
+            server.create_app('ws')
+
+    @pytest.mark.parametrize('transport, expected', [
+        ('SSE', 'sse'),
+        ('streamable_http', 'streamable-http'),
+        (' http ', 'streamable-http'),
+    ])
+    def test_transport_names_normalized(self, transport, expected):
+        '''Тест что сервер и клиент принимают одинаковые названия'''
+        app = server.create_app(transport)
+
+        paths = {getattr(route, 'path', None) for route in app.routes}
+
+        assert normalize_mcp_transport(transport) == expected
+        assert server.transport_path(transport) in paths
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('transport', ['sse', 'streamable-http'])
+    async def test_client_calls_tool(self, fake_rag, transport):
+        '''Тест вызова инструмента через каждый транспорт'''
+        fake_rag()
+        url, uvicorn_server, task = await serve(transport)
+        try:
+            async with McpClient(url, transport=transport) as client:
+                tools = await client.list_tools()
+                text = await client.call_tool_text(
+                    'request_to_rag', {'query': 'Гарантия Мотрекс'}
+                )
+        finally:
+            uvicorn_server.should_exit = True
+            await task
+
+        assert 'request_to_rag' in tools
+        assert text.startswith('Context:')
+
+    @pytest.mark.asyncio
+    async def test_client_calls_batch_tool(self, fake_rag):
+        '''Тест что пакетный ответ не выдается за список документов'''
+        fake_rag()
+        url, uvicorn_server, task = await serve('streamable-http')
+        try:
+            async with McpClient(url, transport='streamable-http') as client:
+                text = await client.call_tool_text(
+                    'request_to_rag_batch',
+                    {'queries': ['Гарантия Мотрекс', 'Доставка']},
+                )
+        finally:
+            uvicorn_server.should_exit = True
+            await task
+
+        assert not text.startswith('Context:')
+        assert 'Гарантия Мотрекс' in text
+        assert 'Доставка' in text
+        assert '"result"' in text
+
+    @pytest.mark.asyncio
+    async def test_client_reads_full_documents(self, fake_rag):
+        '''Тест структурированного ответа и чтения полного текста'''
+        fake_rag()
+        url, uvicorn_server, task = await serve('streamable-http')
+        try:
+            async with McpClient(url, transport='streamable-http') as client:
+                documents = await client.call_tool_documents(
+                    'request_to_rag', {'query': 'Гарантия Мотрекс'}
+                )
+                body = await client.read_document(documents[0]['id'])
+        finally:
+            uvicorn_server.should_exit = True
+            await task
+
+        assert set(documents[0]) == {'id', 'score', 'content', 'metadata'}
+        assert body.startswith(documents[0]['content'].rstrip('…'))
+
+    @pytest.mark.asyncio
+    async def test_measure_transport(self, fake_rag):
+        '''Тест замеров установки сессии и вызовов'''
+        fake_rag()
+        url, uvicorn_server, task = await serve('streamable-http')
+        try:
+            result = await measure_transport(
+                url=url,
+                transport='streamable-http',
+                tool='request_to_rag',
+                sessions=3,
+                calls_per_session=2,
+                concurrency=2,
+                queries=['Гарантия', 'Поддержка'],
+            )
+        finally:
+            uvicorn_server.should_exit = True
+            await task
+
+        assert result.errors == 0
+        assert len(result.setup) == 3
+        assert len(result.calls) == 6
+
+    @pytest.mark.asyncio
+    async def test_measure_transport_counts_tool_errors(self, fake_rag):
+        '''Тест что ошибка инструмента считается ошибкой, а не вызовом'''
+        fake_rag()
+        url, uvicorn_server, task = await serve('streamable-http')
+        try:
+            result = await measure_transport(
+                url=url,
+                transport='streamable-http',
+                tool='missing_tool',
+                sessions=2,
+                calls_per_session=1,
+                concurrency=2,
+                queries=['Гарантия'],
+            )
+        finally:
+            uvicorn_server.should_exit = True
+            await task
+
+        assert result.errors == 2
+        assert result.calls == []